@@ -1,93 +1,118 @@
 import streamlit as st
-import openai
 import os
-from qdrant_client import QdrantClient
-from qdrant_client.http import models as qdrant_models
-import uuid
 import datetime
-
-# Set your OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")  # or st.secrets["OPENAI_API_KEY"]
-
-# Initialize Qdrant client
-QDRANT_URL = "https://67bd4e7c-9e18-4183-8655-cb368b598d90.europe-west3-0.gcp.cloud.qdrant.io"
-QDRANT_API_KEY = st.secrets["QDRANT_API_KEY"]
-
-qdrant_client = QdrantClient(
-    url=QDRANT_URL,
-    api_key=QDRANT_API_KEY,
-    prefer_grpc=False
-)
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for shared modules
+from answer_cache import get_answer_cache
+from chunking import PASSAGE_FANOUT, merge_passage_hits
+from dedup import get_dedup_report, store_entry
+from embedding_cache import get_embedding_cache
+from qdrant_schema import timestamp_payload, user_filter
+from rerank import get_rerank_config, rerank_points
+from resilience import ResilienceError, whole_seconds
+from resources import get_resources
+from time_filters import parse_time_range
+
+# OpenAI + Qdrant clients and the schema warm-up are shared process-wide (see resources.py),
+# so reruns don't reconnect or re-check the collection. OPENAI_API_KEY comes from the environment.
+resources = get_resources()
+resources.refresh()  # follows the collection alias after a migration (background check, at most every 30 s)
+client = resources.openai
+qdrant_client = resources.qdrant
+resilience = resources.resilience  # timeouts, retries with jitter, circuit breakers, hedged search
 
 # Collection name in Qdrant
-COLLECTION_NAME = "journal_entries"
+COLLECTION_NAME = resources.collection_name
 
 
 # 1. Create (or ensure) a Qdrant collection for journal entries
 def init_qdrant_collection():
-    # Vector size depends on the embedding model.
-    # e.g. text-embedding-ada-002 returns 1536-dimensional vectors.
-    vector_size = 1536
-
-    try:
-        qdrant_client.get_collection(COLLECTION_NAME)
-        st.write("Collection already exists.")
-    except:
-        qdrant_client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=qdrant_models.VectorParams(size=vector_size, distance="Cosine")
-        )
-        st.write("Created a new collection in Qdrant.")
+    # Collection (1536-dim cosine) + user_id index are created once per process.
+    if not resources.warm_up():
+        st.error(f"Could not prepare the Qdrant collection: {resources.error}")
 
 # 2. Function to embed text using OpenAI
+EMBEDDING_MODEL = resources.embedding_model  # whatever the live collection was built with (migration.py)
+STORAGE = resources.storage  # embedding size + quantized search (storage_modes.py)
+CACHE_MODEL = STORAGE.cache_model(EMBEDDING_MODEL)
+RERANK = get_rerank_config()  # over-fetch + MMR (RERANK_CANDIDATES / RERANK_LAMBDA / RERANK_HALF_LIFE_DAYS)
+embedding_cache = get_embedding_cache()
+
+
+def _embed_remote(text):
+    # batched with the other sessions' embeds into one request (embedding_batcher.py)
+    return resources.embed_batcher.embed(text, EMBEDDING_MODEL, **STORAGE.embedding_kwargs(EMBEDDING_MODEL))
+
+
 def embed_text(text):
-    response = openai.Embedding.create(
-        input=text,
-        model="text-embedding-3-small"  # or whichever embedding model you prefer
-    )
-    embedding = response["data"][0]["embedding"]
-    return embedding
+    # same cache as streamlit_app.py, so stored entries are never embedded twice
+    return embedding_cache.get_or_embed(CACHE_MODEL, text, _embed_remote)
 
-# 3. Store a journal entry in Qdrant
-def store_journal_entry(user_id, text):
-    embedding = embed_text(text)
 
-    # upsert into Qdrant
-    qdrant_client.upsert(
-        collection_name=COLLECTION_NAME,
-        points=[
-            qdrant_models.PointStruct(
-                id=str(uuid.uuid4()),
-                vector=embedding,
-                payload={
-                    "user_id": user_id,
-                    "text": text,
-                    "timestamp": str(datetime.datetime.now())
-                }
-            )
-        ]
+def _embed_many_remote(texts):
+    return resources.embed_batcher.embed_many(texts, EMBEDDING_MODEL, **STORAGE.embedding_kwargs(EMBEDDING_MODEL))
+
+# 3. Store a journal entry in Qdrant
+def store_journal_entry(user_id, text, entry_id=None):
+    # one point per overlapping passage, all pointing back to the same entry_id.
+    # The ID comes from (user_id, text), so saving the same text twice is a no-op
+    # (no embedding call, no upsert); pass entry_id to edit an entry in place (see dedup.py).
+    entry_id, outcome = store_entry(
+        qdrant_client, COLLECTION_NAME, user_id, text,
+        embed_passages=lambda passages: embedding_cache.get_or_embed_many(CACHE_MODEL, passages, _embed_many_remote),
+        payload={
+            "user_id": user_id,
+            **timestamp_payload(str(datetime.datetime.now()))  # + numeric `ts` for time filters
+        },
+        entry_id=entry_id,
     )
+    if outcome != "duplicate":
+        resources.dual_writer.mirror(COLLECTION_NAME, [entry_id])  # no-op unless a migration is running
+        if resources.replicas is not None:
+            resources.replicas.get(user_id).invalidate()  # next search sees the new entry
+        get_answer_cache().invalidate_user(user_id)  # cached answers may be outdated now
+    return entry_id, outcome
 
 # 4. Retrieve top-k relevant entries from Qdrant
+def search_passages(user_id, query_embedding, limit, time_range=None):
+    if resources.replicas is not None:
+        # local replica mode: brute-force search on a synced copy of this user's points
+        replica = resources.replicas.get(user_id)
+        replica.maybe_sync()
+        return replica.search(query_embedding, limit, time_range=time_range, with_vectors=RERANK.enabled)
+    # search, filtered by user_id so each user only sees their own data (and by date, if asked)
+    # (idempotent, so a slow search gets a hedged second attempt - see resilience.py)
+    return resilience.call("search", lambda timeout: qdrant_client.query_points(
+        collection_name=COLLECTION_NAME,
+        query=query_embedding,
+        query_filter=user_filter(user_id, time_range),
+        limit=limit,
+        search_params=STORAGE.search_params(),
+        with_vectors=RERANK.enabled,
+        timeout=whole_seconds(timeout),
+    )).points
+
+
 def retrieve_relevant_entries(user_id, query_text, top_k=3):
     # embed the query
     query_embedding = embed_text(query_text)
-
-    # search
-    search_result = qdrant_client.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=query_embedding,
-        limit=top_k,
-        # optionally filter by user_id so each user only sees their own data
-        # You can do:
-        # filter=qdrant_models.Filter(
-        #     must=[qdrant_models.FieldCondition(key="user_id", match=qdrant_models.MatchValue(value=user_id))]
-        # )
-    )
-
-    # extract the text fields from the payloads
+    # "förra månaden", "last week", "i maj"... -> only search entries from that period
+    time_range = parse_time_range(query_text)
+
+    # search passages, more than top_k so enough distinct entries are left after merging;
+    # with re-ranking on, RERANK.candidates entries (with vectors) for MMR to choose from
+    limit = RERANK.fetch_limit(top_k, PASSAGE_FANOUT)
+    search_result = search_passages(user_id, query_embedding, limit, time_range)
+    if time_range is not None and not search_result:
+        # nothing in that period (or the phrase wasn't meant as a date): search everything
+        search_result = search_passages(user_id, query_embedding, limit)
+
+    # merge passages back into entries; "text" only holds the passages that matched
     top_entries = []
-    for hit in search_result:
+    entries = merge_passage_hits(search_result, limit // PASSAGE_FANOUT)
+    # diverse top_k: near-identical days don't all make it into the prompt (rerank.py)
+    for hit in rerank_points(entries, query_embedding, top_k, RERANK):
         text_content = hit.payload["text"]
         top_entries.append(text_content)
 
@@ -107,16 +132,17 @@ def get_gpt_response(question, relevant_texts):
     )
 
     # Use GPT-3.5 or GPT-4 (depending on your access)
-    response = openai.ChatCompletion.create(
+    response = resilience.call("chat", lambda timeout: client.chat.completions.create(
         model="gpt-3.5-turbo",  # or gpt-4 if you have access
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": question},
         ],
-        temperature=0.7
-    )
+        temperature=0.7,
+        timeout=timeout
+    ))
 
-    answer = response["choices"][0]["message"]["content"]
+    answer = response.choices[0].message.content
     return answer
 
 # 6. Main Streamlit UI
@@ -148,12 +174,31 @@ def main():
 
     st.subheader("Add a New Journal Entry")
     new_entry_text = st.text_area("What's on your mind today?")
-    if st.button("Save Entry"):
+    editing = st.session_state.get("last_entry_id")
+    save_col, update_col = st.columns(2)
+    save = save_col.button("Save Entry")
+    # the text area keeps the last saved text, so fixing a typo and updating replaces that entry
+    update = update_col.button("Update Last Entry", disabled=editing is None)
+    if save or update:
         if new_entry_text.strip():
-            store_journal_entry(st.session_state.user_id, new_entry_text)
-            st.success("Entry saved!")
+            try:
+                entry_id, outcome = store_journal_entry(
+                    st.session_state.user_id, new_entry_text, entry_id=editing if update else None
+                )
+            except ResilienceError as exc:
+                st.error(f"Could not save right now ({exc}). Your text is still here - try again shortly.")
+            else:
+                st.session_state.last_entry_id = entry_id
+                if outcome == "duplicate":
+                    st.info("Already saved - nothing changed.")
+                elif outcome == "updated":
+                    st.success("Entry updated!")
+                else:
+                    st.success("Entry saved!")
         else:
             st.warning("Please write something before saving.")
+    with st.expander("🧹 Dedup report"):
+        st.write(get_dedup_report().summary())
 
     st.divider()  # just a horizontal line
 
@@ -161,12 +206,17 @@ def main():
     user_question = st.text_input("Ask a question about your journal entries")
     if st.button("Get Answer"):
         if user_question.strip():
-            # 1) Retrieve top relevant entries
-            relevant = retrieve_relevant_entries(st.session_state.user_id, user_question, top_k=5)
-            # 2) Get GPT’s response
-            answer = get_gpt_response(user_question, relevant)
-            st.write("**Answer from GPT:**")
-            st.write(answer)
+            try:
+                # 1) Retrieve top relevant entries
+                relevant = retrieve_relevant_entries(st.session_state.user_id, user_question, top_k=5)
+                # 2) Get GPT’s response
+                answer = get_gpt_response(user_question, relevant)
+            except ResilienceError as exc:
+                # timeouts/retries/breaker gave up (resilience.py): a message instead of a stack trace
+                st.error(f"The journal service isn't answering right now ({exc}). Please try again shortly.")
+            else:
+                st.write("**Answer from GPT:**")
+                st.write(answer)
         else:
             st.warning("Please ask a question.")
 
@@ -0,0 +1,303 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# 🚦 Admission control for LLM calls
+# One controller per process, shared by every session:
+#   - a token bucket per user (requests/minute with a burst) - over it, you're told to wait
+#   - a token bucket per model, so one model's upstream quota isn't overrun
+#   - a cap on concurrent streaming completions
+#   - a bounded queue in front of the cap, served round-robin across users so one
+#     busy session can't starve the others; callers see their position while waiting
+#   - upstream 429s pause the model (Retry-After, else exponential backoff) instead
+#     of every session hammering the API at once
+# Calls run in the caller's thread; the controller only decides when.
+
+DEFAULT_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT_STREAMS", 8))
+DEFAULT_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 32))
+DEFAULT_QUEUE_TIMEOUT = 60.0
+DEFAULT_TIERS = {  # requests per minute, burst
+    "basic": (4.0, 8),
+    "advanced": (30.0, 30),
+}
+DEFAULT_MODEL_LIMIT = (500.0, 50)  # requests per minute, burst - per model unless in model_limits
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+POLL_SECONDS = 0.25  # waiters re-check buckets/backoff this often
+
+
+class AdmissionRejected(Exception):
+    """ The call was not admitted; `retry_after` is a hint in seconds. """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UserRateLimited(AdmissionRejected):
+    pass
+
+
+class QueueFull(AdmissionRejected):
+    pass
+
+
+class QueueTimeout(AdmissionRejected):
+    pass
+
+
+def is_rate_limit_error(exc) -> bool:
+    """ openai.RateLimitError and anything else carrying HTTP 429. """
+    return getattr(exc, "status_code", None) == 429
+
+
+def retry_after_seconds(exc):
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount=1.0) -> bool:
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def wait_time(self, amount=1.0) -> float:
+        """ Seconds until `amount` tokens are available. """
+        self._refill()
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate else float("inf")
+
+
+class Ticket:
+    def __init__(self, user_id, model, number, enqueued):
+        self.user_id = user_id
+        self.model = model
+        self.number = number
+        self.enqueued = enqueued
+        self.granted = False
+        self.position = None
+        self.wait_s = 0.0
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, max_queue=DEFAULT_MAX_QUEUE, tiers=None,
+                 model_limits=None, queue_timeout=DEFAULT_QUEUE_TIMEOUT, clock=time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.tiers = dict(tiers or DEFAULT_TIERS)
+        self.model_limits = dict(model_limits or {})
+        self.queue_timeout = queue_timeout
+        self.clock = clock
+        self.active = 0
+        self.stats = {"admitted": 0, "queued": 0, "rejected_user": 0, "rejected_full": 0,
+                      "timed_out": 0, "upstream_429": 0, "max_wait_s": 0.0}
+        self._users = {}  # (tier, user_id) -> TokenBucket
+        self._models = {}  # model -> TokenBucket
+        self._backoff = {}  # model -> (paused_until, consecutive 429s)
+        self._waiting = OrderedDict()  # user_id -> deque[Ticket], insertion order = rotation order
+        self._numbers = itertools.count()
+        self._cond = threading.Condition()
+
+    # -- buckets and backoff -------------------------------------------------
+
+    def _user_bucket(self, user_id, tier):
+        key = (tier, user_id)
+        if key not in self._users:
+            self._users[key] = TokenBucket(*self.tiers[tier], clock=self.clock)
+        return self._users[key]
+
+    def _model_bucket(self, model):
+        if model not in self._models:
+            self._models[model] = TokenBucket(*self.model_limits.get(model, DEFAULT_MODEL_LIMIT), clock=self.clock)
+        return self._models[model]
+
+    def _paused(self, model):
+        paused_until, _ = self._backoff.get(model, (0.0, 0))
+        return paused_until > self.clock()
+
+    def report_rate_limited(self, model, retry_after=None):
+        """ Upstream said 429: pause admissions for `model` (Retry-After, else 1, 2, 4... s up to 30). """
+        with self._cond:
+            _, strikes = self._backoff.get(model, (0.0, 0))
+            delay = retry_after if retry_after is not None else min(BACKOFF_MAX, BACKOFF_BASE * 2 ** strikes)
+            self._backoff[model] = (self.clock() + delay, strikes + 1)
+            self.stats["upstream_429"] += 1
+
+    def report_success(self, model):
+        with self._cond:
+            if model in self._backoff:
+                paused_until, _ = self._backoff[model]
+                self._backoff[model] = (paused_until, 0)
+
+    # -- fair queue ----------------------------------------------------------
+
+    def _queued(self):
+        return sum(len(tickets) for tickets in self._waiting.values())
+
+    def _dispatch(self):
+        """ Grants free slots round-robin over users, skipping models that are paused or out of tokens. """
+        while self.active < self.max_concurrent and self._waiting:
+            for user_id, tickets in self._waiting.items():
+                ticket = tickets[0]
+                if not self._paused(ticket.model) and self._model_bucket(ticket.model).try_take():
+                    break
+            else:
+                return  # nobody admissible right now
+            tickets.popleft()
+            if tickets:
+                self._waiting.move_to_end(user_id)  # served user goes to the back of the rotation
+            else:
+                del self._waiting[user_id]
+            ticket.granted = True
+            self.active += 1
+            self._cond.notify_all()
+
+    def _position(self, ticket):
+        """ 1-based place in line, following the round-robin order. """
+        tickets = self._waiting.get(ticket.user_id)
+        if not tickets or ticket not in tickets:
+            return 0
+        depth = tickets.index(ticket)
+        ahead, earlier = depth, True
+        for user_id, others in self._waiting.items():
+            if user_id == ticket.user_id:
+                earlier = False
+                continue
+            # users earlier in the rotation get one more turn before ours comes round
+            ahead += min(len(others), depth + (1 if earlier else 0))
+        return ahead + 1
+
+    def _remove(self, ticket):
+        tickets = self._waiting.get(ticket.user_id)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._waiting[ticket.user_id]
+
+    def _acquire(self, user_id, model, tier, on_wait, timeout, charge_user=True):
+        with self._cond:
+            # a full queue turns the call away before it costs the user a token
+            if self._queued() >= self.max_queue:
+                self.stats["rejected_full"] += 1
+                raise QueueFull("Too many requests waiting", retry_after=POLL_SECONDS * 4)
+            bucket = self._user_bucket(user_id, tier)
+            if charge_user and not bucket.try_take():
+                self.stats["rejected_user"] += 1
+                raise UserRateLimited("Too many requests for this user", retry_after=bucket.wait_time())
+            ticket = Ticket(user_id, model, next(self._numbers), self.clock())
+            self._waiting.setdefault(user_id, deque()).append(ticket)
+            self._dispatch()
+            if not ticket.granted:
+                self.stats["queued"] += 1
+
+        deadline = ticket.enqueued + (timeout if timeout is not None else self.queue_timeout)
+        while True:
+            with self._cond:
+                self._dispatch()
+                if ticket.granted:
+                    break
+                if self.clock() >= deadline:
+                    self._remove(ticket)
+                    self.stats["timed_out"] += 1
+                    raise QueueTimeout("Waited too long for a free slot", retry_after=POLL_SECONDS * 4)
+                self._cond.wait(POLL_SECONDS)
+                if ticket.granted:
+                    break
+                ticket.position = self._position(ticket)
+            if on_wait is not None:
+                on_wait(ticket.position, self.clock() - ticket.enqueued)
+
+        ticket.wait_s = self.clock() - ticket.enqueued
+        with self._cond:
+            self.stats["admitted"] += 1
+            self.stats["max_wait_s"] = round(max(self.stats["max_wait_s"], ticket.wait_s), 3)
+        return ticket
+
+    def _release(self):
+        with self._cond:
+            self.active -= 1
+            self._dispatch()
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, user_id, model, tier="basic", on_wait=None, timeout=None, charge_user=True):
+        """
+        Holds one completion slot for the duration of the block (stream inside it).
+        Raises an AdmissionRejected subclass when not admitted. `on_wait(position,
+        waited_s)` is called from the caller's thread while queued. A 429 raised
+        inside the block pauses the model before it propagates. `charge_user=False`
+        skips the user's bucket (a retry of a call that was already charged).
+        """
+        ticket = self._acquire(user_id, model, tier, on_wait, timeout, charge_user)
+        try:
+            yield ticket
+        except Exception as exc:
+            if is_rate_limit_error(exc):
+                self.report_rate_limited(model, retry_after_seconds(exc))
+            raise
+        else:
+            self.report_success(model)
+        finally:
+            self._release()
+
+    def call(self, user_id, model, fn, tier="basic", on_wait=None, retries=2, charge_user=True):
+        """
+        Runs fn() under admit(), retrying upstream 429s (each retry queues behind
+        the backoff). Only the first attempt takes a token from the user's bucket,
+        none with `charge_user=False` (calls the user didn't ask for).
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self.admit(user_id, model, tier=tier, on_wait=on_wait,
+                                charge_user=charge_user and attempt == 0):
+                    return fn()
+            except Exception as exc:
+                if not is_rate_limit_error(exc) or attempt == retries:
+                    raise
+
+    def summary(self) -> dict:
+        with self._cond:
+            now = self.clock()
+            return {
+                **self.stats,
+                "active": self.active,
+                "max_concurrent": self.max_concurrent,
+                "waiting": self._queued(),
+                "paused_models": {model: round(until - now, 1) for model, (until, _) in self._backoff.items()
+                                  if until > now},
+            }
+
+
+_default_controller = None
+_default_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """ Process-wide controller, shared by every session of the app. """
+    global _default_controller
+    with _default_lock:
+        if _default_controller is None:
+            _default_controller = AdmissionController()
+        return _default_controller
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+from qdrant_schema import CONTENT_HASH_FIELD, TIMESTAMP_FIELD
+
+# 💬 Semantic answer cache
+# "hur mådde jag förra veckan?" and "hur mådde jag i förra veckan" embed almost
+# identically and retrieve the same entries, so the second one can replay the
+# first answer instead of paying for another completion.
+# A hit needs BOTH: the same set of retrieved entries, each at the same content
+# version, and a query embedding with cosine similarity >= threshold. The
+# version (the entry's `content_hash`) is part of the key, so an entry edited
+# in place - same ID, new text - misses, even when the edit came from another
+# process. Entries expire after `ttl_seconds` and all of a user's answers are
+# dropped when that user stores something new in this process.
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_MAX_PER_USER = 200
+
+
+class CachedAnswer:
+    __slots__ = ("query", "vector", "entries", "answer", "created_at", "hits")
+
+    def __init__(self, query, vector, entries, answer):
+        self.query = query
+        self.vector = vector
+        self.entries = entries
+        self.answer = answer
+        self.created_at = time.time()
+        self.hits = 0
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def entry_versions(points) -> frozenset:
+    """ {"<entry id>@<content version>"} for retrieved points; an edit keeps the ID but not the version. """
+    versions = set()
+    for point in points:
+        payload = point.payload or {}
+        version = payload.get(CONTENT_HASH_FIELD) or payload.get(TIMESTAMP_FIELD) or payload.get("timestamp", "")
+        versions.add(f"{point.id}@{version}")
+    return frozenset(versions)
+
+
+class AnswerCache:
+    """ Per-user, in-process, thread-safe. """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, ttl_seconds=DEFAULT_TTL_SECONDS, max_per_user=DEFAULT_MAX_PER_USER):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_per_user = max_per_user
+        self._answers = defaultdict(lambda: deque(maxlen=max_per_user))
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "invalidations": 0}
+
+    def lookup(self, user_id, query_vector, entries):
+        """ Best matching fresh answer for (query, retrieved entries), or None. `entries`: see entry_versions. """
+        key = frozenset(entries)
+        query = _unit(query_vector)
+        now = time.time()
+        with self._lock:
+            answers = self._answers.get(user_id)
+            best, best_score = None, self.threshold
+            if answers:
+                fresh = [a for a in answers if now - a.created_at < self.ttl_seconds]
+                self.stats["expired"] += len(answers) - len(fresh)
+                if len(fresh) != len(answers):
+                    answers.clear()
+                    answers.extend(fresh)
+                candidates = [a for a in fresh if a.entries == key]
+                if candidates:
+                    scores = np.stack([a.vector for a in candidates]) @ query
+                    i = int(np.argmax(scores))
+                    if scores[i] >= best_score:
+                        best, best_score = candidates[i], float(scores[i])
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            best.hits += 1
+            self.stats["hits"] += 1
+            return best
+
+    def store(self, user_id, query, query_vector, entries, answer):
+        entry = CachedAnswer(query, _unit(query_vector), frozenset(entries), answer)
+        with self._lock:
+            self._answers[user_id].append(entry)
+            self.stats["stores"] += 1
+
+    def invalidate_user(self, user_id):
+        """ New journal entries change what the right answer is. """
+        with self._lock:
+            if self._answers.pop(user_id, None):
+                self.stats["invalidations"] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "cached_answers": sum(len(a) for a in self._answers.values()),
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """ Process-wide answer cache, shared by all sessions. """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = AnswerCache()
+        return _default_cache
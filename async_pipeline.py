@@ -0,0 +1,218 @@
+import asyncio
+import queue
+import re
+import threading
+
+from openai import NOT_GIVEN
+
+from chunking import PASSAGE_FANOUT, merge_passage_hits
+from qdrant_schema import user_filter
+from rerank import rerank_points
+from resilience import whole_seconds
+from telemetry import StageTimer
+
+# ⚡ Async query pipeline
+# The search path used to be: embed -> query_points -> build prompt -> open chat
+# stream, one blocking call after the other. Here it runs on AsyncOpenAI +
+# AsyncQdrantClient in one long-lived event loop (async HTTP pools are tied to
+# their loop, so the loop lives as long as the process, in its own thread):
+#   - all retrieval probes are embedded in ONE batched request
+#   - the probes are searched concurrently
+#   - if the embeddings didn't use the async OpenAI client (cache hit, or sent
+#     by the shared batcher), a cheap request warms its connection pool while
+#     search runs, so the chat stream doesn't pay for TCP + TLS on the critical path
+# Streamlit must draw from the script thread, so tokens are handed back
+# through a queue (`EventLoopThread.iterate`).
+
+MAX_PROBES = 4
+_PROBE_SPLIT = re.compile(r"[?!;\n]+|\.\s+")
+
+
+def split_probes(question: str) -> list[str]:
+    """
+    The question itself, plus its sub-questions when it clearly has several
+    ("Hur mådde jag i maj? Och vad gjorde jag på midsommar?").
+    """
+    parts = [part.strip() for part in _PROBE_SPLIT.split(question) if len(part.split()) >= 3]
+    if len(parts) < 2:
+        return [question]
+    return [question] + parts[:MAX_PROBES - 1]
+
+
+class EventLoopThread:
+    """ A process-wide asyncio loop on a daemon thread. """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="async-pipeline", daemon=True)
+        self.thread.start()
+
+    def run(self, coro, timeout=None):
+        """ Runs `coro` on the loop and blocks the caller until it's done. """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def iterate(self, agen):
+        """ Sync generator over an async generator running on the loop. """
+        items = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put(item)
+            except BaseException as e:  # surface errors in the caller's thread
+                items.put(e)
+            finally:
+                items.put(done)
+
+        asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class AsyncJournalPipeline:
+    def __init__(self, openai_client, qdrant_client, collection_name, embedding_model, chat_model,
+                 embedding_cache=None, replicas=None, storage=None, rerank=None, batcher=None, resilience=None):
+        self.openai = openai_client  # AsyncOpenAI
+        self.qdrant = qdrant_client  # AsyncQdrantClient
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self.chat_model = chat_model
+        self.embedding_cache = embedding_cache
+        self.replicas = replicas
+        self.storage = storage  # StorageConfig: embedding dimensions + quantized search params
+        self.rerank = rerank  # RerankConfig: over-fetch + MMR, see rerank.py (None = plain top_k)
+        self.batcher = batcher  # EmbeddingBatcher shared with other sessions (None = own request)
+        self.resilience = resilience  # timeouts, retries, hedging per call, see resilience.py (None = bare calls)
+        self._background = set()  # keeps fire-and-forget tasks alive
+
+    async def _call(self, name, fn):
+        """ `fn(timeout)` under the named resilience policy; without one, once with the client's own timeout. """
+        if self.resilience is not None:
+            return await self.resilience.acall(name, fn)
+        return await fn(NOT_GIVEN)
+
+    async def embed(self, texts, timer):
+        """ Cache first; everything that missed goes out in one batched request. Returns (vectors, used_network). """
+        with timer.span("embed", texts=len(texts)):
+            cache_model = self.storage.cache_model(self.embedding_model) if self.storage else self.embedding_model
+            vectors = [self.embedding_cache.get(cache_model, t) if self.embedding_cache else None
+                       for t in texts]
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            if missing:
+                fresh = await self._embed_remote([texts[i] for i in missing], timer)
+                for i, vector in zip(missing, fresh):
+                    vectors[i] = vector
+                    if self.embedding_cache:
+                        self.embedding_cache.put(cache_model, texts[i], vector)
+            return vectors, bool(missing)
+
+    async def _embed_remote(self, texts, timer):
+        """ Through the shared batcher if there is one (other sessions' texts ride along), else one request. """
+        options = self.storage.embedding_kwargs(self.embedding_model) if self.storage else {}
+        if self.batcher is not None:
+            futures = [self.batcher.submit(text, self.embedding_model, **options) for text in texts]
+            timer.count("embedding_batched", len(texts))
+            return await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+        response = await self._call("embeddings", lambda timeout: self.openai.embeddings.create(
+            input=texts, model=self.embedding_model, timeout=timeout, **options
+        ))
+        if getattr(response, "usage", None) is not None:
+            timer.count("embedding_tokens", response.usage.prompt_tokens)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def _search_one(self, user_id, vector, top_k, timer, probe, time_range=None):
+        with_vectors = self.rerank is not None and self.rerank.enabled
+        with timer.span("query_points", probe=probe):
+            if self.replicas is not None:
+                replica = self.replicas.get(user_id)
+                await asyncio.to_thread(replica.maybe_sync)  # first sync blocks on network
+                return replica.search(vector, top_k, time_range=time_range, with_vectors=with_vectors)
+            response = await self._call("search", lambda timeout: self.qdrant.query_points(
+                collection_name=self.collection_name,
+                query=vector,
+                query_filter=user_filter(user_id, time_range),
+                limit=top_k,
+                search_params=self.storage.search_params() if self.storage else None,
+                with_payload=True,
+                with_vectors=with_vectors,
+                timeout=whole_seconds(timeout),
+            ))  # idempotent: a slow search gets hedged
+            return response.points
+
+    async def _warm_chat_connection(self, timer):
+        with timer.span("warm_chat_connection"):
+            try:
+                await self.openai.models.retrieve(self.chat_model)
+            except Exception:
+                pass  # best effort, the chat call will connect on its own
+
+    async def retrieve(self, user_id, question, top_k=5, timer=None, time_range=None):
+        """
+        Returns (points, query_vector, timer). Passage hits from all probes are
+        merged back into entries (best score wins), see chunking.py.
+        `time_range` restricts every probe to entries from that period; if that
+        finds nothing (a misread time phrase, an empty month) the search is run
+        again over the whole journal and counted as "time_filter_fallbacks".
+        With re-ranking on, more candidates are fetched (with vectors) and a
+        diverse top_k is picked by MMR.
+        """
+        timer = timer or StageTimer()
+        probes = split_probes(question)
+        vectors, used_network = await self.embed(probes, timer)
+
+        if not used_network or self.batcher is not None:
+            # The async client's pool is still cold if the embeds came from cache or went
+            # through the batcher (which has its own sync client), so warm it for the chat.
+            # Not awaited: it only has to be underway, never on the critical path.
+            warm = asyncio.ensure_future(self._warm_chat_connection(timer))
+            self._background.add(warm)
+            warm.add_done_callback(self._background.discard)
+        rerank = self.rerank if self.rerank is not None and self.rerank.enabled else None
+        limit = rerank.fetch_limit(top_k, PASSAGE_FANOUT) if rerank else top_k * PASSAGE_FANOUT
+        results = await asyncio.gather(*[
+            self._search_one(user_id, vector, limit, timer, probe, time_range)
+            for probe, vector in enumerate(vectors)
+        ])
+        if time_range is not None and not any(results):
+            timer.count("time_filter_fallbacks")
+            results = await asyncio.gather(*[
+                self._search_one(user_id, vector, limit, timer, probe)
+                for probe, vector in enumerate(vectors)
+            ])
+        with timer.span("merge", probes=len(probes)):
+            points = merge_passage_hits([point for points in results for point in points],
+                                        limit // PASSAGE_FANOUT)
+        if rerank:
+            with timer.span("rerank", candidates=len(points)):
+                timer.count("rerank_candidates", len(points))
+                points = rerank_points(points, vectors[0], top_k, rerank)
+        return points[:top_k], vectors[0], timer
+
+    async def stream_answer(self, messages, timer):
+        """
+        Async generator of answer tokens; marks first/last token on the timer and
+        counts prompt/completion tokens (from the final usage chunk).
+        """
+        with timer.span("chat_stream"):
+            # retried until the stream opens; once tokens flow it's the user's answer, no retries
+            stream = await self._call("chat", lambda timeout: self.openai.chat.completions.create(
+                model=self.chat_model, messages=messages, stream=True,
+                stream_options={"include_usage": True}, timeout=timeout,
+            ))
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    timer.count("prompt_tokens", chunk.usage.prompt_tokens)
+                    timer.count("completion_tokens", chunk.usage.completion_tokens)
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content or ""
+                if token:
+                    timer.mark("first_token")
+                    yield token
+            timer.mark("last_token")
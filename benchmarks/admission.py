@@ -0,0 +1,108 @@
+"""
+🚦 Admission control load test
+
+Open-loop overload against the fake OpenAI server, which allows only
+--upstream-limit concurrent streams and answers 429 (Retry-After: 1) above it.
+Runs the same arrival schedule twice:
+  - direct:     every request goes straight to the API (openai client retries on its own)
+  - controlled: every request goes through admission.AdmissionController
+
+    python -m benchmarks.admission --users 20 --rps 12 --seconds 20
+
+Reports latency percentiles of the requests that got an answer, plus how many
+failed upstream and how many were turned away early by the controller.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from openai import OpenAI
+
+from admission import AdmissionController, AdmissionRejected
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.stats import summarize
+
+MODEL = "gpt-4o-mini"
+
+
+def _schedule(users, rps, seconds, seed=3):
+    """ Poisson arrivals: list of (offset_s, user_id). """
+    rng = random.Random(seed)
+    arrivals, t = [], 0.0
+    while True:
+        t += rng.expovariate(rps)
+        if t >= seconds:
+            return arrivals
+        arrivals.append((t, f"user-{rng.randrange(users)}"))
+
+
+def _ask(client):
+    stream = client.chat.completions.create(
+        model=MODEL, messages=[{"role": "user", "content": "Hej!"}], stream=True
+    )
+    return "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+
+
+def run(client, arrivals, controller=None):
+    latencies, outcomes, lock = [], {"ok": 0, "upstream_error": 0, "rejected": 0}, threading.Lock()
+
+    def request(user_id):
+        started = time.perf_counter()
+        try:
+            if controller is None:
+                _ask(client)
+            else:
+                controller.call(user_id, MODEL, lambda: _ask(client), tier="advanced")
+            outcome = "ok"
+        except AdmissionRejected:
+            outcome = "rejected"
+        except Exception:
+            outcome = "upstream_error"
+        with lock:
+            outcomes[outcome] += 1
+            if outcome == "ok":
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    threads, started = [], time.perf_counter()
+    for offset, user_id in arrivals:
+        time.sleep(max(0.0, offset - (time.perf_counter() - started)))
+        thread = threading.Thread(target=request, args=(user_id,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return {**outcomes, **summarize(latencies, time.perf_counter() - started)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rps", type=float, default=12.0, help="Offered load, requests per second")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--upstream-limit", type=int, default=4, help="Concurrent streams before the fake 429s")
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--max-queue", type=int, default=8)
+    parser.add_argument("--model-rpm", type=float, default=6000.0)
+    parser.add_argument("--queue-timeout", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    arrivals = _schedule(args.users, args.rps, args.seconds)
+    config = FakeOpenAIConfig(ttft_ms=args.ttft_ms, tokens_per_s=args.tokens_per_s,
+                              max_concurrent_chats=args.upstream_limit)
+    print(f"# {len(arrivals)} requests over {args.seconds}s, upstream allows {args.upstream_limit} streams")
+    with FakeOpenAIServer(config) as server:
+        client = OpenAI(base_url=server.base_url, api_key="fake")
+        print("direct     ", json.dumps(run(client, arrivals)))
+        controller = AdmissionController(max_concurrent=args.upstream_limit, max_queue=args.max_queue,
+                                         queue_timeout=args.queue_timeout,
+                                         model_limits={MODEL: (args.model_rpm, args.upstream_limit * 2)})
+        print("controlled ", json.dumps(run(client, arrivals, controller)))
+        print("controller ", json.dumps(controller.summary()))
+        print("upstream   ", json.dumps(config.requests))
+
+
+if __name__ == "__main__":
+    main()
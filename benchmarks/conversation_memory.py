@@ -0,0 +1,73 @@
+"""
+🧠 Conversation memory benchmark: prompt tokens and latency per turn
+
+Plays a long chat against the fake OpenAI server twice: once sending the whole
+history every turn (what old_app.py used to do), once through
+ConversationMemory. Prints prompt tokens and chat latency at a few turn counts.
+
+    python -m benchmarks.conversation_memory --turns 200
+"""
+import argparse
+import json
+import time
+
+from openai import OpenAI
+
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.stats import summarize
+from context_packer import count_tokens
+from conversation_memory import ConversationMemory, make_openai_summarizer
+
+SYSTEM = {"role": "system", "content": "Du är en chattrobot som älskar fotboll."}
+
+
+def _prompt_tokens(messages):
+    return sum(count_tokens(m["content"]) + 4 for m in messages)
+
+
+def play(client, turns, use_memory, report_every):
+    memory = ConversationMemory(make_openai_summarizer(client, "benchmark"))
+    history = [SYSTEM]
+    rows, latencies = [], []
+    for turn in range(1, turns + 1):
+        question = f"Fråga {turn}: vad tycker du om matchen igår och hur gick det för laget i serien?"
+        memory.add("user", question)
+        history.append({"role": "user", "content": question})
+        messages = memory.context(SYSTEM) if use_memory else history
+
+        started = time.perf_counter()
+        stream = client.chat.completions.create(model="gpt-4o-mini", messages=messages, stream=True)
+        answer = "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        memory.add("assistant", answer)
+        history.append({"role": "assistant", "content": answer})
+        if use_memory:
+            memory.maybe_summarize()
+        if turn % report_every == 0:
+            rows.append({"turn": turn, "prompt_tokens": _prompt_tokens(messages),
+                         "chat_ms": round(latencies[-1], 1)})
+    memory.wait()
+    return rows, summarize(latencies, sum(latencies) / 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--report-every", type=int, default=25)
+    args = parser.parse_args(argv)
+
+    # Fast fake model, so the numbers are dominated by what we send, not by sleeping.
+    config = FakeOpenAIConfig(embed_latency_ms=0, ttft_ms=5, tokens_per_s=0)
+    with FakeOpenAIServer(config) as server:
+        client = OpenAI(base_url=server.base_url, api_key="fake")
+        for label, use_memory in (("full history", False), ("memory", True)):
+            rows, stats = play(client, args.turns, use_memory, args.report_every)
+            print(f"# {label}: {json.dumps(stats)}")
+            for row in rows:
+                print(json.dumps(row))
+        print(f"# fake server requests: {json.dumps(config.requests)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+📮 Embedding micro-batching throughput
+
+Many concurrent "sessions" (threads) each embed one new question at a time,
+against the fake OpenAI server (fixed latency per request, however many inputs).
+Runs the same load
+  - direct:  one embeddings request per text, like every session used to
+  - batched: through embedding_batcher.EmbeddingBatcher, for each --wait-ms
+and reports embeds/s, per-embed latency, HTTP requests sent, and the batcher's
+batch sizes and added queueing delay.
+
+    python -m benchmarks.embed_batching --sessions 32 --seconds 10
+    python -m benchmarks.embed_batching --embed-latency-ms 80 --wait-ms 0 2 5 10 --max-batch 128
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+
+from openai import OpenAI
+
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.stats import summarize
+from embedding_batcher import EmbeddingBatcher, openai_embed_many
+
+MODEL = "text-embedding-3-small"
+
+
+def _direct(client):
+    def embed(text):
+        return client.embeddings.create(input=text, model=MODEL).data[0].embedding
+    return embed
+
+
+def run(embed, sessions, seconds, think_ms):
+    """ Closed loop: each session embeds, "thinks" for think_ms, repeats. Returns (latencies_ms, elapsed_s). """
+    latencies, lock, stop = [], threading.Lock(), threading.Event()
+    numbers = itertools.count()
+
+    def session(number):
+        while not stop.is_set():
+            text = f"Hur mådde jag vecka {next(numbers)}? (session {number})"  # unique: no cache, no coalescing
+            started = time.perf_counter()
+            embed(text)
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(think_ms / 1000)
+
+    threads = [threading.Thread(target=session, args=(i,), daemon=True) for i in range(sessions)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--think-ms", type=float, default=5.0, help="Pause between a session's embeds")
+    parser.add_argument("--embed-latency-ms", type=float, default=40.0)
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[0.0, 2.0, 5.0, 10.0])
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    config = FakeOpenAIConfig(embed_latency_ms=args.embed_latency_ms)
+    with FakeOpenAIServer(config) as server:
+        client = OpenAI(base_url=server.base_url, api_key="fake", max_retries=0)
+        client.embeddings.create(input="warm-up", model=MODEL)
+
+        settings = [("direct", None)] + [(f"batched wait={wait}ms", wait) for wait in args.wait_ms]
+        for label, wait_ms in settings:
+            before = dict(config.requests)
+            batcher = None
+            if wait_ms is None:
+                embed = _direct(client)
+            else:
+                batcher = EmbeddingBatcher(openai_embed_many(client), max_batch_size=args.max_batch,
+                                           max_wait_ms=wait_ms, max_in_flight=args.max_in_flight)
+                embed = lambda text: batcher.embed(text, MODEL)  # noqa: E731
+            latencies, elapsed = run(embed, args.sessions, args.seconds, args.think_ms)
+            requests = config.requests["embeddings"] - before["embeddings"]
+            result = {
+                "setting": label,
+                "embeds_per_s": round(len(latencies) / elapsed, 1),
+                "http_requests_per_s": round(requests / elapsed, 1),
+                "inputs_per_request": round((config.requests["embedding_inputs"] - before["embedding_inputs"])
+                                            / max(requests, 1), 2),
+                **{key: value for key, value in summarize(latencies).items() if key.endswith("_ms")},
+            }
+            if batcher is not None:
+                batcher.close()
+                summary = batcher.summary()
+                result.update(batch_size=summary["batch_size"], queue_delay_ms=summary["queue_delay_ms"],
+                              size_flushes=summary["size_flushes"], deadline_flushes=summary["deadline_flushes"])
+            print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+🧪 Fake OpenAI server
+
+A local stand-in for the parts of the OpenAI API this repo uses:
+  POST /v1/embeddings         deterministic unit vectors (seeded by a hash of the text)
+  POST /v1/chat/completions   canned Swedish answer, streamed or not
+  GET  /v1/models/<id>        so connection warm-ups have something to hit
+  POST /v1/images/generations a URL on this server, GET /images/<id>.png serves the PNG
+
+Latency and token rate are configurable, so runs are repeatable and cost nothing.
+Embeddings can also inject faults: a share of 503s and of very slow answers.
+
+    python -m benchmarks.fake_openai --port 8765 --ttft-ms 300 --tokens-per-s 60
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake streamlit run streamlit_app.py
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from storage_modes import NATIVE_DIMENSIONS
+
+DEFAULT_ANSWER = (
+    "Inlägg: Du skrev om en lång vecka på jobbet, en promenad i regnet och en kväll med vänner. "
+    "Reflektion: Det låter som att du hittade lugn i de små stunderna, även när veckan var tung. "
+    "Kanske är det värt att planera in fler sådana pauser framöver."
+)
+
+
+class FakeOpenAIConfig:
+    def __init__(self, embed_latency_ms=40.0, ttft_ms=300.0, tokens_per_s=60.0, answer=DEFAULT_ANSWER,
+                 dimensions=1536, max_concurrent_chats=0, image_latency_ms=2000.0, image_size=1024,
+                 embed_error_rate=0.0, embed_slow_rate=0.0, embed_slow_ms=1000.0, seed=0):
+        self.embed_latency_ms = embed_latency_ms
+        self.ttft_ms = ttft_ms
+        self.tokens_per_s = tokens_per_s
+        self.answer = answer
+        self.dimensions = dimensions
+        self.max_concurrent_chats = max_concurrent_chats  # above this: 429 with Retry-After (0 = no limit)
+        self.active_chats = 0
+        self.image_latency_ms = image_latency_ms
+        self.image_size = image_size
+        self.embed_error_rate = embed_error_rate  # share of embeddings requests answered with a 503
+        self.embed_slow_rate = embed_slow_rate  # share that takes embed_slow_ms instead (the tail)
+        self.embed_slow_ms = embed_slow_ms
+        self.rng = random.Random(seed)
+        self.requests = {"embeddings": 0, "embedding_inputs": 0, "chat": 0, "rate_limited": 0,
+                         "images": 0, "image_downloads": 0, "embedding_errors": 0, "embedding_slow": 0}
+        self.lock = threading.Lock()
+
+
+def fake_embedding(text, dimensions):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_png(seed, size):
+    """ A noisy (so it doesn't compress to nothing) size x size PNG, deterministic per seed. """
+    import io
+
+    from PIL import Image
+
+    rng = np.random.default_rng(int.from_bytes(hashlib.sha256(seed.encode("utf-8")).digest()[:8], "little"))
+    small = rng.integers(0, 255, (size // 8, size // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((size, size), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _tokens(text):
+    # word-ish pieces, roughly what a tokenizer streams
+    pieces, current = [], ""
+    for char in text:
+        current += char
+        if char == " ":
+            pieces.append(current)
+            current = ""
+    return pieces + ([current] if current else [])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are separate writes; no 40 ms delayed-ACK stalls
+    config = None  # set per server
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith("/images/") and self.path.endswith(".png"):
+            with self.config.lock:
+                self.config.requests["image_downloads"] += 1
+            data = fake_png(self.path, self.config.image_size)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if self.path.startswith("/v1/models/"):
+            model = self.path.rsplit("/", 1)[-1]
+            return self._json(200, {"id": model, "object": "model", "created": 0, "owned_by": "fake"})
+        self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/v1/embeddings":
+            return self._embeddings(body)
+        if self.path == "/v1/chat/completions":
+            return self._chat(body)
+        if self.path == "/v1/images/generations":
+            return self._image(body)
+        self._json(404, {"error": {"message": "not found"}})
+
+    def _embeddings(self, body):
+        config = self.config
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        with config.lock:
+            config.requests["embeddings"] += 1
+            config.requests["embedding_inputs"] += len(inputs)
+            fault = config.rng.random()
+            failed = fault < config.embed_error_rate
+            slow = not failed and fault < config.embed_error_rate + config.embed_slow_rate
+            config.requests["embedding_errors"] += failed
+            config.requests["embedding_slow"] += slow
+        if failed:
+            return self._json(503, {"error": {"message": "The server is overloaded", "type": "server_error"}})
+        time.sleep((config.embed_slow_ms if slow else config.embed_latency_ms) / 1000)
+        # like the real API: the model's native size unless `dimensions` asks for less
+        dimensions = body.get("dimensions") or NATIVE_DIMENSIONS.get(body.get("model"), config.dimensions)
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(str(text), dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(str(text).split()) for text in inputs)
+        self._json(200, {"object": "list", "data": data, "model": body.get("model"),
+                         "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _image(self, body):
+        config = self.config
+        with config.lock:
+            config.requests["images"] += 1
+            number = config.requests["images"]
+        time.sleep(config.image_latency_ms / 1000)
+        host, port = self.server.server_address[:2]
+        image_id = hashlib.sha256(f"{body.get('prompt')}:{number}".encode("utf-8")).hexdigest()[:16]
+        self._json(200, {"created": int(time.time()), "data": [
+            {"url": f"http://{host}:{port}/images/{image_id}.png", "revised_prompt": body.get("prompt")}
+        ]})
+
+    def _chat(self, body):
+        config = self.config
+        with config.lock:
+            if config.max_concurrent_chats and config.active_chats >= config.max_concurrent_chats:
+                config.requests["rate_limited"] += 1
+                limited = True
+            else:
+                config.requests["chat"] += 1
+                config.active_chats += 1
+                limited = False
+        if limited:
+            return self._json(429, {"error": {"message": "Rate limit reached", "code": "rate_limit_exceeded"}},
+                              headers={"Retry-After": "1"})
+        try:
+            self._chat_response(body)
+        finally:
+            with config.lock:
+                config.active_chats -= 1
+
+    def _chat_response(self, body):
+        config = self.config
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        pieces = _tokens(config.answer)
+        time.sleep(config.ttft_ms / 1000)
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model")}
+
+        if not body.get("stream"):
+            if config.tokens_per_s:
+                time.sleep(len(pieces) / config.tokens_per_s)  # the whole answer is generated first
+            return self._json(200, {
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": config.answer}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                          "total_tokens": prompt_tokens + len(pieces)},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunk = {**base, "object": "chat.completion.chunk"}
+        delay = 1.0 / config.tokens_per_s if config.tokens_per_s else 0.0
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(delay)
+            delta = {"content": piece, **({"role": "assistant"} if i == 0 else {})}
+            self._event({**chunk, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        self._event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._event({**chunk, "choices": [], "usage": {
+                "prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                "total_tokens": prompt_tokens + len(pieces)}})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _event(self, payload):
+        self.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+
+class FakeOpenAIServer:
+    """ Runs the fake API on a background thread: `with FakeOpenAIServer(config) as server: server.base_url`. """
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or FakeOpenAIConfig()
+        handler = type("Handler", (_Handler,), {"config": self.config})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = lambda request, client_address: None  # clients hanging up mid-stream
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embed-latency-ms", type=float, default=40.0)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-s", type=float, default=60.0)
+    parser.add_argument("--max-concurrent-chats", type=int, default=0, help="429 above this many streams")
+    parser.add_argument("--image-latency-ms", type=float, default=2000.0)
+    args = parser.parse_args(argv)
+    config = FakeOpenAIConfig(args.embed_latency_ms, args.ttft_ms, args.tokens_per_s,
+                              max_concurrent_chats=args.max_concurrent_chats, image_latency_ms=args.image_latency_ms)
+    server = FakeOpenAIServer(config, port=args.port)
+    print(f"🧪 Fake OpenAI on {server.base_url}")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+🔁 Re-embedding migration drill: in-memory Qdrant, fake embedder, live writes
+
+Seeds a journal behind the `journal` alias, then migrates it to a new vector
+size while a writer thread keeps saving and editing entries the way the app
+does (store_entry + DualWriter). The first run is killed halfway and resumed
+from its checkpoint. Afterwards it checks that the alias points to the new
+collection and that both collections hold exactly the same points and payloads,
+and prints the migration's throughput report. A second, small migration goes
+through the real openai client and the fake server to text-embedding-3-large
+shortened to 1536 dims (its native size is 3072).
+
+    python -m benchmarks.migration --entries 2000 --batch-size 64
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import numpy as np
+from openai import OpenAI
+from qdrant_client import QdrantClient
+
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from dedup import DedupReport, store_entry
+from embedding_cache import EmbeddingCache
+from migration import DualWriter, Migration, make_embedder
+from qdrant_schema import (
+    INITIAL_COLLECTION, JOURNAL_ALIAS, ensure_alias, ensure_collection, ensure_payload_indexes, resolve_alias,
+)
+from storage_modes import StorageConfig, collection_metadata, from_collection_metadata
+
+WORDS = "idag regn sol jobb träning kaffe möte trött glad familj vänner bok film promenad middag".split()
+
+
+class Crash(Exception):
+    pass
+
+
+class SerializedQdrant:
+    """ The local in-memory client isn't thread-safe (a server is); one call at a time. """
+
+    def __init__(self, qdrant_client):
+        self._client = qdrant_client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return method(*args, **kwargs)
+        return call
+
+
+def fake_embedder(dimensions, latency_ms=0.0, fail_after=None):
+    """ Deterministic vectors from a hash of the text; optionally raises after `fail_after` calls. """
+    calls = {"n": 0}
+
+    def embed_many(texts):
+        calls["n"] += 1
+        if fail_after is not None and calls["n"] > fail_after:
+            raise Crash(f"embedder died after {fail_after} batches")
+        time.sleep(latency_ms / 1000)
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vectors.append(np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32).tolist())
+        return vectors
+    return embed_many
+
+
+def random_entry(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40))).capitalize() + "."
+
+
+def writer(qdrant_client, live, dual_writer, stop, written, old_embed):
+    """ The app during the migration: new entries and an edit now and then, each mirrored. """
+    rng = random.Random(1)
+    while not stop.is_set():
+        entry_id = written[-1] if written and rng.random() < 0.2 else None  # sometimes edit the last one
+        entry_id, outcome = store_entry(qdrant_client, live, "user", random_entry(rng), old_embed,
+                                        payload={"user_id": "user"}, entry_id=entry_id, report=DedupReport())
+        dual_writer.mirror(live, [entry_id])
+        if outcome == "stored":
+            written.append(entry_id)
+        time.sleep(0.005)
+
+
+def payloads(qdrant_client, collection):
+    records, offset, result = [], None, {}
+    while True:
+        records, offset = qdrant_client.scroll(collection, limit=1000, offset=offset, with_payload=True)
+        result.update({str(record.id): record.payload for record in records})
+        if offset is None:
+            return result
+
+
+def seed(qdrant_client, entries, storage, rng):
+    """ `entries` random entries behind the journal alias; returns the live collection. """
+    ensure_collection(qdrant_client, INITIAL_COLLECTION, storage, metadata=collection_metadata("old-model", storage))
+    ensure_payload_indexes(qdrant_client, INITIAL_COLLECTION)
+    ensure_alias(qdrant_client, JOURNAL_ALIAS, INITIAL_COLLECTION)
+    live = resolve_alias(qdrant_client, JOURNAL_ALIAS)
+    embed = fake_embedder(storage.dimensions)
+    for _ in range(entries):
+        store_entry(qdrant_client, live, "user", random_entry(rng), embed, payload={"user_id": "user"},
+                    report=DedupReport())
+    return live
+
+
+def native_size_migration(entries=50):
+    """ text-embedding-3-large at 1536 dims: `dimensions` must be sent even though 1536 is the small model's size. """
+    storage = StorageConfig("full", 1536)
+    with FakeOpenAIServer(FakeOpenAIConfig(embed_latency_ms=0)) as server:
+        openai_client = OpenAI(base_url=server.base_url, api_key="fake", max_retries=0)
+        qdrant_client = QdrantClient(":memory:")
+        live = seed(qdrant_client, entries, StorageConfig("full", 256), random.Random(2))
+        cache = EmbeddingCache(path=os.path.join(tempfile.mkdtemp(), "embeddings.sqlite"))
+        embed_many = make_embedder(openai_client, "text-embedding-3-large", storage, embedding_cache=cache)
+        report = Migration(qdrant_client, embed_many, embedding_model="text-embedding-3-large", storage=storage,
+                           batches_per_minute=60000).run()
+        vector = qdrant_client.scroll(report["target"], limit=1, with_vectors=True)[0][0].vector
+        return qdrant_client.count(report["target"]).count == qdrant_client.count(live).count and len(vector) == 1536
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--old-dimensions", type=int, default=256)
+    parser.add_argument("--new-dimensions", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--batches-per-minute", type=float, default=6000)
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    qdrant_client = SerializedQdrant(QdrantClient(":memory:"))
+    old_storage, new_storage = StorageConfig("full", args.old_dimensions), StorageConfig("full", args.new_dimensions)
+    live = seed(qdrant_client, args.entries, old_storage, random.Random(0))
+    old_embed = fake_embedder(args.old_dimensions)
+    print(f"# seeded {qdrant_client.count(live).count} points in {live}")
+
+    dual_writer = DualWriter(qdrant_client, lambda model, storage: fake_embedder(storage.dimensions),
+                             check_seconds=0.05)
+    stop, written = threading.Event(), []
+    thread = threading.Thread(target=writer, args=(qdrant_client, live, dual_writer, stop, written, old_embed))
+    thread.start()
+
+    checkpoint = os.path.join(tempfile.mkdtemp(), "migration.json")
+    options = dict(embedding_model="new-model", storage=new_storage, batch_size=args.batch_size,
+                   batches_per_minute=args.batches_per_minute, checkpoint_path=checkpoint)
+    half = max(1, args.entries // args.batch_size // 2)
+    try:
+        Migration(qdrant_client, fake_embedder(args.new_dimensions, args.embed_latency_ms, fail_after=half),
+                  **options).run()
+    except Crash as exc:
+        with open(checkpoint) as file:
+            print(f"# crashed ({exc}), checkpoint: {file.read()}")
+
+    samples = []
+    migration = Migration(qdrant_client, fake_embedder(args.new_dimensions, args.embed_latency_ms),
+                          progress=lambda report: samples.append(report), **options)
+    migration.prepare()
+    migration.copy()
+    stop.set()  # stop writing before the final catch-up so the comparison below is exact
+    thread.join()
+    migration.catch_up()
+    migration.swap()
+    report = migration.report()
+
+    for sample in samples[::max(1, len(samples) // 5)]:
+        print(json.dumps({key: sample[key] for key in ("copied", "total", "points_per_s", "eta_s")}))
+    print(f"# report: {json.dumps(report)}")
+    print(f"# dual writes: {json.dumps(dual_writer.summary())}, new entries during migration: {len(written)}")
+
+    target = resolve_alias(qdrant_client, JOURNAL_ALIAS)
+    source_payloads, target_payloads = payloads(qdrant_client, live), payloads(qdrant_client, target)
+    model, storage = from_collection_metadata(qdrant_client.get_collection(JOURNAL_ALIAS).config.metadata)
+    vector = qdrant_client.scroll(target, limit=1, with_vectors=True)[0][0].vector
+    checks = {
+        "alias_swapped": target == report["target"] != live,
+        "same_points": source_payloads.keys() == target_payloads.keys(),
+        "same_payloads": source_payloads == target_payloads,
+        "new_vector_size": len(vector) == args.new_dimensions == storage.dimensions,
+        "model_recorded": model == "new-model",
+        "wrote_during_migration": len(written) > 0,
+        "large_model_at_1536": native_size_migration(),
+    }
+    print(f"# checks: {json.dumps(checks)}")
+    if not all(checks.values()):
+        raise SystemExit("migration drill failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+📰 News page build benchmark (cold cache)
+
+Builds the same news set against the fake OpenAI server two ways:
+  - serial:   article + image per story, one call after the other, images for every
+              story (what streamlitNews.py used to do)
+  - parallel: every call at once on a bounded thread pool, images only for top
+              stories (the non-streaming build the page used before build_news)
+  - progressive: news_engine.build_news (streamed articles, pieces committed to a draft);
+              also reports time to the first visible text
+
+    python -m benchmarks.news --runs 3 --ttft-ms 800 --tokens-per-s 80 --image-latency-ms 4000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from openai import OpenAI
+
+import news_engine
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.stats import summarize
+from news_cache import NewsDraft
+from resilience import get_resilience
+
+
+def generate_article(client, prompt):
+    """ One article as a single (non-streamed) completion. """
+    response = get_resilience().call("chat", lambda timeout: client.chat.completions.create(
+        model=news_engine.CHAT_MODEL,
+        messages=[
+            {"role": "system", "content": news_engine.SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        timeout=timeout,
+    ))
+    return response.choices[0].message.content if response.choices else news_engine.ARTICLE_ERROR
+
+
+def generate_image(client, prompt):
+    """ news_engine.draw_image, or None if it failed. """
+    try:
+        return news_engine.draw_image(client, prompt)
+    except Exception:
+        return None
+
+
+def build_serial(client, prompts):
+    """ The old code path, kept here as the baseline. """
+    articles = [(generate_article(client, p), generate_image(client, p)) for p in prompts]
+    return articles[:news_engine.TOP_STORIES], [article for article, _ in articles[news_engine.TOP_STORIES:]]
+
+
+def build_parallel(client, prompts, max_workers=news_engine.MAX_PARALLEL_CALLS, top_stories=news_engine.TOP_STORIES):
+    """ All calls in flight at once (at most `max_workers`), images only for the top stories. """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="news") as pool:
+        # Images first: they're the slowest calls, so they should never wait behind text.
+        images = [pool.submit(generate_image, client, prompt) for prompt in prompts[:top_stories]]
+        articles = [pool.submit(generate_article, client, prompt) for prompt in prompts]
+        top_articles = [[articles[i].result(), images[i].result()] for i in range(len(images))]
+        other_articles = [future.result() for future in articles[top_stories:]]
+    return top_articles, other_articles
+
+
+def build_progressive(client, prompts):
+    """ Returns ms until the first article text would be on screen. """
+    first_content = []
+    with tempfile.TemporaryDirectory() as tmp:
+        draft = NewsDraft(os.path.join(tmp, "news.draft"), timedelta(hours=1))
+        started = time.perf_counter()
+
+        def on_event(event, _):
+            if event[0] in ("text", "article") and not first_content:
+                first_content.append((time.perf_counter() - started) * 1000)
+
+        news_engine.build_news(client, draft, on_event=on_event, prompts=prompts)
+    return first_content[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--articles", type=int, default=5)
+    parser.add_argument("--ttft-ms", type=float, default=800.0)
+    parser.add_argument("--tokens-per-s", type=float, default=80.0)
+    parser.add_argument("--image-latency-ms", type=float, default=4000.0)
+    args = parser.parse_args(argv)
+
+    config = FakeOpenAIConfig(ttft_ms=args.ttft_ms, tokens_per_s=args.tokens_per_s,
+                              image_latency_ms=args.image_latency_ms)
+    prompts = news_engine.PROMPTS[:args.articles]
+    with FakeOpenAIServer(config) as server:
+        client = OpenAI(base_url=server.base_url, api_key="fake")
+        first_text = []
+        for label, build in (("serial", lambda: build_serial(client, prompts)),
+                             ("parallel", lambda: build_parallel(client, prompts)),
+                             ("progressive", lambda: first_text.append(build_progressive(client, prompts)))):
+            before = dict(config.requests)
+            latencies = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                build()
+                latencies.append((time.perf_counter() - started) * 1000)
+            calls = {key: config.requests[key] - before[key] for key in ("chat", "images")}
+            print(f"{label:11s}", json.dumps({**summarize(latencies, sum(latencies) / 1000), "calls": calls}))
+        print("first text ", json.dumps(summarize(first_text, sum(first_text) / 1000)))
+
+
+if __name__ == "__main__":
+    main()
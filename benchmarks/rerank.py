@@ -0,0 +1,156 @@
+"""
+🎛️ MMR re-ranking: extra latency vs. redundant prompt tokens
+
+Builds a synthetic journal of routine days - a few topics, each with dozens of
+near-identical entries - in Qdrant local mode, then answers the same queries
+with plain top_k and with over-fetch + MMR at several candidate counts and λ.
+For each setting it prints the search latency (query + merge + re-rank), the
+size of the search response as JSON (re-ranking needs the vectors, plain top_k
+doesn't; against a real server with --url the latency includes that transfer), the
+prompt tokens of the top_k before and after pack_context, how many of those
+tokens repeat a topic already in the context, the mean pairwise cosine
+similarity of the picks and how many distinct topics they cover.
+
+    python -m benchmarks.rerank --entries 3000 --top-k 5
+    python -m benchmarks.rerank --url http://localhost:6333 --dim 1536 --candidates 20 50 100 --lambdas 0.5 0.7
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from benchmarks.stats import summarize
+from chunking import PASSAGE_FANOUT, merge_passage_hits
+from context_packer import count_tokens, pack_context
+from rerank import RerankConfig, rerank_points
+
+COLLECTION_NAME = "bench_rerank"
+TOPICS = {
+    "jobb": "Jobbade hela dagen med {x}. Långa möten, mycket mejl och en kaffe för mycket. Kom hem trött men nöjd.",
+    "träning": "Sprang {x} kilometer i spåret efter jobbet. Benen var tunga men pulsen kändes bra. Stretchade ordentligt.",
+    "familj": "Middag hos mamma med {x}. Vi pratade om semestern och skrattade åt gamla foton. Mysig kväll.",
+    "sömn": "Sov dåligt igen, vaknade {x} gånger. Tankarna snurrade kring jobbet. Måste lägga undan mobilen tidigare.",
+    "vänner": "Fika med {x} på stan. Hon berättade om flytten och nya jobbet. Behövde verkligen den pratstunden.",
+    "hobby": "Målade i {x} timmar på akvarellen med sjön. Färgerna blev bättre än förra gången. Lugn söndag.",
+}
+FILLERS = ["Anna", "Erik", "projektet", "budgeten", "3", "5", "7", "två", "fyra", "kollegorna", "Sara", "pappa"]
+
+
+def _load(qdrant_client, entries, dim, spread, rng):
+    if qdrant_client.collection_exists(COLLECTION_NAME):
+        qdrant_client.delete_collection(COLLECTION_NAME)
+    qdrant_client.create_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config=qdrant_models.VectorParams(size=dim, distance="Cosine"),
+    )
+    names = list(TOPICS)
+    centroids = rng.standard_normal((len(names), dim)).astype(np.float32)
+    # popular topics dominate, like a journal that is mostly about work
+    weights = np.array([0.4, 0.2, 0.12, 0.12, 0.1, 0.06])
+    topics = rng.choice(len(names), size=entries, p=weights / weights.sum())
+    points = []
+    for i, topic in enumerate(topics):
+        vector = centroids[topic] + rng.standard_normal(dim).astype(np.float32) * spread  # similar days
+        text = TOPICS[names[topic]].format(x=FILLERS[rng.integers(len(FILLERS))])
+        points.append(qdrant_models.PointStruct(
+            id=i, vector=vector.tolist(),
+            payload={"topic": names[topic], "text": text, "ts": 1_700_000_000 + i * 86400},
+        ))
+    for start in range(0, len(points), 1000):
+        qdrant_client.upsert(COLLECTION_NAME, points[start:start + 1000])
+    return centroids
+
+
+def _response_bytes(points, with_vectors):
+    """
+    JSON size of the points as the app would fetch them (plain top_k: no vectors),
+    with vectors written as the server does: float32, shortest repr.
+    """
+    size = 0
+    for point in points:
+        size += len(json.dumps({"id": point.id, "score": point.score, "payload": point.payload}, ensure_ascii=False))
+        if with_vectors and point.vector is not None:
+            size += len(",".join(str(value) for value in np.asarray(point.vector, dtype=np.float32))) + 12
+    return size
+
+
+def _search(qdrant_client, query, top_k, config, fanout):
+    """ (top_k points, fetched points); the limit is what the app asks for, `fanout` passages per entry. """
+    points = qdrant_client.query_points(
+        COLLECTION_NAME, query=query.tolist(),
+        limit=config.fetch_limit(top_k, fanout) if config else top_k * fanout,
+        with_payload=True, with_vectors=True,  # plain top_k too, for the similarity metric
+    ).points
+    merged = merge_passage_hits(points, len(points))
+    return (rerank_points(merged, query, top_k, config) if config else merged[:top_k]), points
+
+
+def _context_stats(question, points):
+    packed = pack_context(question, [{"score": p.score, "header": "📖", "body": p.payload["text"]} for p in points])
+    seen, redundant = set(), 0
+    for point in points:
+        if point.payload["topic"] in seen:
+            redundant += count_tokens(point.payload["text"])
+        seen.add(point.payload["topic"])
+    vectors = np.asarray([point.vector for point in points], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarity = vectors @ vectors.T
+    pairs = similarity[np.triu_indices(len(points), k=1)]
+    return {
+        "tokens": packed.tokens_before, "tokens_packed": packed.tokens_after, "redundant_tokens": redundant,
+        "pairwise_sim": float(pairs.mean()) if len(pairs) else 0.0, "topics": len(seen),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=":memory:", help="Qdrant URL, or :memory: for local mode")
+    parser.add_argument("--entries", type=int, default=3000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--spread", type=float, default=0.7, help="Noise around each topic (lower = more alike)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--fanout", type=int, default=PASSAGE_FANOUT, help="Passages fetched per entry")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[20, 50, 100, 200])
+    parser.add_argument("--lambdas", type=float, nargs="+", default=[0.5, 0.7, 0.9])
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    qdrant_client = QdrantClient(args.url) if args.url == ":memory:" else QdrantClient(url=args.url)
+    centroids = _load(qdrant_client, args.entries, args.dim, args.spread, rng)
+    # "how have I been lately?": touches every topic, work and training a bit more
+    mix = np.array([1.0, 0.9, 0.8, 0.8, 0.7, 0.7], dtype=np.float32)
+    queries = [mix @ centroids + rng.standard_normal(args.dim).astype(np.float32) * 0.5 for _ in range(args.queries)]
+
+    settings = [("plain top_k", None)] + [
+        (f"mmr N={n} λ={lam}", RerankConfig(candidates=n, lambda_=lam)) for n in args.candidates for lam in args.lambdas
+    ]
+    baseline = None
+    for label, config in settings:
+        latencies, rows, sizes = [], [], []
+        for query in queries:
+            started = time.perf_counter()
+            points, fetched = _search(qdrant_client, query, args.top_k, config, args.fanout)
+            latencies.append((time.perf_counter() - started) * 1000)
+            sizes.append(_response_bytes(fetched, with_vectors=config is not None))
+            rows.append(_context_stats("Hur har jag mått på sistone?", points))
+        result = {
+            "setting": label,
+            **{key: summarize(latencies)[key] for key in ("p50_ms", "p95_ms")},
+            "response_kb": round(float(np.mean(sizes)) / 1024, 1),
+            **{key: round(float(np.mean([row[key] for row in rows])), 2) for key in rows[0]},
+        }
+        if baseline is None:
+            baseline = result
+        else:
+            result["extra_p50_ms"] = round(result["p50_ms"] - baseline["p50_ms"], 3)
+            result["extra_response_kb"] = round(result["response_kb"] - baseline["response_kb"], 1)
+            result["redundant_tokens_saved"] = round(baseline["redundant_tokens"] - result["redundant_tokens"], 2)
+        print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+🛡️ Tail latency under injected faults: bare calls vs. retries vs. retries + hedging
+
+Two fault-injecting local stand-ins, each answering a share of requests with a
+503 and a share very slowly:
+  - embeddings: the fake OpenAI server (real HTTP, real openai client)
+  - search:     in-memory Qdrant behind FlakyQdrant (same faults, injected in-process)
+Every target is called the same way three times:
+  - bare:     as the apps used to (openai client defaults: 2 retries, 10 min timeout)
+  - retries:  resilience.Resilience with the app's policy, hedging off
+  - hedged:   the same policy with hedging on (second attempt after the running p95)
+and the latency percentiles, user-visible errors and extra load are printed,
+with the p99 improvement over bare.
+
+    python -m benchmarks.resilience --calls 1000 --sessions 4
+    python -m benchmarks.resilience --error-rate 0.05 --slow-rate 0.05 --slow-ms 2000
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from openai import OpenAI
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.stats import summarize
+from resilience import DEFAULT_POLICIES, CallPolicy, Resilience, whole_seconds
+
+MODEL = "text-embedding-3-small"
+COLLECTION_NAME = "bench_resilience"
+
+
+class InjectedError(Exception):
+    status_code = 503
+
+
+class InjectedTimeout(TimeoutError):
+    pass
+
+
+class FlakyQdrant:
+    """
+    query_points with injected 503s and slow answers; the local client itself
+    runs one call at a time. Like a server, it gives up at the request's
+    `timeout` (whole seconds) instead of finishing a slow answer.
+    """
+
+    def __init__(self, qdrant_client, latency_ms, error_rate, slow_rate, slow_ms, seed=0):
+        self._client = qdrant_client
+        self.latency_ms, self.error_rate, self.slow_rate, self.slow_ms = latency_ms, error_rate, slow_rate, slow_ms
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._query_lock = threading.Lock()
+
+    def query_points(self, *args, **kwargs):
+        with self._lock:
+            self.requests += 1
+            fault = self._rng.random()
+        if fault < self.error_rate:
+            raise InjectedError("503 Service Unavailable (injected)")
+        slow = fault < self.error_rate + self.slow_rate
+        delay = (self.slow_ms if slow else self.latency_ms) / 1000
+        timeout = kwargs.get("timeout")
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise InjectedTimeout(f"no answer within {timeout} s (injected)")
+        time.sleep(delay)
+        with self._query_lock:
+            return self._client.query_points(*args, **kwargs)
+
+
+def _search_target(args):
+    qdrant_client = QdrantClient(":memory:")
+    qdrant_client.create_collection(COLLECTION_NAME, qdrant_models.VectorParams(size=args.dim, distance="Cosine"))
+    vectors = np.random.default_rng(0).standard_normal((args.points, args.dim)).astype(np.float32)
+    qdrant_client.upsert(COLLECTION_NAME, [
+        qdrant_models.PointStruct(id=i, vector=vector.tolist(), payload={"i": i}) for i, vector in enumerate(vectors)
+    ])
+    return qdrant_client
+
+
+def run(call, calls, sessions):
+    """ `calls` calls spread over `sessions` threads. Returns (latencies_ms of successes, errors). """
+    latencies, errors, lock = [], [], threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            call(i)
+        except Exception as exc:
+            with lock:
+                errors.append(exc.__class__.__name__)
+            return
+        with lock:
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(one, range(calls)))
+    return latencies, errors
+
+
+def _report(target, mode, latencies, errors, calls, requests, resilience=None, bare=None):
+    summary = summarize(latencies)
+    result = {
+        "target": target, "mode": mode,
+        **{key: summary[key] for key in ("p50_ms", "p95_ms", "p99_ms")},
+        "max_ms": round(max(latencies), 1) if latencies else 0.0,
+        "errors": len(errors),
+        "requests_per_call": round(requests / calls, 3),
+    }
+    if resilience is not None:
+        stats = next(iter(resilience.summary().values()))
+        result.update({key: stats[key] for key in ("retries", "timeouts", "hedges", "hedge_wins")})
+    if bare is not None and summary["p99_ms"]:
+        result["p99_vs_bare"] = f"{bare['p99_ms'] / summary['p99_ms']:.1f}x lower"
+    print(json.dumps(result))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent callers")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Normal answer time")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Share of 503 answers")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="Share of slow answers")
+    parser.add_argument("--slow-ms", type=float, default=1500.0)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=256)
+    args = parser.parse_args(argv)
+
+    def policy(name, hedge):
+        base = DEFAULT_POLICIES[name]
+        return CallPolicy(deadline=base.deadline, attempt_timeout=base.attempt_timeout, retries=base.retries,
+                          backoff_base=base.backoff_base, backoff_max=base.backoff_max, hedge=hedge,
+                          hedge_budget=base.hedge_budget)
+
+    # -- embeddings: fake OpenAI server over HTTP ----------------------------
+    config = FakeOpenAIConfig(embed_latency_ms=args.latency_ms, embed_error_rate=args.error_rate,
+                              embed_slow_rate=args.slow_rate, embed_slow_ms=args.slow_ms)
+    with FakeOpenAIServer(config) as server:
+        bare_client = OpenAI(base_url=server.base_url, api_key="fake")  # the default: retries=2, timeout=600 s
+        client = OpenAI(base_url=server.base_url, api_key="fake", max_retries=0)
+
+        def embed(openai_client, i, timeout=None):
+            options = {"timeout": timeout} if timeout is not None else {}
+            return openai_client.embeddings.create(input=f"Hur mår jag idag? #{i}", model=MODEL, **options)
+
+        before = config.requests["embeddings"]
+        latencies, errors = run(lambda i: embed(bare_client, i), args.calls, args.sessions)
+        bare = _report("embeddings", "bare", latencies, errors, args.calls, config.requests["embeddings"] - before)
+        for mode, hedge in (("retries", False), ("hedged", True)):
+            resilience = Resilience(policies={"embeddings": policy("embeddings", hedge)})
+            before = config.requests["embeddings"]
+            latencies, errors = run(
+                lambda i: resilience.call("embeddings", lambda timeout: embed(client, i, timeout)),
+                args.calls, args.sessions,
+            )
+            _report("embeddings", mode, latencies, errors, args.calls, config.requests["embeddings"] - before,
+                    resilience, bare)
+
+    # -- search: in-memory Qdrant behind FlakyQdrant --------------------------
+    flaky = FlakyQdrant(_search_target(args), args.latency_ms, args.error_rate, args.slow_rate, args.slow_ms)
+    queries = np.random.default_rng(1).standard_normal((args.calls, args.dim)).astype(np.float32)
+
+    def search(i, timeout=None):
+        return flaky.query_points(COLLECTION_NAME, query=queries[i].tolist(), limit=10,
+                                  timeout=whole_seconds(timeout))
+
+    before = flaky.requests
+    latencies, errors = run(search, args.calls, args.sessions)
+    bare = _report("search", "bare", latencies, errors, args.calls, flaky.requests - before)
+    for mode, hedge in (("retries", False), ("hedged", True)):
+        resilience = Resilience(policies={"search": policy("search", hedge)})
+        before = flaky.requests
+        latencies, errors = run(lambda i: resilience.call("search", lambda timeout: search(i, timeout)),
+                                args.calls, args.sessions)
+        _report("search", mode, latencies, errors, args.calls, flaky.requests - before, resilience, bare)
+
+
+if __name__ == "__main__":
+    main()
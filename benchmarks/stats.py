@@ -0,0 +1,25 @@
+import math
+import statistics
+
+
+def percentile(sorted_values, q):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies_ms, elapsed_s=None) -> dict:
+    """ p50/p95/p99/mean in ms, plus throughput when the wall time is known. """
+    values = sorted(latencies_ms)
+    summary = {
+        "n": len(values),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "mean_ms": round(statistics.fmean(values), 3) if values else 0.0,
+    }
+    if elapsed_s:
+        summary["ops_per_s"] = round(len(values) / elapsed_s, 2)
+    return summary
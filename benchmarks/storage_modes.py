@@ -0,0 +1,160 @@
+"""
+💾 Storage mode benchmark: recall@k, RAM per point and query latency
+
+Compares the current setup (1536-dim float32) with reduced dimensions and
+scalar/binary quantization (see storage_modes.py). Ground truth is always
+exact cosine top-k on the full 1536-dim vectors.
+
+    python -m benchmarks.storage_modes                          # synthetic corpus, NumPy simulation
+    python -m benchmarks.storage_modes --corpus vectors.npy     # recorded embeddings (N x 1536)
+    python -m benchmarks.storage_modes --url http://localhost:6333   # the real thing, on a Qdrant server
+
+The NumPy simulation quantizes the same way Qdrant does (int8 with a 0.99
+quantile clip, sign bits for binary) and rescores the oversampled candidates
+with the originals. Reduced dimensions are simulated like text-embedding-3's
+`dimensions` parameter: truncate, then re-normalize.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from benchmarks.stats import summarize
+from storage_modes import BINARY_OVERSAMPLING, FULL_DIMENSIONS, SCALAR_OVERSAMPLING, StorageConfig
+
+DEFAULT_CONFIGS = "full:1536,scalar:1536,binary:1536,full:512,scalar:512,binary:512,full:256"
+
+
+def synthetic_corpus(points, rng, topics=50):
+    """
+    Topic clusters with (mildly) more variance in the leading dimensions, which is
+    what makes Matryoshka-style truncation work on real OpenAI embeddings.
+    Only a stand-in: use --corpus with recorded embeddings for numbers you act on.
+    """
+    decay = (1 + np.arange(FULL_DIMENSIONS) / 128) ** -0.5
+    centers = rng.standard_normal((topics, FULL_DIMENSIONS)).astype(np.float32) * decay
+    labels = rng.integers(0, topics, points)
+    corpus = centers[labels] + 0.8 * rng.standard_normal((points, FULL_DIMENSIONS)).astype(np.float32) * decay
+    return corpus.astype(np.float32)
+
+
+def _normalize(matrix):
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+
+def _top_k(scores, k):
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def simulate(config, corpus, queries, k):
+    """ Returns (ids per query, latencies in ms) for one StorageConfig, brute force in NumPy. """
+    docs = _normalize(corpus[:, :config.dimensions])
+    qs = _normalize(queries[:, :config.dimensions])
+
+    if config.mode == "scalar":
+        bound = np.quantile(np.abs(docs), 0.99)
+        scale = bound / 127.0
+        codes = np.clip(np.round(docs / scale), -127, 127).astype(np.int8)
+        candidates = max(k, int(k * SCALAR_OVERSAMPLING))
+    elif config.mode == "binary":
+        codes = np.packbits(docs > 0, axis=1)
+        candidates = max(k, int(k * BINARY_OVERSAMPLING))
+
+    results, latencies = [], []
+    for query in qs:
+        started = time.perf_counter()
+        if config.mode == "full":
+            top = _top_k(docs @ query, k)
+        else:
+            if config.mode == "scalar":
+                approx = codes.astype(np.float32) @ query
+            else:
+                query_bits = np.packbits(query > 0)
+                approx = -np.unpackbits(codes ^ query_bits, axis=1).sum(axis=1).astype(np.float32)
+            shortlist = _top_k(approx, candidates)
+            top = shortlist[_top_k(docs[shortlist] @ query, k)]  # rescore with originals
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(top)
+    return results, latencies
+
+
+def on_qdrant(config, corpus, queries, k, url):
+    """ Same measurement against a real Qdrant server. """
+    qdrant_client = QdrantClient(url=url)
+    name = f"bench_storage_{config.mode}_{config.dimensions}"
+    if qdrant_client.collection_exists(name):
+        qdrant_client.delete_collection(name)
+    qdrant_client.create_collection(
+        collection_name=name,
+        vectors_config=config.vectors_config(),
+        quantization_config=config.quantization_config(),
+    )
+    docs = _normalize(corpus[:, :config.dimensions])
+    for start in range(0, len(docs), 1000):
+        batch = docs[start:start + 1000]
+        qdrant_client.upsert(
+            collection_name=name,
+            points=qdrant_models.Batch(ids=list(range(start, start + len(batch))), vectors=batch.tolist()),
+            wait=True,
+        )
+
+    results, latencies = [], []
+    for query in _normalize(queries[:, :config.dimensions]):
+        started = time.perf_counter()
+        response = qdrant_client.query_points(
+            collection_name=name, query=query.tolist(), limit=k, search_params=config.search_params()
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(np.array([point.id for point in response.points]))
+    qdrant_client.delete_collection(name)
+    return results, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Recorded embeddings, .npy of shape (N, 1536)")
+    parser.add_argument("--points", type=int, default=5000, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="mode:dimensions,...")
+    parser.add_argument("--url", help="Run against this Qdrant server instead of the NumPy simulation")
+    parser.add_argument("--output", help="Write results as JSON here")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(7)
+    corpus = np.load(args.corpus).astype(np.float32) if args.corpus else synthetic_corpus(args.points, rng)
+    # Queries: perturbed corpus points, i.e. "a question close to something I wrote".
+    picks = rng.integers(0, len(corpus), args.queries)
+    queries = corpus[picks] + 0.3 * rng.standard_normal((args.queries, corpus.shape[1])).astype(np.float32) * corpus.std(0)
+
+    exact, _ = simulate(StorageConfig("full", FULL_DIMENSIONS), corpus, queries, args.k)
+    results = []
+    for spec in args.configs.split(","):
+        mode, dimensions = spec.split(":")
+        config = StorageConfig(mode, int(dimensions))
+        if args.url:
+            ids, latencies = on_qdrant(config, corpus, queries, args.k, args.url)
+        else:
+            ids, latencies = simulate(config, corpus, queries, args.k)
+        recall = np.mean([len(set(a.tolist()) & set(b.tolist())) / args.k for a, b in zip(ids, exact)])
+        summary = summarize(latencies)
+        results.append({
+            **config.describe(),
+            f"recall@{args.k}": round(float(recall), 4),
+            "ram_vs_full": round(config.ram_bytes_per_point() / (FULL_DIMENSIONS * 4), 4),
+            **{key: summary[key] for key in ("p50_ms", "p95_ms")},
+        })
+        print(json.dumps(results[-1]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"points": len(corpus), "queries": args.queries, "results": results}, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
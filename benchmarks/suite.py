@@ -0,0 +1,165 @@
+"""
+📊 App benchmark suite (offline)
+
+Times the app's own search path (embed, store, pipeline.retrieve, pipeline.stream_answer)
+against local stand-ins, no keys or network:
+  - OpenAI  -> benchmarks/fake_openai.py (deterministic embeddings, streamed chat)
+  - Qdrant  -> local in-memory mode (QDRANT_URL=":memory:")
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --iterations 200 --ttft-ms 300 --tokens-per-s 60
+    python -m benchmarks.suite --baseline benchmarks/results/<earlier run>.json
+
+Each run is saved to benchmarks/results/ as JSON. With --baseline, p50/p95
+are compared and anything slower than --threshold x the baseline is flagged.
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.stats import summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+USER_ID = "bench-user"
+
+
+def _load_apps():
+    """ Imports streamlit_app.py and JournalAI/app.py (bare mode, no Streamlit server). """
+    import streamlit.logger
+    streamlit.logger.set_log_level(logging.ERROR)  # "missing ScriptRunContext" on every st.* call
+    import streamlit_app
+
+    spec = importlib.util.spec_from_file_location("journal_app", os.path.join(REPO_ROOT, "JournalAI", "app.py"))
+    journal_app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(journal_app)
+    return streamlit_app, journal_app
+
+
+def _time(fn, inputs):
+    latencies = []
+    started = time.perf_counter()
+    for item in inputs:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _text(i):
+    return (f"Dag {i}: Jag vaknade tidigt, tog en promenad och tänkte på jobbet. "
+            f"Det var en lugn dag, nummer {i} i raden, med kaffe och en bok på kvällen.")
+
+
+def run(iterations, config):
+    streamlit_app, journal_app = _load_apps()
+    import streamlit as st
+    from telemetry import StageTimer
+
+    streamlit_app.init_qdrant_collection()
+    questions = [f"Hur mådde jag dag {i}?" for i in range(iterations)]
+    results = {}
+
+    results["embed_text (miss)"] = _time(streamlit_app.embed_text, [f"{q} {uuid.uuid4()}" for q in questions])
+    streamlit_app.embed_text(questions[0])
+    results["embed_text (hit)"] = _time(streamlit_app.embed_text, [questions[0]] * iterations)
+    results["store_journal_entry"] = _time(lambda text: journal_app.store_journal_entry(USER_ID, text),
+                                           [_text(i) for i in range(iterations)])
+
+    # the path main() takes: pipeline.retrieve, then pipeline.stream_answer drawn by render_stream
+    loop, pipeline = streamlit_app.resources.loop, streamlit_app.pipeline
+    results["pipeline.retrieve"] = _time(lambda q: loop.run(pipeline.retrieve(USER_ID, q, top_k=5)), questions)
+    points, _, _ = loop.run(pipeline.retrieve(USER_ID, questions[0], top_k=5))
+    entries = [streamlit_app.format_entry(point) for point in points]
+
+    def answer(question):
+        timer = StageTimer()
+        tokens = loop.iterate(pipeline.stream_answer(streamlit_app.build_messages(question, entries), timer))
+        return streamlit_app.render_stream(tokens, st.container(), timer)
+
+    stream_runs = max(1, iterations // 10)  # each run takes ttft + answer/token rate
+    results["pipeline.stream_answer"] = _time(answer, questions[:stream_runs])
+    results["_fake_openai_requests"] = dict(config.requests)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """ Returns a list of "name: metric x.xx" lines for everything slower than threshold x baseline. """
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if not isinstance(stats, dict) or not isinstance(before, dict) or "p50_ms" not in stats:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if before.get(metric) and stats[metric] > before[metric] * threshold:
+                regressions.append(f"{name}: {metric} {before[metric]} -> {stats[metric]} "
+                                   f"(x{stats[metric] / before[metric]:.2f})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--embed-latency-ms", type=float, default=40.0)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-s", type=float, default=60.0)
+    parser.add_argument("--baseline", help="Earlier result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Flag metrics slower than this x baseline")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    config = FakeOpenAIConfig(args.embed_latency_ms, args.ttft_ms, args.tokens_per_s)
+    with FakeOpenAIServer(config) as server, tempfile.TemporaryDirectory() as tmp:
+        # Must be set before the app modules (and their shared caches) are imported.
+        os.environ.update({
+            "OPENAI_BASE_URL": server.base_url,
+            "OPENAI_API_KEY": "fake",
+            "QDRANT_URL": ":memory:",
+            "EMBEDDING_CACHE_PATH": os.path.join(tmp, "embeddings.sqlite3"),
+            "LOCAL_REPLICA_DIR": os.path.join(tmp, "replicas"),
+        })
+        results = run(args.iterations, config)
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for name, stats in results.items():
+        print(f"{name:28s} {json.dumps(stats)}")
+    print(f"💾 {output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.threshold)
+        for line in regressions:
+            print(f"🐢 {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+⏱️ Filtered search latency vs. number of tenants
+
+Loads N synthetic points spread over T users, then times the per-user filtered
+query (what the app does now) against the old unfiltered one.
+
+    python -m benchmarks.tenant_search                       # Qdrant local mode (in-memory)
+    python -m benchmarks.tenant_search --url http://localhost:6333 --points 200000
+
+Local mode is brute force and ignores payload indexes, so the index effect only
+shows against a real server (e.g. `docker run -p 6333:6333 qdrant/qdrant`).
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from benchmarks.stats import summarize
+from qdrant_schema import ensure_payload_indexes, user_filter
+
+COLLECTION_NAME = "bench_tenants"
+
+
+def _load(qdrant_client, points, tenants, dim, rng):
+    if qdrant_client.collection_exists(COLLECTION_NAME):
+        qdrant_client.delete_collection(COLLECTION_NAME)
+    qdrant_client.create_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config=qdrant_models.VectorParams(size=dim, distance="Cosine"),
+    )
+    ensure_payload_indexes(qdrant_client, COLLECTION_NAME, existing_schema={})
+    batch = 1000
+    for start in range(0, points, batch):
+        count = min(batch, points - start)
+        vectors = rng.standard_normal((count, dim), dtype=np.float32)
+        qdrant_client.upsert(
+            collection_name=COLLECTION_NAME,
+            points=qdrant_models.Batch(
+                ids=list(range(start, start + count)),
+                vectors=vectors.tolist(),
+                payloads=[{"user_id": f"user-{(start + i) % tenants}"} for i in range(count)],
+            ),
+            wait=True,
+        )
+
+
+def _time_queries(qdrant_client, queries, query_filter_for):
+    latencies = []
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        qdrant_client.query_points(
+            collection_name=COLLECTION_NAME,
+            query=query.tolist(),
+            query_filter=query_filter_for(i),
+            limit=5,
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+    summary = summarize(latencies)
+    return {key: summary[key] for key in ("p50_ms", "p95_ms")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Qdrant server URL (default: local in-memory mode)")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--tenants", default="1,10,100,1000", help="Comma separated tenant counts")
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    qdrant_client = QdrantClient(url=args.url) if args.url else QdrantClient(":memory:")
+    rng = np.random.default_rng(42)
+    results = []
+    for tenants in [int(t) for t in args.tenants.split(",")]:
+        _load(qdrant_client, args.points, tenants, args.dim, rng)
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        results.append({
+            "tenants": tenants,
+            "points_per_tenant": args.points // tenants,
+            "filtered": _time_queries(qdrant_client, queries, lambda i: user_filter(f"user-{i % tenants}")),
+            "unfiltered": _time_queries(qdrant_client, queries, lambda i: None),
+        })
+        print(json.dumps(results[-1]))
+
+    qdrant_client.delete_collection(COLLECTION_NAME)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import re
+import uuid
+
+from qdrant_client.http import models as qdrant_models
+
+from context_packer import count_tokens
+
+# ✂️ Passage chunking
+# A long entry as ONE vector is a blurry average of everything in it, and the
+# whole text ends up in the prompt. Instead every entry is split into
+# overlapping passages, each stored as its own point with the parent's
+# `entry_id`. Search runs over passages; hits are merged back per entry and
+# only the passages that matched are returned.
+
+PASSAGE_TOKENS = 200
+OVERLAP_TOKENS = 40
+PASSAGE_FANOUT = 3  # fetch top_k * fanout passages, so top_k distinct entries survive the merge
+PASSAGE_NAMESPACE = uuid.UUID("0b6f7a52-3c1e-4f8d-9e2a-71d4c5b8a903")
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def split_passages(text: str, max_tokens=PASSAGE_TOKENS, overlap_tokens=OVERLAP_TOKENS) -> list[str]:
+    """
+    Sentence-aligned windows of ~max_tokens; each window repeats the last
+    ~overlap_tokens of the previous one so nothing is cut mid-thought.
+    """
+    sentences = [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+    if count_tokens(text) <= max_tokens or len(sentences) <= 1:
+        return [text.strip()]
+
+    passages, window, window_tokens = [], [], 0
+    for sentence in sentences:
+        tokens = count_tokens(sentence)
+        if window and window_tokens + tokens > max_tokens:
+            passages.append(" ".join(window))
+            # carry the tail of this window over as overlap
+            carry, carry_tokens = [], 0
+            for previous in reversed(window):
+                previous_tokens = count_tokens(previous)
+                if carry_tokens + previous_tokens > overlap_tokens:
+                    break
+                carry.insert(0, previous)
+                carry_tokens += previous_tokens
+            window, window_tokens = carry, carry_tokens
+        window.append(sentence)
+        window_tokens += tokens
+    if window:
+        passages.append(" ".join(window))
+    return passages
+
+
+def passage_point_id(entry_id, i) -> str:
+    """ Point ID of passage `i` of an entry; stable, so re-storing an entry overwrites its points. """
+    return str(uuid.uuid5(PASSAGE_NAMESPACE, f"{entry_id}:{i}"))
+
+
+def passage_points(entry_id, passages, vectors, payload):
+    """ One PointStruct per passage, all sharing `payload` plus passage bookkeeping. """
+    return [
+        qdrant_models.PointStruct(
+            id=passage_point_id(entry_id, i),
+            vector=vector,
+            payload={**payload, "text": passage, "entry_id": str(entry_id), "passage": i, "passages": len(passages)},
+        )
+        for i, (passage, vector) in enumerate(zip(passages, vectors))
+    ]
+
+
+def merge_passage_hits(points, top_k):
+    """
+    Groups passage hits by parent entry (points without `entry_id` are their own
+    entry). Entry score = best passage score (and its vector, if fetched); the
+    returned point's `text` holds only the matched passages, in reading order.
+    """
+    best_passages = {}
+    for point in points:  # the same passage can come back from several probes
+        if point.id not in best_passages or point.score > best_passages[point.id].score:
+            best_passages[point.id] = point
+
+    entries = {}
+    for point in best_passages.values():
+        entry_id = (point.payload or {}).get("entry_id", point.id)
+        entries.setdefault(entry_id, []).append(point)
+
+    merged = []
+    for entry_id, hits in entries.items():
+        best = max(hits, key=lambda hit: hit.score)
+        hits.sort(key=lambda hit: (hit.payload or {}).get("passage", 0))
+        payload = dict(best.payload or {})
+        if len(hits) > 1:
+            payload["text"] = _join_passages([(hit.payload or {}).get("text", "") for hit in hits])
+        payload["matched_passages"] = len(hits)
+        merged.append(qdrant_models.ScoredPoint(
+            id=entry_id, version=best.version, score=best.score, payload=payload, vector=best.vector
+        ))
+
+    merged.sort(key=lambda point: point.score, reverse=True)
+    return merged[:top_k]
+
+
+def _join_passages(texts):
+    """ Joins passages without repeating the sentences they overlap on. """
+    seen, sentences = set(), []
+    for text in texts:
+        for sentence in _SENTENCE_SPLIT.split(text):
+            sentence = sentence.strip()
+            if sentence and sentence not in seen:
+                seen.add(sentence)
+                sentences.append(sentence)
+    return " ".join(sentences)
+
+
+def rejoin_passages(passages):
+    """ An entry's text back from all its passages, in order (each repeats the previous one's last sentences). """
+    sentences = []
+    for passage in passages:
+        new = [sentence.strip() for sentence in _SENTENCE_SPLIT.split(passage) if sentence.strip()]
+        overlap = next((size for size in range(min(len(sentences), len(new)), 0, -1)
+                        if sentences[-size:] == new[:size]), 0)
+        sentences += new[overlap:]
+    return " ".join(sentences)
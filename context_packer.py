@@ -0,0 +1,174 @@
+import re
+import threading
+
+# 📦 Context packer
+# Keeps the prompt under a token budget instead of pasting the full top-k:
+#   1. near-duplicate entries are dropped (word-shingle Jaccard)
+#   2. long entries are trimmed to their most query-relevant passages
+#   3. entries are packed greedily by retrieval score until the budget is spent
+# Token counts come from tiktoken when it's installed, otherwise from a
+# chars-per-token estimate calibrated on Swedish journal text. The encoding is
+# loaded on first use (it may have to be downloaded); if that fails for any
+# reason the estimate is used. Separators are counted too, so the packed texts
+# joined with ENTRY_SEPARATOR never exceed the budget.
+
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_ENTRY_BUDGET = 500  # max tokens for a single entry
+DUPLICATE_JACCARD = 0.8
+CHARS_PER_TOKEN = 3.6  # o200k_base on Swedish prose lands around 3.5-3.8
+ENCODING_NAME = "o200k_base"  # gpt-4o / gpt-4o-mini
+ENTRY_SEPARATOR = "\n\n"  # how the prompt joins the packed texts
+PASSAGE_SEPARATOR = " … "  # how a trimmed entry joins the passages it kept
+
+_NOT_LOADED = object()
+_encoding = _NOT_LOADED
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """ The tiktoken encoding, loaded on first use; None if tiktoken is missing or the load fails. """
+    global _encoding
+    if _encoding is _NOT_LOADED:
+        with _encoding_lock:
+            if _encoding is _NOT_LOADED:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(ENCODING_NAME)
+                except Exception:  # not installed, offline without a cached file, corrupt download...
+                    _encoding = None
+    return _encoding
+
+_STOPWORDS = {
+    "och", "att", "det", "som", "jag", "för", "med", "har", "var", "inte", "den", "till", "hur",
+    "vad", "när", "min", "mitt", "mina", "mig", "om", "på", "av", "en", "ett", "the", "and", "was", "what",
+    "how", "when", "did", "with", "for", "that", "this", "have", "has",
+}
+_WORD = re.compile(r"\w+", re.UNICODE)
+_PASSAGE_SPLIT = re.compile(r"\n\s*\n|(?<=[.!?])\s+")
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, round(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def _terms(text):
+    # 5-char prefixes: cheap stemming that survives Swedish inflection (veckan/veckor)
+    return {word[:5] for word in _WORD.findall(text.lower()) if len(word) > 2 and word not in _STOPWORDS}
+
+
+def _shingles(text, n=5):
+    words = _WORD.findall(text.lower())
+    return {tuple(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def trim_to_relevant(query: str, body: str, max_tokens: int) -> str:
+    """ Keeps the passages sharing most terms with the query, in their original order. """
+    if count_tokens(body) <= max_tokens:
+        return body
+    passages = [p.strip() for p in _PASSAGE_SPLIT.split(body) if p.strip()]
+    query_terms = _terms(query)
+    overlap = [len(query_terms & _terms(passage)) for passage in passages]
+    ranked = sorted(range(len(passages)), key=lambda i: (overlap[i], -i), reverse=True)  # ties: earlier wins
+    if overlap[ranked[0]] > 0:
+        ranked = [i for i in ranked if overlap[i] > 0]  # off-topic filler isn't worth its tokens
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR)
+    keep, used = [], 0
+    for i in ranked:
+        tokens = count_tokens(passages[i]) + (separator_tokens if keep else 0)
+        if used + tokens > max_tokens:
+            continue
+        keep.append(i)
+        used += tokens
+    if not keep:  # a single passage is over budget: hard cut
+        return _hard_cut(passages[ranked[0]], max_tokens)
+    while len(keep) > 1:  # tokens can merge across a join: re-check, dropping the least relevant passage
+        text = PASSAGE_SEPARATOR.join(passages[i] for i in sorted(keep))
+        if count_tokens(text) <= max_tokens:
+            return text
+        keep.pop()
+    return passages[keep[0]]
+
+
+def _hard_cut(text, max_tokens):
+    """ The longest prefix of `text` (plus " …") within max_tokens: the chars estimate first, then shrunk. """
+    length = int(max_tokens * CHARS_PER_TOKEN)
+    while length > 0:
+        cut = text[:length].rstrip() + " …"
+        tokens = count_tokens(cut)
+        if tokens <= max_tokens:
+            return cut
+        length = min(length - 1, int(length * max_tokens / tokens))
+    return ""
+
+
+class PackedContext:
+    def __init__(self, texts, tokens_before, tokens_after, duplicates, trimmed, dropped):
+        self.texts = texts
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_after
+        self.duplicates = duplicates
+        self.trimmed = trimmed
+        self.dropped = dropped
+
+    def summary(self) -> dict:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_before - self.tokens_after,
+            "duplicates": self.duplicates,
+            "trimmed": self.trimmed,
+            "dropped": self.dropped,
+            "tokenizer": "tiktoken" if get_encoding() is not None else f"estimate ({CHARS_PER_TOKEN} chars/token)",
+        }
+
+
+def pack_context(query, entries, budget=DEFAULT_TOKEN_BUDGET, entry_budget=DEFAULT_ENTRY_BUDGET):
+    """
+    `entries`: dicts with "score", "header" and "body", best first or not.
+    Returns a PackedContext whose `texts` are "header\\n\\nbody" strings; joined
+    with ENTRY_SEPARATOR they take at most `budget` tokens.
+    """
+    entries = sorted(entries, key=lambda entry: entry["score"], reverse=True)
+    tokens_before = sum(count_tokens(f"{e['header']}\n\n{e['body']}") for e in entries)
+
+    unique, seen = [], []
+    for entry in entries:
+        shingles = _shingles(entry["body"])
+        if any(_jaccard(shingles, other) >= DUPLICATE_JACCARD for other in seen):
+            continue
+        seen.append(shingles)
+        unique.append(entry)
+
+    separator_tokens = count_tokens(ENTRY_SEPARATOR)
+    texts, used, trimmed, dropped = [], 0, 0, 0
+    for entry in unique:
+        remaining = budget - used - (separator_tokens if texts else 0)
+        header_tokens = count_tokens(f"{entry['header']}\n\n")
+        body_budget = min(entry_budget, remaining - header_tokens)
+        text, tokens = None, 0
+        while body_budget > 0:
+            body = trim_to_relevant(query, entry["body"], body_budget)
+            text = f"{entry['header']}\n\n{body}"
+            tokens = count_tokens(text)
+            if tokens <= remaining:
+                break
+            body_budget -= tokens - remaining  # header and body tokenize differently together: shrink
+        if not body_budget > 0:
+            dropped += 1
+            continue
+        trimmed += body != entry["body"]
+        used += tokens + (separator_tokens if texts else 0)
+        texts.append(text)
+    while texts and count_tokens(ENTRY_SEPARATOR.join(texts)) > budget:  # counted apart, rounded apart
+        texts.pop()
+        dropped += 1
+    used = count_tokens(ENTRY_SEPARATOR.join(texts)) if texts else 0
+
+    return PackedContext(texts, tokens_before, used, len(entries) - len(unique), trimmed, dropped)
@@ -0,0 +1,154 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import get_admission_controller
+from context_packer import count_tokens
+
+# 🧠 Conversation memory
+# Sending the whole chat on every turn makes each turn slower and pricier than
+# the last. Instead the prompt is:
+#   system message + running summary of older turns + as many recent turns as
+#   fit in the token budget (newest first)
+# Turns that slide out of the window are folded into the summary by a
+# background call, so the user never waits for it. Until it lands, the old
+# summary is used - at worst the prompt briefly forgets a turn or two.
+# The summary call queues for a completion slot like any other (admission.py),
+# but isn't charged to the user's rate limit: they didn't ask for it.
+
+DEFAULT_HISTORY_BUDGET = 3000  # tokens for summary + recent turns, system message excluded
+DEFAULT_SUMMARY_TOKENS = 300
+MIN_TURNS_TO_FOLD = 4  # don't pay for a summary call per message, batch them
+MESSAGE_OVERHEAD_TOKENS = 4  # role + separators per chat message
+
+SUMMARY_PROMPT = (
+    "Du sammanfattar en pågående chatt så att assistenten kan fortsätta den. "
+    "Behåll fakta om användaren, beslut, öppna frågor och ton. Skriv kort, som punktlista, "
+    "max {max_tokens} tokens. Svara bara med sammanfattningen."
+)
+
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+
+def make_openai_summarizer(client, user_id, model="gpt-4o-mini", max_tokens=DEFAULT_SUMMARY_TOKENS, admission=None):
+    """
+    summarize(previous_summary, messages) -> new summary, one chat call made
+    through `admission` (default: the process-wide controller) for `user_id`.
+    """
+    admission = admission or get_admission_controller()
+
+    def summarize(previous_summary, messages):
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        user = (f"Tidigare sammanfattning:\n{previous_summary}\n\n" if previous_summary else "")
+        user += f"Nya meddelanden:\n{transcript}"
+        response = admission.call(user_id, model, lambda: client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT.format(max_tokens=max_tokens)},
+                {"role": "user", "content": user},
+            ],
+            max_tokens=max_tokens,
+        ), charge_user=False)
+        return response.choices[0].message.content.strip()
+    return summarize
+
+
+def _message_tokens(message):
+    return count_tokens(message["content"] or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationMemory:
+    """
+    Full transcript for display, bounded context for the model.
+    Lives in st.session_state; the background summary only touches this object.
+    """
+
+    def __init__(self, summarize, budget=DEFAULT_HISTORY_BUDGET, summary_tokens=DEFAULT_SUMMARY_TOKENS,
+                 min_turns_to_fold=MIN_TURNS_TO_FOLD):
+        self.summarize = summarize
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+        self.min_turns_to_fold = min_turns_to_fold
+        self.messages = []  # every user/assistant message, for the UI
+        self.summary = ""
+        self.folded = 0  # messages[:folded] are covered by the summary
+        self.summaries = 0
+        self.summary_errors = 0
+        self._tokens = []  # per-message token counts, computed once
+        self._pending = None  # Future of the running summary call
+        self._lock = threading.Lock()
+
+    def add(self, role, content):
+        self.messages.append({"role": role, "content": content})
+        self._tokens.append(_message_tokens(self.messages[-1]))
+
+    def remove_last(self):
+        """ Drops the newest message, e.g. a question that never got an answer. """
+        if len(self.messages) > self.folded:
+            self.messages.pop()
+            self._tokens.pop()
+
+    def _window_start(self):
+        """ Index of the oldest message that still fits in the budget next to the summary. """
+        available = self.budget - (count_tokens(self.summary) + MESSAGE_OVERHEAD_TOKENS if self.summary else 0)
+        start, used = len(self.messages), 0
+        while start > 0 and used + self._tokens[start - 1] <= available:
+            used += self._tokens[start - 1]
+            start -= 1
+        # the newest message always goes in, even if it alone blows the budget
+        return min(start, len(self.messages) - 1) if self.messages else 0
+
+    def context(self, system_message):
+        """ Messages for chat.completions.create: system, summary, recent window. """
+        with self._lock:
+            summary = self.summary
+            start = max(self._window_start(), self.folded)
+        messages = [system_message]
+        if summary:
+            messages.append({"role": "system", "content": f"Sammanfattning av tidigare i samtalet:\n{summary}"})
+        return messages + self.messages[start:]
+
+    def maybe_summarize(self):
+        """
+        Starts a background summary of the messages that slid out of the window,
+        unless one is already running or there are too few to bother.
+        """
+        with self._lock:
+            if self._pending is not None and not self._pending.done():
+                return False
+            start = self._window_start()
+            if start - self.folded < self.min_turns_to_fold:
+                return False
+            previous, end = self.summary, start
+            batch = self.messages[self.folded:end]
+            self._pending = _summary_pool.submit(self._fold, previous, batch, end)
+            return True
+
+    def _fold(self, previous, batch, end):
+        try:
+            summary = self.summarize(previous, batch)
+        except Exception:
+            with self._lock:
+                self.summary_errors += 1
+            return
+        with self._lock:
+            self.summary = summary
+            self.folded = end
+            self.summaries += 1
+
+    def wait(self, timeout=None):
+        """ Blocks until the running summary (if any) is done. For scripts and benchmarks. """
+        pending = self._pending
+        if pending is not None:
+            pending.result(timeout)
+
+    def stats(self, system_message=None) -> dict:
+        context = self.context(system_message or {"role": "system", "content": ""})
+        return {
+            "messages": len(self.messages),
+            "context_messages": len(context) - 1,
+            "context_tokens": sum(_message_tokens(m) for m in context[1:]),
+            "transcript_tokens": sum(self._tokens),
+            "folded": self.folded,
+            "summaries": self.summaries,
+            "summary_running": self._pending is not None and not self._pending.done(),
+        }
@@ -0,0 +1,260 @@
+import hashlib
+import threading
+import uuid
+
+from qdrant_client.http import models as qdrant_models
+
+from chunking import passage_point_id, passage_points, rejoin_passages, split_passages
+from embedding_cache import normalize_text
+from qdrant_schema import CONTENT_HASH_FIELD, USER_ID_FIELD
+
+# 🧹 Idempotent ingestion
+# Every save used to get a fresh uuid4, so a double-clicked "Save Entry" or a
+# re-run import stored the same vectors twice (and paid for the embeddings
+# twice), and the copies then took up top_k slots in retrieval.
+# Now every passage point carries a `content_hash` (keyword-indexed), and
+# before embedding we look the text up by that hash among the user's entries,
+# whatever their IDs (an edited entry keeps its first ID; old imports had random ones):
+#   - same text already stored        -> skip embedding and upsert entirely
+#   - editing an entry (ID given)     -> re-embed, overwrite the passage points
+#                                        in place, drop passages the entry no longer has
+#                                        (and its pre-chunking point, whose ID is the entry ID)
+#   - new text                        -> new entry; its ID is derived from
+#                                        (user_id, normalized text) unless that ID is taken
+# The app and journal_import.py both go through store_entries. Points stored
+# before `content_hash` existed get it once from backfill_content_hashes.
+
+ENTRY_NAMESPACE = uuid.UUID("3d9a6c1f-8e2b-4a57-b0c4-5f17e2a9d846")
+
+
+def content_hash(text: str) -> str:
+    """ sha256 of the normalized text (same normalization as the embedding cache). """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def content_entry_id(user_id, text) -> str:
+    """ Deterministic entry ID: the same user saving the same text always gets the same points. """
+    return str(uuid.uuid5(ENTRY_NAMESPACE, f"{user_id}:{content_hash(text)}"))
+
+
+def find_entries(qdrant_client, collection_name, user_id, digests, page_size=256) -> dict:
+    """ {content_hash: (entry_id, passage count)} for this user's stored entries with those hashes. """
+    if not digests:
+        return {}
+    query = qdrant_models.Filter(must=[
+        qdrant_models.FieldCondition(key=USER_ID_FIELD, match=qdrant_models.MatchValue(value=user_id)),
+        qdrant_models.FieldCondition(key=CONTENT_HASH_FIELD, match=qdrant_models.MatchAny(any=list(digests))),
+    ])
+    found, offset = {}, None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            scroll_filter=query,
+            limit=page_size,
+            offset=offset,
+            with_payload=[CONTENT_HASH_FIELD, "entry_id", "passages"],
+            with_vectors=False,
+        )
+        for point in points:
+            payload = point.payload or {}
+            entry_id = str(payload.get("entry_id", point.id))  # points stored before chunking are their own entry
+            found.setdefault(payload[CONTENT_HASH_FIELD], (entry_id, payload.get("passages", 1)))
+        if offset is None:
+            return found
+
+
+def _point_id(entry_id):
+    """ Entry IDs travel as strings; a legacy point's own ID may be an unsigned int. """
+    return int(entry_id) if str(entry_id).isdigit() else str(entry_id)
+
+
+def stored_entries(qdrant_client, collection_name, entry_ids) -> dict:
+    """
+    {entry_id: (content_hash, passage points, legacy)} for the entries that are
+    already stored. `legacy`: a point from before chunking whose ID is the entry ID.
+    """
+    if not entry_ids:
+        return {}
+    first_passages = {passage_point_id(entry_id, 0): entry_id for entry_id in entry_ids}
+    points = qdrant_client.retrieve(
+        collection_name=collection_name,
+        ids=list(first_passages) + [_point_id(entry_id) for entry_id in entry_ids],
+        with_payload=[CONTENT_HASH_FIELD, "entry_id", "passages"],
+        with_vectors=False,
+    )
+    stored = {}
+    for point in points:
+        payload = point.payload or {}
+        if str(point.id) in first_passages:
+            entry_id = first_passages[str(point.id)]
+            legacy = stored.get(entry_id, (None, 0, False))[2]
+            stored[entry_id] = (payload.get(CONTENT_HASH_FIELD), payload.get("passages", 1), legacy)
+        elif "entry_id" not in payload:
+            entry_id = str(point.id)
+            digest, passages, _ = stored.get(entry_id, (payload.get(CONTENT_HASH_FIELD), 0, True))
+            stored[entry_id] = (digest, passages, True)
+    return stored
+
+
+def remove_extra_passages(qdrant_client, collection_name, entry_id, keep, stored_count, legacy=False):
+    """
+    An edit made the entry shorter: deletes passage points `keep`..`stored_count - 1`,
+    and the entry's own pre-chunking point if it still has one (`legacy`).
+    """
+    stale = [passage_point_id(entry_id, i) for i in range(keep, stored_count)]
+    if legacy:
+        stale.append(_point_id(entry_id))
+    if not stale:
+        return 0
+    qdrant_client.delete(collection_name=collection_name, points_selector=stale, wait=True)
+    return len(stale)
+
+
+class DedupReport:
+    """ What idempotent ingestion saved us. Thread-safe counters, one instance per process. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "entries": 0, "stored": 0, "updated": 0, "duplicates": 0,
+            "embedding_calls_avoided": 0, "vectors_avoided": 0, "passages_removed": 0,
+        }
+
+    def count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def summary(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["duplicate_rate"] = round(stats["duplicates"] / stats["entries"], 3) if stats["entries"] else 0.0
+        return stats
+
+
+_default_report = None
+_default_lock = threading.Lock()
+
+
+def get_dedup_report() -> DedupReport:
+    global _default_report
+    with _default_lock:
+        if _default_report is None:
+            _default_report = DedupReport()
+        return _default_report
+
+
+def _requests(passage_count, batch_size):
+    """ Embedding requests for `passage_count` passages (None: all in one request). """
+    if not batch_size:
+        return int(passage_count > 0)
+    return (passage_count + batch_size - 1) // batch_size
+
+
+def store_entries(qdrant_client, collection_name, user_id, entries, embed_passages, report=None,
+                  embed_batch_size=None):
+    """
+    Stores entries idempotently, embedding all new passages with one
+    `embed_passages(passages)` call and writing them in one upsert. `entries`
+    are dicts with "text", "payload" (merged into every passage point) and an
+    optional "entry_id" to edit that entry in place. A text this user already
+    has (or that repeats within `entries`) is skipped. Returns one
+    (entry_id, "stored" | "updated" | "duplicate", passage count) per entry,
+    where a duplicate's entry_id is the stored entry's.
+    `embed_batch_size` is only used to count the embedding requests avoided.
+    """
+    report = report or get_dedup_report()
+    digests = [content_hash(entry["text"]) for entry in entries]
+    known = find_entries(qdrant_client, collection_name, user_id, set(digests))
+    # new entries get the content-derived ID unless it's taken (an edit kept it for other text)
+    candidate_ids = {entry.get("entry_id") or content_entry_id(user_id, entry["text"]) for entry in entries}
+    occupied = stored_entries(qdrant_client, collection_name, list(candidate_ids))
+
+    results, pending, points, skipped_passages = [], [], [], 0
+    for entry, digest in zip(entries, digests):
+        passages = split_passages(entry["text"])
+        if digest in known:
+            results.append((known[digest][0], "duplicate", len(passages)))
+            skipped_passages += len(passages)
+            continue
+        entry_id = entry.get("entry_id") or content_entry_id(user_id, entry["text"])
+        if not entry.get("entry_id") and entry_id in occupied:
+            entry_id = str(uuid.uuid4())
+        known[digest] = (entry_id, len(passages))  # the same text again further down is a duplicate
+        outcome = "updated" if entry.get("entry_id") and entry_id in occupied else "stored"
+        results.append((entry_id, outcome, len(passages)))
+        pending.append((entry_id, passages, {**entry["payload"], CONTENT_HASH_FIELD: digest}))
+
+    texts = [passage for _, passages, _ in pending for passage in passages]
+    vectors = embed_passages(texts) if texts else []
+    position = 0
+    for entry_id, passages, payload in pending:
+        points += passage_points(entry_id, passages, vectors[position:position + len(passages)], payload=payload)
+        position += len(passages)
+    if points:
+        qdrant_client.upsert(collection_name=collection_name, points=points, wait=True)
+
+    removed = 0
+    for entry_id, outcome, passage_count in results:
+        if outcome == "updated":
+            _, stored_count, legacy = occupied[entry_id]
+            removed += remove_extra_passages(qdrant_client, collection_name, entry_id, passage_count,
+                                             stored_count, legacy)
+    outcomes = [outcome for _, outcome, _ in results]
+    report.count(
+        entries=len(entries), stored=outcomes.count("stored"), updated=outcomes.count("updated"),
+        duplicates=outcomes.count("duplicate"), vectors_avoided=skipped_passages, passages_removed=removed,
+        embedding_calls_avoided=_requests(len(texts) + skipped_passages, embed_batch_size)
+        - _requests(len(texts), embed_batch_size),
+    )
+    return results
+
+
+def store_entry(qdrant_client, collection_name, user_id, text, embed_passages, payload, entry_id=None, report=None):
+    """
+    Stores one entry idempotently (see store_entries). `embed_passages(passages)`
+    returns one vector per passage; `payload` is merged into every passage point.
+    Pass the `entry_id` of an existing entry to edit it in place.
+    Returns (entry_id, "stored" | "updated" | "duplicate").
+    """
+    entry = {"text": text, "payload": payload, "entry_id": entry_id}
+    entry_id, outcome, _ = store_entries(qdrant_client, collection_name, user_id, [entry], embed_passages, report)[0]
+    return entry_id, outcome
+
+
+def backfill_content_hashes(qdrant_client, collection_name, page_size=256):
+    """
+    One-off migration: gives points stored before `content_hash` existed (random
+    IDs, from older imports and the app) the hash of their entry's text, so a
+    re-import or re-save finds them instead of storing them again. Returns the
+    number of entries updated.
+    """
+    missing = qdrant_models.Filter(
+        must=[qdrant_models.IsEmptyCondition(is_empty=qdrant_models.PayloadField(key=CONTENT_HASH_FIELD))]
+    )
+    entries, offset = {}, None  # entry_id -> {passage index: (point id, text)}
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            scroll_filter=missing,
+            limit=page_size,
+            offset=offset,
+            with_payload=["text", "entry_id", "passage"],
+            with_vectors=False,
+        )
+        for point in points:
+            payload = point.payload or {}
+            passages = entries.setdefault(str(payload.get("entry_id", point.id)), {})
+            passages[payload.get("passage", 0)] = (point.id, payload.get("text", ""))
+        if offset is None:
+            break
+    for passages in entries.values():
+        ordered = [passages[i] for i in sorted(passages)]
+        digest = content_hash(rejoin_passages([text for _, text in ordered]))
+        qdrant_client.set_payload(
+            collection_name=collection_name,
+            payload={CONTENT_HASH_FIELD: digest},
+            points=[point_id for point_id, _ in ordered],
+            wait=True,
+        )
+    return len(entries)
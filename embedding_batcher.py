@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import numpy as np
+
+from resilience import DeadlineExceeded
+
+# 📮 Cross-session micro-batching for embeddings
+# Every session used to send its own one-string embeddings request, so under load
+# we made hundreds of tiny HTTP requests a second and ran into request-count rate
+# limits long before token limits. One batcher per process (resources.py) queues
+# embed calls from all sessions and threads and sends them as one request when
+#   - max_batch_size texts are waiting for the same model + options, or
+#   - the oldest of them has waited max_wait_ms (a few ms: invisible next to the
+#     request itself, but enough for concurrent sessions to share a request).
+# Callers get a Future per text; at most max_in_flight requests run at once, and
+# whatever arrives meanwhile simply joins the next batch. Identical texts in one
+# batch are sent once.
+
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 5))
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_TIMEOUT = 30.0  # seconds a blocking caller waits for queue + request, then DeadlineExceeded
+DEFAULT_WINDOW = 1000  # last N batches/requests for the percentiles
+
+
+def openai_embed_many(client, resilience=None):
+    """
+    `embed_many(model, texts, options)` on an OpenAI client: one request, vectors
+    in input order. With `resilience` the request gets the "embeddings" policy
+    (timeouts, retries, hedging - see resilience.py).
+    """
+
+    def request(model, texts, options, timeout=None):
+        if timeout is not None:
+            options = {**options, "timeout": timeout}
+        response = client.embeddings.create(input=list(texts), model=model, **options)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    if resilience is None:
+        return request
+    return lambda model, texts, options: resilience.call(
+        "embeddings", lambda timeout: request(model, texts, options, timeout)
+    )
+
+
+class _Pending:
+    __slots__ = ("text", "future", "enqueued")
+
+    def __init__(self, text, future, enqueued):
+        self.text = text
+        self.future = future
+        self.enqueued = enqueued
+
+
+class EmbeddingBatcher:
+    def __init__(self, embed_many, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, window=DEFAULT_WINDOW, clock=time.monotonic):
+        self.embed_many_fn = embed_many  # (model, texts, options) -> vectors
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_in_flight = max_in_flight
+        self.clock = clock
+        self.stats = {"texts": 0, "batches": 0, "size_flushes": 0, "deadline_flushes": 0,
+                      "coalesced": 0, "errors": 0, "cancelled": 0}
+        self._batch_sizes = deque(maxlen=window)
+        self._queue_delays_ms = deque(maxlen=window)
+        self._request_ms = deque(maxlen=window)
+        self._pending = OrderedDict()  # (model, options) -> deque[_Pending], oldest key first
+        self._in_flight = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed-batch")
+        self._thread = threading.Thread(target=self._run, daemon=True, name="embed-batcher")
+        self._thread.start()
+
+    # -- callers -------------------------------------------------------------
+
+    def submit(self, text, model, **options) -> Future:
+        """ Queues one text; the Future resolves to its vector (or the request's exception). """
+        future = Future()
+        key = (model, tuple(sorted(options.items())))
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed")
+            self._pending.setdefault(key, deque()).append(_Pending(text, future, self.clock()))
+            self.stats["texts"] += 1
+            self._cond.notify_all()
+        return future
+
+    def embed(self, text, model, timeout=DEFAULT_TIMEOUT, **options) -> list[float]:
+        """ Blocking single embed, batched with whatever else is queued right now. """
+        return self._results([self.submit(text, model, **options)], timeout)[0]
+
+    def embed_many(self, texts, model, timeout=DEFAULT_TIMEOUT, **options) -> list[list[float]]:
+        """ All of `texts` (queued together, so they mostly share one request), in order. """
+        return self._results([self.submit(text, model, **options) for text in texts], timeout)
+
+    def _results(self, futures, timeout):
+        """
+        Waits at most `timeout` seconds for all `futures`; past that, raises
+        DeadlineExceeded (a ResilienceError, like a timed-out direct call) and
+        cancels whatever hasn't been sent yet.
+        """
+        deadline = self.clock() + timeout
+        try:
+            return [future.result(max(0.0, deadline - self.clock())) for future in futures]
+        except FutureTimeout as exc:
+            for future in futures:
+                future.cancel()
+            raise DeadlineExceeded(f"embeddings: no batched answer within {timeout} s") from exc
+
+    # -- batching loop -------------------------------------------------------
+
+    def _take_ready(self, now):
+        """ (key, requests, reason) of the first full or overdue queue, else None. """
+        for key, queue in self._pending.items():
+            if len(queue) >= self.max_batch_size:
+                reason = "size"
+            elif self._closed or now - queue[0].enqueued >= self.max_wait:
+                reason = "deadline"
+            else:
+                continue
+            batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch_size))]
+            if not queue:
+                del self._pending[key]
+            return key, batch, reason
+        return None
+
+    def _wait_time(self, now):
+        """ Seconds until the oldest queued text is due (None = nothing queued). """
+        if not self._pending:
+            return None
+        return max(0.0, min(queue[0].enqueued for queue in self._pending.values()) + self.max_wait - now)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self._pending:
+                        return
+                    if self._in_flight < self.max_in_flight:
+                        now = self.clock()
+                        ready = self._take_ready(now)
+                        if ready is not None:
+                            break
+                        self._cond.wait(self._wait_time(now))
+                    else:
+                        self._cond.wait()  # a finished request frees a slot
+                self._in_flight += 1
+            self._pool.submit(self._flush, *ready)
+
+    def _flush(self, key, batch, reason):
+        dispatched = self.clock()
+        queued = len(batch)
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        texts = list(dict.fromkeys(request.text for request in batch))  # same text twice -> sent once
+        error, vectors = None, {}
+        if texts:
+            try:
+                model, options = key
+                vectors = dict(zip(texts, self.embed_many_fn(model, texts, dict(options))))
+            except Exception as exc:
+                error = exc
+        finished = self.clock()
+        for request in batch:
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(vectors[request.text])
+        with self._cond:
+            self._in_flight -= 1
+            self.stats[f"{reason}_flushes"] += 1
+            self.stats["cancelled"] += queued - len(batch)
+            if texts:
+                self.stats["batches"] += 1
+                self.stats["coalesced"] += len(batch) - len(texts)
+                self.stats["errors"] += error is not None
+                self._batch_sizes.append(len(texts))
+                self._request_ms.append((finished - dispatched) * 1000)
+                self._queue_delays_ms.extend((dispatched - request.enqueued) * 1000 for request in batch)
+            self._cond.notify_all()
+
+    def close(self, timeout=None):
+        """ Sends what is still queued, then stops the loop and the request threads. """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._pool.shutdown(wait=True)
+
+    # -- metrics -------------------------------------------------------------
+
+    def summary(self) -> dict:
+        """ Batch sizes and the queueing delay batching adds, over the last `window` batches. """
+        with self._cond:
+            stats = dict(self.stats)
+            sizes, delays, requests = list(self._batch_sizes), list(self._queue_delays_ms), list(self._request_ms)
+            stats.update(pending=sum(len(queue) for queue in self._pending.values()), in_flight=self._in_flight)
+
+        def percentiles(values, *qs):
+            return {f"p{q}": round(float(np.percentile(values, q)), 2) if values else 0.0 for q in qs}
+
+        return {
+            **stats,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "mean_batch_size": round(float(np.mean(sizes)), 2) if sizes else 0.0,
+            "batch_size": percentiles(sizes, 50, 95),
+            "queue_delay_ms": percentiles(delays, 50, 95, 99),
+            "request_ms": percentiles(requests, 50, 95),
+        }
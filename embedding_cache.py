@@ -0,0 +1,186 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+# 🧊 Embedding cache
+# Two tiers in front of the embeddings endpoint:
+#   1. an in-process LRU (dict of lists, instant)
+#   2. an on-disk SQLite table with float32 blobs (survives restarts)
+# Keys are (model, sha256 of the normalized text), so the same question asked
+# twice - or with a stray space - never hits the network again.
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings.sqlite3"),
+)
+DEFAULT_MEMORY_ENTRIES = 2048
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024  # 256 MB ≈ 40k vectors à 1536 dims
+
+
+def normalize_text(text: str) -> str:
+    """ Unicode-NFC, collapse whitespace and strip. Case is kept, it can change the meaning. """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """ Stable key for (model, normalized text). """
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+def _to_blob(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _from_blob(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    Memory LRU + SQLite embedding cache with size-based eviction.
+    Thread-safe, so every Streamlit session in the process can share one instance.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._db = None
+        if path:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+            row = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+            self._disk_bytes = row[0]
+        else:
+            self._disk_bytes = 0
+
+    # --- lookups ---
+    def get(self, model: str, text: str):
+        """ Returns the cached vector or None. Counts hits/misses. """
+        key = cache_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+                    vector = _from_blob(row[0])
+                    self._remember(key, vector)
+                    self.stats["disk_hits"] += 1
+                    return vector
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, model: str, text: str, vector) -> None:
+        key = cache_key(model, text)
+        vector = list(vector)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is None:
+                return
+            blob = _to_blob(vector)
+            old = self._db.execute("SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                (key, blob, time.time()),
+            )
+            self._disk_bytes += len(blob) - (old[0] if old else 0)
+            self._evict_disk()
+
+    def get_or_embed(self, model: str, text: str, embed_fn) -> list[float]:
+        """ Cache-through: only calls `embed_fn(text)` on a miss. """
+        vector = self.get(model, text)
+        if vector is None:
+            vector = list(embed_fn(text))
+            self.put(model, text, vector)
+        return vector
+
+    def get_or_embed_many(self, model: str, texts: list[str], embed_many_fn) -> list[list[float]]:
+        """
+        Batched cache-through. `embed_many_fn(list_of_texts)` is called once with
+        only the texts that missed, in order.
+        """
+        vectors = [self.get(model, text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = embed_many_fn([texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = list(vector)
+                self.put(model, texts[i], vectors[i])
+        return vectors
+
+    # --- housekeeping ---
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes:
+            rows = self._db.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+            for key, size in rows:
+                self._db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                self._disk_bytes -= size
+                self.stats["evictions"] += 1
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+
+    def summary(self) -> dict:
+        """ Counters for the Felsökning panel. """
+        with self._lock:
+            lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = lookups - self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """ Process-wide cache, shared by every session and every app in this repo. """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
@@ -0,0 +1,106 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+import urllib.request
+
+from PIL import Image
+
+# 🖼️ Local content-addressed image store
+# DALL-E hands out temporary URLs to 1024x1024 PNGs (~1-2 MB). Linking to them
+# meant every page view pulled the full PNG from a remote host, and the URLs
+# expired hours before the news cache did. Instead each image is downloaded
+# once, stored under its sha256, and pre-rendered as compressed WebP at the
+# sizes the page shows. The news cache stores the reference dict, not the URL.
+#
+#   .cache/news_images/ab/abcdef...png          original
+#   .cache/news_images/ab/abcdef...-640.webp    display size
+
+DEFAULT_DIRECTORY = os.getenv(
+    "NEWS_IMAGE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "news_images"),
+)
+DISPLAY_WIDTHS = (640, 256)  # top story card, small thumbnail
+WEBP_QUALITY = 80
+DOWNLOAD_TIMEOUT = 30
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class ImageStore:
+    def __init__(self, directory=DEFAULT_DIRECTORY, widths=DISPLAY_WIDTHS):
+        self.directory = directory
+        self.widths = tuple(widths)
+
+    def _relative(self, digest, suffix):
+        return os.path.join(digest[:2], f"{digest}{suffix}")
+
+    def path(self, relative):
+        return os.path.join(self.directory, relative)
+
+    def put(self, data: bytes) -> dict:
+        """ Stores image bytes (idempotent) and its display sizes. Returns the reference for the cache JSON. """
+        digest = hashlib.sha256(data).hexdigest()
+        original = self._relative(digest, ".png")
+        if not os.path.exists(self.path(original)):
+            _atomic_write(self.path(original), data)
+
+        sizes = {}
+        image = None
+        for width in self.widths:
+            relative = self._relative(digest, f"-{width}.webp")
+            if not os.path.exists(self.path(relative)):
+                if image is None:
+                    image = Image.open(io.BytesIO(data))
+                    image.load()
+                    if image.mode not in ("RGB", "RGBA"):
+                        image = image.convert("RGB")
+                resized = image.copy()
+                resized.thumbnail((width, width * image.height // image.width), Image.LANCZOS)
+                buffer = io.BytesIO()
+                resized.save(buffer, format="WEBP", quality=WEBP_QUALITY, method=4)
+                _atomic_write(self.path(relative), buffer.getvalue())
+            sizes[str(width)] = relative
+        return {"sha256": digest, "original": original, "sizes": sizes}
+
+    def put_url(self, url) -> dict:
+        """ Downloads once and stores. """
+        with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+            return self.put(response.read())
+
+    def display_path(self, reference, width=DISPLAY_WIDTHS[0]):
+        """ Local file for `reference` at `width` (nearest stored size), falling back to the original. """
+        sizes = reference.get("sizes") or {}
+        if sizes:
+            best = min(sizes, key=lambda stored: abs(int(stored) - width))
+            path = self.path(sizes[best])
+            if os.path.exists(path):
+                return path
+        path = self.path(reference["original"])
+        return path if os.path.exists(path) else None
+
+    def prune(self, keep_digests, min_age_seconds=24 * 3600):
+        """ Deletes files of images not in `keep_digests` and older than `min_age_seconds`. Returns count. """
+        if not os.path.isdir(self.directory):
+            return 0
+        keep, cutoff, removed = set(keep_digests), time.time() - min_age_seconds, 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                digest = name.split("-")[0].split(".")[0]
+                path = os.path.join(root, name)
+                if digest not in keep and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+        return removed
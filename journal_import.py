@@ -0,0 +1,274 @@
+"""
+📥 Bulk journal import
+
+Backfills years of diary entries into Qdrant without the two-calls-per-entry
+cost of `store_journal_entry`:
+  - exports (JSONL / CSV / Markdown) are read lazily as a generator
+  - texts are embedded in batches (the embeddings endpoint takes a list)
+  - points are upserted through the `journal` alias in chunks (embedded with the
+    live collection's model; mirrored to the new one while a migration runs)
+  - at most `max_in_flight` chunks are being worked on at once
+  - progress is checkpointed, so a crashed run picks up where it stopped
+  - entries that are already stored - from an earlier run, another export or the
+    app, found by their content hash - are neither embedded nor upserted again
+    (dedup.py; entries from before content hashes get them on the next import)
+
+Usage:
+    python journal_import.py diary.jsonl --user-id admin
+    python journal_import.py export.csv --user-id admin --chunk-size 256 --in-flight 4
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
+from openai import OpenAI
+from qdrant_client import QdrantClient
+
+from dedup import backfill_content_hashes, get_dedup_report, store_entries
+from embedding_cache import get_embedding_cache
+from migration import DualWriter, make_embedder
+from storage_modes import DEFAULT_EMBEDDING_MODEL, from_collection_metadata, get_storage_config, make_openai_embedder
+from qdrant_schema import (
+    JOURNAL_ALIAS, assign_unowned_entries, backfill_timestamps, get_collection_metadata, timestamp_payload,
+)
+
+QDRANT_URL = os.getenv(
+    "QDRANT_URL", "https://67bd4e7c-9e18-4183-8655-cb368b598d90.europe-west3-0.gcp.cloud.qdrant.io"
+)
+COLLECTION_NAME = JOURNAL_ALIAS
+
+
+# --- 📄 READERS (all generators, nothing is loaded up front) ---
+def read_jsonl(path):
+    """ One JSON object per line, with a `text` (or `content`) field and optional `timestamp`. """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            yield {"text": row.get("text") or row.get("content", ""), "timestamp": row.get("timestamp")}
+
+
+def read_csv(path):
+    """ CSV with a header row; needs a `text` (or `content`) column, `timestamp`/`date` is optional. """
+    with open(path, encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            yield {
+                "text": row.get("text") or row.get("content", ""),
+                "timestamp": row.get("timestamp") or row.get("date"),
+            }
+
+
+_HEADING = re.compile(r"^#{1,3}\s+(.*)$")
+
+
+def read_markdown(path):
+    """ Every `#`/`##`/`###` heading starts a new entry; the heading is used as the timestamp. """
+    heading, lines = None, []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            match = _HEADING.match(line)
+            if match:
+                if "".join(lines).strip():
+                    yield {"text": "".join(lines).strip(), "timestamp": heading}
+                heading, lines = match.group(1).strip(), []
+            else:
+                lines.append(line)
+    if "".join(lines).strip():
+        yield {"text": "".join(lines).strip(), "timestamp": heading}
+
+
+READERS = {".jsonl": read_jsonl, ".json": read_jsonl, ".csv": read_csv, ".md": read_markdown}
+
+
+def read_entries(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"Unsupported export format: {ext} (expected one of {', '.join(READERS)})")
+    for record in READERS[ext](path):
+        if record["text"] and record["text"].strip():
+            yield record
+
+
+# --- 🧮 CHECKPOINT ---
+class Checkpoint:
+    """
+    Remembers how many records from the start of the source are safely stored.
+    Chunks can finish out of order, so only the contiguous prefix is committed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = 0
+        self._finished = {}
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self.done = json.load(file).get("done", 0)
+
+    def mark(self, start, count):
+        self._finished[start] = count
+        while self.done in self._finished:
+            self.done += self._finished.pop(self.done)
+        if self.path:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as file:
+                json.dump({"done": self.done, "updated": str(datetime.datetime.now())}, file)
+            os.replace(tmp_path, self.path)
+
+
+# --- 🚚 PIPELINE ---
+def _chunks(records, size, start):
+    index = start
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield index, chunk
+        index += len(chunk)
+
+
+def import_entries(records, user_id, qdrant_client, embed_many, collection_name=COLLECTION_NAME,
+                   chunk_size=256, embed_batch_size=64, max_in_flight=4, checkpoint_path=None,
+                   progress=None, embedding_model=DEFAULT_EMBEDDING_MODEL, storage=None, dual_writer=None):
+    """
+    Streams `records` into Qdrant. Returns a stats dict with entries/s.
+
+    Entries whose text the user already has (found by content hash, whatever
+    their IDs) or that repeat within the export are skipped before embedding,
+    so re-running an import costs no embeddings; new entries get IDs derived
+    from (user_id, normalized text) and passage IDs from the entry ID.
+    `embed_many` must produce `embedding_model` / `storage` vectors (the cache key);
+    `dual_writer` (migration.DualWriter) mirrors each chunk while a migration runs.
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    records = islice(iter(records), checkpoint.done, None)
+    cache = get_embedding_cache()
+    cache_model = (storage or get_storage_config()).cache_model(embedding_model)
+    lock = threading.Lock()
+    report = get_dedup_report()
+    stats = {"imported": 0, "skipped": checkpoint.done, "chunks": 0, "passages": 0, "duplicates": 0}
+    started = time.perf_counter()
+
+    def embed_passages(texts):
+        vectors = []
+        for i in range(0, len(texts), embed_batch_size):
+            vectors += cache.get_or_embed_many(cache_model, texts[i:i + embed_batch_size], embed_many)
+        return vectors
+
+    def process(start, chunk):
+        # Each entry becomes overlapping passages (chunking.py); all new passages of a
+        # chunk are embedded in batches and upserted together - the same path as the app (dedup.py).
+        results = store_entries(
+            qdrant_client, collection_name, user_id,
+            [{"text": record["text"], "payload": {
+                "user_id": user_id,
+                **timestamp_payload(record.get("timestamp") or str(datetime.datetime.now())),
+            }} for record in chunk],
+            embed_passages, report=report, embed_batch_size=embed_batch_size,
+        )
+        written = [(entry_id, passages) for entry_id, outcome, passages in results if outcome != "duplicate"]
+        if written and dual_writer is not None:
+            dual_writer.mirror(collection_name, [entry_id for entry_id, _ in written])
+        with lock:
+            stats["passages"] += sum(passages for _, passages in written)
+            stats["duplicates"] += len(chunk) - len(written)
+        return start, len(chunk)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        in_flight = set()
+        for start, chunk in _chunks(records, chunk_size, checkpoint.done):
+            # Bounded: never read further ahead than `max_in_flight` chunks.
+            if len(in_flight) >= max_in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                _collect(finished, checkpoint, stats, lock, started, progress)
+            in_flight.add(pool.submit(process, start, chunk))
+        finished, _ = wait(in_flight)
+        _collect(finished, checkpoint, stats, lock, started, progress)
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    stats["entries_per_s"] = round(stats["imported"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+    return stats
+
+
+def _collect(futures, checkpoint, stats, lock, started, progress):
+    for future in futures:
+        start, count = future.result()  # re-raises: the checkpoint stays before the failed chunk
+        with lock:
+            checkpoint.mark(start, count)
+            stats["imported"] += count
+            stats["chunks"] += 1
+            if progress:
+                elapsed = time.perf_counter() - started
+                progress(stats["imported"], stats["imported"] / elapsed if elapsed else 0.0)
+
+
+# --- 🖥️ CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import journal entries into Qdrant.")
+    parser.add_argument("path", nargs="?", help="Export file (.jsonl, .csv or .md)")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--chunk-size", type=int, default=256, help="Entries per Qdrant upsert")
+    parser.add_argument("--embed-batch", type=int, default=64, help="Texts per embeddings request")
+    parser.add_argument("--in-flight", type=int, default=4, help="Max chunks processed concurrently")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <path>.checkpoint.json)")
+    parser.add_argument("--claim-unowned", action="store_true",
+                        help="Give entries without a user_id to --user-id (needed since search is per user)")
+    parser.add_argument("--backfill-ts", action="store_true",
+                        help="Add the numeric `ts` to entries stored before time-filtered search")
+    parser.add_argument("--backfill-hashes", action="store_true",
+                        help="Add `content_hash` to entries stored before dedup (done before every import anyway)")
+    args = parser.parse_args(argv)
+    if not args.path and not args.claim_unowned and not args.backfill_ts and not args.backfill_hashes:
+        parser.error("nothing to do: pass an export file, --claim-unowned, --backfill-ts and/or --backfill-hashes")
+
+    qdrant_client = QdrantClient(url=QDRANT_URL, api_key=os.getenv("QDRANT_API_KEY"), prefer_grpc=False)
+    if args.claim_unowned:
+        assign_unowned_entries(qdrant_client, COLLECTION_NAME, args.user_id)
+        print(f"👤 Unowned entries assigned to {args.user_id}", file=sys.stderr)
+    if args.backfill_ts:
+        updated, unparseable = backfill_timestamps(qdrant_client, COLLECTION_NAME)
+        print(f"🗓️ ts added to {updated} entries ({unparseable} without a parseable timestamp)", file=sys.stderr)
+    if args.backfill_hashes or args.path:
+        # otherwise entries from older imports (random IDs, no hash) would be stored a second time
+        updated = backfill_content_hashes(qdrant_client, COLLECTION_NAME)
+        print(f"🧹 content_hash added to {updated} entries", file=sys.stderr)
+    if not args.path:
+        return
+
+    openai_client = OpenAI()
+    embedding_model, storage = from_collection_metadata(get_collection_metadata(qdrant_client, COLLECTION_NAME))
+    embed_many = make_openai_embedder(openai_client, embedding_model, storage)
+    dual_writer = DualWriter(qdrant_client, lambda model, config: make_embedder(openai_client, model, config))
+
+    def progress(done, rate):
+        print(f"\r📥 {done} entries imported ({rate:.1f} entries/s)", end="", file=sys.stderr)
+
+    stats = import_entries(
+        read_entries(args.path),
+        user_id=args.user_id,
+        qdrant_client=qdrant_client,
+        embed_many=embed_many,
+        chunk_size=args.chunk_size,
+        embed_batch_size=args.embed_batch,
+        max_in_flight=args.in_flight,
+        checkpoint_path=args.checkpoint or args.path + ".checkpoint.json",
+        progress=progress,
+        embedding_model=embedding_model,
+        storage=storage,
+        dual_writer=dual_writer,
+    )
+    print(file=sys.stderr)
+    print(json.dumps({**stats, "dedup": get_dedup_report().summary()}))
+
+
+if __name__ == "__main__":
+    main()
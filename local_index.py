@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from qdrant_client.http import models as qdrant_models
+
+from qdrant_schema import TIMESTAMP_FIELD, user_filter
+
+# 🪞 Local read replica
+# A single user's journal is a few thousand vectors, so instead of a network
+# round-trip per search we keep a copy on disk as a memory-mapped NumPy matrix
+# (rows L2-normalized, so cosine similarity is one matrix-vector product).
+# Remote Qdrant stays the source of truth; the replica only ever reads from it.
+# A sync lists the user's point IDs only (no payloads, no vectors) to see what
+# was added or deleted, and fetches payloads + vectors just for points with
+# `ts` >= the newest one it already has, plus IDs it has never seen (imports
+# with old dates). Payload-only changes (e.g. a `ts` backfill) are picked up by
+# a full re-read at most every FULL_SYNC_SECONDS.
+
+DEFAULT_REPLICA_DIR = os.getenv(
+    "LOCAL_REPLICA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "replicas"),
+)
+DEFAULT_SYNC_SECONDS = 60
+FULL_SYNC_SECONDS = 3600
+SCROLL_PAGE = 1000
+
+
+class LocalReplica:
+    """ Memory-mapped copy of one user's points with brute-force cosine top-k. """
+
+    def __init__(self, qdrant_client, collection_name, user_id, directory=DEFAULT_REPLICA_DIR, dtype="float32"):
+        self.qdrant = qdrant_client
+        self.collection_name = collection_name
+        self.user_id = user_id
+        self.dtype = np.dtype(dtype)
+        name = hashlib.sha256(f"{collection_name}:{user_id}".encode("utf-8")).hexdigest()[:16]
+        self.matrix_path = os.path.join(directory, f"{name}.{self.dtype.name}")
+        self.meta_path = os.path.join(directory, f"{name}.json")
+        os.makedirs(directory, exist_ok=True)
+
+        self.ids = []
+        self.payloads = []
+        self.last_ts = None  # newest `ts` in the replica: later syncs fetch from there
+        self._ts = None
+        self.matrix = None
+        self.synced_at = None
+        self.full_synced_at = None
+        self.stats = {"syncs": 0, "full_syncs": 0, "fetched": 0, "removed": 0}
+        self._lock = threading.Lock()
+        self._syncing = False
+        self._load()
+
+    # --- persistence ---
+    def _load(self):
+        if not (os.path.exists(self.meta_path) and os.path.exists(self.matrix_path)):
+            return
+        with open(self.meta_path, encoding="utf-8") as file:
+            meta = json.load(file)
+        self.ids, self.payloads, self.last_ts = meta["ids"], meta["payloads"], meta.get("last_ts")
+        if self.ids:
+            self.matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode="r", shape=tuple(meta["shape"]))
+
+    def _save(self, ids, payloads, last_ts, matrix):
+        tmp_matrix, tmp_meta = self.matrix_path + ".tmp", self.meta_path + ".tmp"
+        matrix.astype(self.dtype).tofile(tmp_matrix)
+        with open(tmp_meta, "w", encoding="utf-8") as file:
+            json.dump({"ids": ids, "payloads": payloads, "last_ts": last_ts, "shape": list(matrix.shape)}, file)
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_meta, self.meta_path)
+
+    # --- sync ---
+    def _scroll(self, scroll_filter, with_payload, with_vectors):
+        offset = None
+        while True:
+            points, offset = self.qdrant.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
+                limit=SCROLL_PAGE,
+                offset=offset,
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+            )
+            yield from points
+            if offset is None:
+                return
+
+    def _changed_since(self, ts):
+        """ The user's points with `ts` >= ts (same-second writes included), with payloads and vectors. """
+        scroll_filter = user_filter(self.user_id)
+        scroll_filter.must.append(
+            qdrant_models.FieldCondition(key=TIMESTAMP_FIELD, range=qdrant_models.Range(gte=ts))
+        )
+        return self._scroll(scroll_filter, with_payload=True, with_vectors=True)
+
+    def sync(self, full=None):
+        """
+        Incremental: an ID-only scroll finds new and deleted points; payloads and
+        vectors are fetched only for points with `ts` >= last_ts and for new IDs.
+        `full=True` (default: when the last full sync is over FULL_SYNC_SECONDS
+        old) re-reads everything, which also catches payload-only updates.
+        """
+        if full is None:
+            full = self.full_synced_at is None or time.time() - self.full_synced_at > FULL_SYNC_SECONDS
+        with self._lock:
+            known = {str(point_id): i for i, point_id in enumerate(self.ids)}
+            last_ts = self.last_ts
+
+        fetched = {}
+        if full or last_ts is None:
+            remote = {}
+            for point in self._scroll(user_filter(self.user_id), with_payload=True, with_vectors=True):
+                remote[str(point.id)] = point.id
+                fetched[str(point.id)] = point
+        else:
+            remote = {
+                str(point.id): point.id
+                for point in self._scroll(user_filter(self.user_id), with_payload=False, with_vectors=False)
+            }
+            fetched = {str(point.id): point for point in self._changed_since(last_ts)}
+            unseen = [point_id for key, point_id in remote.items() if key not in known and key not in fetched]
+            for start in range(0, len(unseen), SCROLL_PAGE):
+                for point in self.qdrant.retrieve(
+                    collection_name=self.collection_name,
+                    ids=unseen[start:start + SCROLL_PAGE],
+                    with_payload=True,
+                    with_vectors=True,
+                ):
+                    fetched[str(point.id)] = point
+
+        with self._lock:
+            removed = len(set(known) - set(remote))
+            self.stats["syncs"] += 1
+            self.stats["full_syncs"] += full or last_ts is None
+            self.stats["fetched"] += len(fetched)
+            self.stats["removed"] += removed
+            self.synced_at = time.time()
+            if full or last_ts is None:
+                self.full_synced_at = self.synced_at
+            if not fetched and not removed and len(known) == len(remote):
+                return  # nothing changed, keep the current mapping
+
+            ids, payloads, rows = [], [], []
+            for key, point_id in remote.items():
+                if key in fetched:
+                    vector, payload = np.asarray(fetched[key].vector, dtype=np.float32), fetched[key].payload or {}
+                elif key in known and self.matrix is not None:
+                    vector, payload = np.asarray(self.matrix[known[key]], dtype=np.float32), self.payloads[known[key]]
+                else:
+                    continue  # deleted between the ID scroll and the fetch
+                norm = np.linalg.norm(vector)
+                rows.append(vector / norm if norm else vector)
+                ids.append(point_id)
+                payloads.append(payload)
+            timestamps = [payload[TIMESTAMP_FIELD] for payload in payloads if TIMESTAMP_FIELD in payload]
+            last_ts = max(timestamps, default=last_ts)
+
+            self.matrix = None  # release the old mapping before replacing the file
+            if rows:
+                self._save(ids, payloads, last_ts, np.vstack(rows))
+                self.matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode="r", shape=(len(rows), len(rows[0])))
+            else:
+                self._save([], [], last_ts, np.zeros((0, 0), dtype=np.float32))
+            self.ids, self.payloads, self.last_ts = ids, payloads, last_ts
+            self._ts = None
+
+    def maybe_sync(self, max_age=DEFAULT_SYNC_SECONDS):
+        """ Blocking sync the first time; afterwards refreshes in the background when stale. """
+        if self.synced_at is None:
+            self.sync()
+            return
+        if time.time() - self.synced_at < max_age or self._syncing:
+            return
+        self._syncing = True
+
+        def run():
+            try:
+                self.sync()
+            finally:
+                self._syncing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def invalidate(self):
+        """ Something was written for this user: the next search syncs first (blocking). """
+        self.synced_at = None
+
+    # --- search ---
+    def _ts_array(self):
+        """ `ts` per row (-1 if missing), rebuilt only when the rows change. """
+        if self._ts is None or len(self._ts) != len(self.payloads):
+            self._ts = np.array([payload.get(TIMESTAMP_FIELD, -1) for payload in self.payloads], dtype=np.int64)
+        return self._ts
+
+    def search(self, query_vector, top_k=5, time_range=None, with_vectors=False):
+        """
+        Cosine top-k, optionally only rows whose `ts` is within `time_range` (same
+        semantics as qdrant_schema.user_filter). Returns Qdrant `ScoredPoint`s so
+        callers don't care where results came from; `with_vectors` adds the
+        (normalized) row, for re-ranking.
+        """
+        with self._lock:
+            if self.matrix is None or not self.ids:
+                return []
+            query = np.asarray(query_vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm:
+                query = query / norm
+            scores = self.matrix @ query.astype(self.dtype)
+            if time_range is not None:
+                ts = self._ts_array()
+                outside = (ts < int(time_range[0].timestamp())) | (ts >= int(time_range[1].timestamp()))
+                scores = np.where(outside, -np.inf, scores)
+            k = min(top_k, len(self.ids))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                qdrant_models.ScoredPoint(
+                    id=self.ids[i], version=0, score=float(scores[i]), payload=self.payloads[i],
+                    vector=np.asarray(self.matrix[i], dtype=np.float32).tolist() if with_vectors else None,
+                )
+                for i in top
+                if scores[i] > -np.inf
+            ]
+
+    def summary(self) -> dict:
+        return {
+            **self.stats,
+            "points": len(self.ids),
+            "dtype": self.dtype.name,
+            "synced_s_ago": round(time.time() - self.synced_at, 1) if self.synced_at else None,
+        }
+
+
+class ReplicaRegistry:
+    """ One replica per (collection, user), shared by all sessions in the process. """
+
+    def __init__(self, qdrant_client, collection_name, directory=DEFAULT_REPLICA_DIR, dtype="float32"):
+        self.qdrant = qdrant_client
+        self.collection_name = collection_name
+        self.directory = directory
+        self.dtype = dtype
+        self._replicas = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id) -> LocalReplica:
+        with self._lock:
+            if user_id not in self._replicas:
+                self._replicas[user_id] = LocalReplica(
+                    self.qdrant, self.collection_name, user_id, self.directory, self.dtype
+                )
+            return self._replicas[user_id]
@@ -0,0 +1,395 @@
+"""
+🔁 Re-embedding migration
+
+Moves the journal to a new embedding model / vector size without downtime:
+  1. creates a versioned collection (journal_entries_v2, _v3, ...) laid out for
+     the new model, with the model recorded in its metadata
+  2. marks the live collection `migrating_to` it, so the apps dual-write every
+     new or edited entry to both collections (DualWriter)
+  3. streams the live points with `scroll` (payload only, no vectors) and
+     re-embeds their text in throttled batches; the scroll offset is
+     checkpointed after every batch, so a crashed run resumes where it stopped
+  4. catch-up pass: anything written, edited or deleted while copying that the
+     copy missed is re-synced (payloads only, cheap)
+  5. re-points the alias the apps use to the new collection in one atomic request
+
+The old collection is left in place: roll back with `--rollback`, drop it by
+hand once nothing points at it.
+
+Usage:
+    python migration.py --model text-embedding-3-large --dimensions 1024
+    python migration.py --model text-embedding-3-small --dimensions 512 --mode scalar --batches-per-minute 30
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from qdrant_client.http import models as qdrant_models
+
+from admission import TokenBucket
+from embedding_cache import get_embedding_cache
+from qdrant_schema import (
+    JOURNAL_ALIAS, ensure_collection, ensure_payload_indexes, get_collection_metadata, resolve_alias, swap_alias,
+)
+from storage_modes import (
+    STORAGE_MODES, StorageConfig, collection_metadata, from_collection_metadata, make_openai_embedder,
+)
+
+MIGRATING_TO = "migrating_to"  # metadata key on the live collection while a migration runs
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+CHECK_SECONDS = 30  # how often the apps look for a running migration
+
+
+def point_text(payload):
+    """ The text a point's vector was made from: passage `text`, or title + content for imported posts. """
+    payload = payload or {}
+    if payload.get("text"):
+        return payload["text"]
+    return "\n\n".join(part for part in (payload.get("title"), payload.get("content")) if part)
+
+
+def next_collection_name(qdrant_client, source):
+    """ journal_entries -> journal_entries_v2 -> journal_entries_v3 ... (first name not taken). """
+    base = re.sub(r"_v\d+$", "", source)
+    version = int(re.search(r"_v(\d+)$", source).group(1)) + 1 if re.search(r"_v(\d+)$", source) else 2
+    while qdrant_client.collection_exists(f"{base}_v{version}"):
+        version += 1
+    return f"{base}_v{version}"
+
+
+def reembed(records, embed_many):
+    """ PointStructs with fresh vectors for `records` (same IDs and payloads). Points without text are skipped. """
+    with_text = [record for record in records if point_text(record.payload)]
+    if not with_text:
+        return [], len(records)
+    vectors = embed_many([point_text(record.payload) for record in with_text])
+    points = [
+        qdrant_models.PointStruct(id=record.id, vector=vector, payload=record.payload)
+        for record, vector in zip(with_text, vectors)
+    ]
+    return points, len(records) - len(with_text)
+
+
+def _scroll_all(qdrant_client, collection_name, scroll_filter=None, page_size=1000):
+    offset = None
+    while True:
+        records, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            scroll_filter=scroll_filter,
+            limit=page_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        yield from records
+        if offset is None:
+            return
+
+
+def mirror_entries(qdrant_client, source, target, entry_ids, embed_many):
+    """
+    Makes `target` hold the same passage points as `source` for these entries:
+    re-embedded upserts for what exists, deletes for passages that no longer do.
+    Returns the number of points written.
+    """
+    entry_filter = qdrant_models.Filter(must=[
+        qdrant_models.FieldCondition(key="entry_id", match=qdrant_models.MatchAny(any=[str(e) for e in entry_ids]))
+    ])
+    records = list(_scroll_all(qdrant_client, source, entry_filter))
+    points, _ = reembed(records, embed_many)
+    if points:
+        qdrant_client.upsert(collection_name=target, points=points, wait=True)
+    live = {str(record.id) for record in records}
+    gone = [record.id for record in _scroll_all(qdrant_client, target, entry_filter) if str(record.id) not in live]
+    if gone:
+        qdrant_client.delete(collection_name=target, points_selector=gone, wait=True)
+    return len(points)
+
+
+def make_embedder(openai_client, embedding_model, storage, embedding_cache=None):
+    """ embed_many for a collection's model, through the shared embedding cache. """
+    embed_many = make_openai_embedder(openai_client, embedding_model, storage)
+    cache = embedding_cache or get_embedding_cache()
+    cache_model = storage.cache_model(embedding_model)
+    return lambda texts: cache.get_or_embed_many(cache_model, list(texts), embed_many)
+
+
+class DualWriter:
+    """
+    The apps' side of a running migration: after writing entries to the live
+    collection, `mirror()` copies them (re-embedded with the target's model)
+    into the collection being built. Failures are counted, not raised: the
+    migration's catch-up pass repairs whatever a mirror missed.
+    """
+
+    def __init__(self, qdrant_client, make_embed_many, check_seconds=CHECK_SECONDS):
+        self.qdrant = qdrant_client
+        self.make_embed_many = make_embed_many  # (embedding_model, storage) -> embed_many
+        self.check_seconds = check_seconds
+        self.stats = {"mirrored_entries": 0, "mirrored_points": 0, "errors": 0}
+        self.last_error = None
+        self._targets = {}  # collection -> (checked_at, target, embed_many)
+        self._lock = threading.Lock()
+
+    def target(self, collection_name):
+        """ (target collection, embed_many) if a migration away from `collection_name` is running, else None. """
+        with self._lock:
+            cached = self._targets.get(collection_name)
+            if cached and time.monotonic() - cached[0] < self.check_seconds:
+                return cached[1:] if cached[1] else None
+        target, embed_many = None, None
+        metadata = get_collection_metadata(self.qdrant, collection_name)
+        if metadata.get(MIGRATING_TO) and self.qdrant.collection_exists(metadata[MIGRATING_TO]):
+            target = metadata[MIGRATING_TO]
+            embed_many = self.make_embed_many(*from_collection_metadata(get_collection_metadata(self.qdrant, target)))
+        with self._lock:
+            self._targets[collection_name] = (time.monotonic(), target, embed_many)
+        return (target, embed_many) if target else None
+
+    def mirror(self, collection_name, entry_ids):
+        """ Returns the number of points mirrored (0 if no migration is running or it failed). """
+        try:
+            found = self.target(collection_name)
+            if found is None:
+                return 0
+            written = mirror_entries(self.qdrant, collection_name, found[0], entry_ids, found[1])
+        except Exception as exc:
+            with self._lock:
+                self.stats["errors"] += 1
+                self.last_error = exc
+            return 0
+        with self._lock:
+            self.stats["mirrored_entries"] += len(entry_ids)
+            self.stats["mirrored_points"] += written
+        return written
+
+    def summary(self) -> dict:
+        with self._lock:
+            targets = {name: target for name, (_, target, _) in self._targets.items() if target}
+            return {**self.stats, "targets": targets, "last_error": repr(self.last_error) if self.last_error else None}
+
+
+class MigrationCheckpoint:
+    """ {"source", "target", "offset", "copied", "skipped", "phase"} in a JSON file, replaced atomically. """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self.state = json.load(file)
+
+    def save(self, **changes):
+        self.state.update(changes, updated=str(datetime.datetime.now()))
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(self.state, file)
+            os.replace(tmp_path, self.path)
+
+
+class Migration:
+    def __init__(self, qdrant_client, embed_many, embedding_model, storage, alias=JOURNAL_ALIAS, target=None,
+                 batch_size=64, batches_per_minute=60, checkpoint_path=None, progress=None, clock=time.monotonic):
+        self.qdrant = qdrant_client
+        self.embed_many = embed_many
+        self.embedding_model = embedding_model
+        self.storage = storage
+        self.alias = alias
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(batches_per_minute, burst=1, clock=clock)
+        self.checkpoint = MigrationCheckpoint(checkpoint_path)
+        self.progress = progress
+        self.clock = clock
+        self.source = self.checkpoint.state.get("source")
+        self.target = target or self.checkpoint.state.get("target")
+        self.total = 0
+        self.started = None
+        self.copied_this_run = 0
+        self.stats = {"batches": 0, "throttled_s": 0.0, "caught_up": 0, "deleted": 0}
+
+    def _throttle(self):
+        wait = self.bucket.wait_time()
+        if wait:
+            self.stats["throttled_s"] += wait
+            time.sleep(wait)
+        self.bucket.try_take()
+
+    def _upsert(self, records):
+        points, skipped = reembed(records, self.embed_many)
+        if points:
+            self.qdrant.upsert(collection_name=self.target, points=points, wait=True)
+        self.stats["batches"] += 1
+        return len(points), skipped
+
+    def prepare(self):
+        """ Creates the target collection and switches dual-writes on. Idempotent (resume). """
+        live = resolve_alias(self.qdrant, self.alias)
+        if live is None:
+            raise ValueError(f"Alias {self.alias!r} doesn't exist; start the app once to create it")
+        if self.checkpoint.state.get("phase") == "swapped":
+            if live == self.target and get_collection_metadata(self.qdrant, live) == collection_metadata(
+                    self.embedding_model, self.storage):
+                return  # this migration already finished
+            self.checkpoint.state, self.source, self.target = {}, None, None  # the next migration starts from here
+        self.source = self.source or live
+        if live != self.source:
+            raise ValueError(f"Checkpoint is for {self.source!r} but {self.alias!r} points to {live!r}")
+        self.target = self.target or next_collection_name(self.qdrant, self.source)
+        if self.target == self.source:
+            raise ValueError("Target and source are the same collection")
+        ensure_collection(self.qdrant, self.target, self.storage,
+                          metadata=collection_metadata(self.embedding_model, self.storage))
+        ensure_payload_indexes(self.qdrant, self.target)
+        self.qdrant.update_collection(collection_name=self.source, metadata={MIGRATING_TO: self.target})
+        if not self.checkpoint.state.get("phase"):
+            self.checkpoint.save(source=self.source, target=self.target, offset=None, copied=0, skipped=0,
+                                 phase="copying")
+
+    def copy(self):
+        """ Scroll + re-embed + upsert, one throttled batch at a time, checkpointed after each. """
+        state = self.checkpoint.state
+        if state.get("phase") != "copying":
+            return
+        self.total = self.qdrant.count(collection_name=self.source, exact=True).count
+        self.started = self.clock()
+        offset = state.get("offset")
+        while True:
+            self._throttle()
+            records, offset = self.qdrant.scroll(
+                collection_name=self.source,
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            copied, skipped = self._upsert(records) if records else (0, 0)
+            self.copied_this_run += copied + skipped
+            self.checkpoint.save(offset=offset, copied=state["copied"] + copied, skipped=state["skipped"] + skipped,
+                                 phase="copying" if offset is not None else "catching_up")
+            if self.progress:
+                self.progress(self.report())
+            if offset is None:
+                return
+
+    def catch_up(self):
+        """
+        Compares payloads on both sides (no vectors): points that changed or
+        appeared after the copy passed them are re-embedded, points deleted from
+        the source are deleted from the target.
+        """
+        if self.checkpoint.state.get("phase") != "catching_up":
+            return
+        target_payloads = {str(record.id): record.payload for record in _scroll_all(self.qdrant, self.target)}
+        stale, live_ids = [], set()
+        for record in _scroll_all(self.qdrant, self.source):
+            live_ids.add(str(record.id))
+            if target_payloads.get(str(record.id)) != record.payload and point_text(record.payload):
+                stale.append(record)
+        for start in range(0, len(stale), self.batch_size):
+            self._throttle()
+            copied, _ = self._upsert(stale[start:start + self.batch_size])
+            self.stats["caught_up"] += copied
+        gone = [point_id for point_id in target_payloads if point_id not in live_ids]
+        if gone:
+            self.qdrant.delete(collection_name=self.target, points_selector=gone, wait=True)
+        self.stats["deleted"] = len(gone)
+        self.checkpoint.save(phase="ready")
+
+    def swap(self):
+        """ Atomically re-points the alias. Writers still on the old collection keep mirroring into the new one. """
+        if self.checkpoint.state.get("phase") != "ready":
+            return
+        swap_alias(self.qdrant, self.alias, self.target)
+        self.checkpoint.save(phase="swapped", swapped_at=str(datetime.datetime.now()))
+
+    def run(self, swap=True):
+        self.prepare()
+        self.copy()
+        self.catch_up()
+        if swap:
+            self.swap()
+        return self.report()
+
+    def report(self) -> dict:
+        state = self.checkpoint.state
+        elapsed = self.clock() - self.started if self.started is not None else 0.0
+        rate = self.copied_this_run / elapsed if elapsed > 0 else 0.0
+        done = state.get("copied", 0) + state.get("skipped", 0)
+        remaining = max(self.total - done, 0)
+        return {
+            "source": self.source,
+            "target": self.target,
+            "phase": state.get("phase"),
+            "copied": state.get("copied", 0),
+            "skipped": state.get("skipped", 0),
+            "total": self.total,
+            "points_per_s": round(rate, 1),
+            "eta_s": round(remaining / rate, 1) if rate else None,
+            **{name: round(value, 2) if isinstance(value, float) else value for name, value in self.stats.items()},
+        }
+
+
+def rollback(qdrant_client, alias, previous):
+    """ Points the alias back at the previous collection, which stops mirroring from it. """
+    swap_alias(qdrant_client, alias, previous)
+    qdrant_client.update_collection(collection_name=previous, metadata={MIGRATING_TO: None})
+
+
+# --- 🖥️ CLI ---
+def main(argv=None):
+    from openai import OpenAI
+    from qdrant_client import QdrantClient
+    from journal_import import QDRANT_URL
+
+    parser = argparse.ArgumentParser(description="Re-embed the journal into a new collection and swap the alias.")
+    parser.add_argument("--model", required=True, help="Embedding model for the new collection")
+    parser.add_argument("--dimensions", type=int, required=True, help="Vector size for the new collection")
+    parser.add_argument("--mode", choices=STORAGE_MODES, default="full", help="Storage mode (storage_modes.py)")
+    parser.add_argument("--alias", default=JOURNAL_ALIAS)
+    parser.add_argument("--target", help="Target collection name (default: next _vN)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Points per embeddings request")
+    parser.add_argument("--batches-per-minute", type=float, default=60, help="Throttle for embeddings requests")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: .cache/migration-<alias>.json)")
+    parser.add_argument("--no-swap", action="store_true", help="Copy and catch up, but leave the alias alone")
+    parser.add_argument("--rollback", metavar="COLLECTION", help="Point the alias back at COLLECTION and exit")
+    args = parser.parse_args(argv)
+
+    qdrant_client = QdrantClient(url=QDRANT_URL, api_key=os.getenv("QDRANT_API_KEY"), prefer_grpc=False)
+    if args.rollback:
+        rollback(qdrant_client, args.alias, args.rollback)
+        print(f"↩️ {args.alias} -> {args.rollback}", file=sys.stderr)
+        return
+
+    storage = StorageConfig(args.mode, args.dimensions)
+
+    def progress(report):
+        eta = f"{report['eta_s']:.0f} s" if report["eta_s"] is not None else "?"
+        print(f"\r🔁 {report['copied'] + report['skipped']}/{report['total']} points "
+              f"({report['points_per_s']:.1f} points/s, ETA {eta})", end="", file=sys.stderr)
+
+    migration = Migration(
+        qdrant_client,
+        embed_many=make_embedder(OpenAI(), args.model, storage),
+        embedding_model=args.model,
+        storage=storage,
+        alias=args.alias,
+        target=args.target,
+        batch_size=args.batch_size,
+        batches_per_minute=args.batches_per_minute,
+        checkpoint_path=args.checkpoint or os.path.join(DEFAULT_CHECKPOINT_DIR, f"migration-{args.alias}.json"),
+        progress=progress,
+    )
+    report = migration.run(swap=not args.no_swap)
+    print(file=sys.stderr)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
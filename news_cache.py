@@ -0,0 +1,273 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# 🗞️ Stale-while-revalidate cache for news_cache.json
+# When the cache expired, every session that loaded the page at that moment
+# regenerated the whole news set and raced to json.dump into the same file.
+# Now:
+#   - one worker refreshes, guarded by a lease file (created with O_EXCL, carries
+#     an expiry so a crashed worker can't block refreshes forever). An expired
+#     lease is renamed aside before it's deleted, so two workers breaking it at
+#     once can't delete the fresh lease one of them just took; a worker only ever
+#     releases its own lease
+#   - everyone else keeps getting the stale copy while the refresh runs in the
+#     background; only a completely cold cache makes readers wait
+#   - writes go to a temp file in the same directory and are renamed into place,
+#     so readers never see half a file
+#   - the parsed JSON is kept in memory and only re-read when the file's mtime changes
+#   - a progressive (cold) build commits every finished piece to a draft file, so a
+#     crash halfway only costs the pieces that weren't done yet
+#   - a set with failed pieces ("failed" in the generated dict) is shown but never
+#     written: the draft stays, and the next refresh retries only those pieces
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_LEASE_SECONDS = 600  # longer than any sane regeneration
+POLL_SECONDS = 0.5
+
+
+def atomic_write_json(path, data):
+    """ Writes JSON to a temp file next to `path`, then renames it over `path`. """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class Lease:
+    """ Cross-process "only one of us" via an O_EXCL lock file with an owner and an expiry inside. """
+
+    def __init__(self, path, seconds=DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.seconds = seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquire(self) -> bool:
+        for _ in range(2):  # second attempt after breaking an expired lease
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._break_if_expired():
+                    return False
+                continue
+            with os.fdopen(fd, "w") as file:
+                json.dump({"owner": self.owner, "expires": time.time() + self.seconds}, file)
+            return True
+        return False
+
+    def _read(self, path):
+        """ (owner, expires) of a lease file; None if it's gone. """
+        try:
+            with open(path) as file:
+                lease = json.load(file)
+            return lease.get("owner"), lease.get("expires", 0)
+        except (OSError, ValueError):
+            # Being written right now, or garbage: only expired once it's old.
+            try:
+                return None, os.path.getmtime(path) + self.seconds
+            except OSError:
+                return None  # already gone
+
+    def _break_if_expired(self) -> bool:
+        lease = self._read(self.path)
+        if lease is None:
+            return True
+        if lease[1] > time.time():
+            return False
+        # Rename first: if another worker broke it and took a fresh lease since we
+        # read it, we've moved *that* one aside, and put it back instead of deleting it.
+        aside = f"{self.path}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(self.path, aside)
+        except FileNotFoundError:
+            return True
+        moved = self._read(aside)
+        try:
+            if moved is not None and moved[1] > time.time():
+                try:
+                    os.link(aside, self.path)  # back in place, unless yet another lease exists by now
+                except OSError:
+                    pass
+                return False
+            return True
+        finally:
+            try:
+                os.remove(aside)
+            except FileNotFoundError:
+                pass
+
+    def release(self):
+        """ Removes the lease file if it is still ours (it may have expired and been taken over). """
+        lease = self._read(self.path)
+        if lease is None or lease[0] != self.owner:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class NewsDraft:
+    """ Pieces of a news set being built: {"started", "headline", "prompts", "articles": {i: text}, "images": {i: image}}. """
+
+    def __init__(self, path, max_age):
+        self.path = path
+        self.max_age = max_age
+
+    def load(self):
+        """ The draft if there is a recent one, with integer piece indexes. """
+        try:
+            with open(self.path) as file:
+                draft = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if time.time() - draft.get("started", 0) > self.max_age.total_seconds():
+            return None
+        for key in ("articles", "images"):
+            draft[key] = {int(i): piece for i, piece in draft.get(key, {}).items()}
+        return draft
+
+    def start(self, headline, prompts):
+        draft = {"started": time.time(), "headline": headline, "prompts": prompts, "articles": {}, "images": {}}
+        self.save(draft)
+        return draft
+
+    def save(self, draft):
+        atomic_write_json(self.path, draft)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class NewsCache:
+    def __init__(self, path, max_age=timedelta(hours=5), lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.max_age = max_age
+        self.lease = Lease(f"{path}.lock", lease_seconds)
+        self.draft = NewsDraft(f"{path}.draft", max_age)
+        self.stats = {"disk_reads": 0, "memory_hits": 0, "refreshes": 0, "refresh_errors": 0, "incomplete": 0,
+                      "stale_served": 0}
+        self.last_error = None
+        self._memory = None  # (mtime_ns, data)
+        self._refreshing = None  # background Thread
+        self._lock = threading.Lock()
+
+    def read(self):
+        """ Parsed cache file, straight from memory unless the file changed on disk. None if missing. """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._memory is not None and self._memory[0] == mtime:
+                self.stats["memory_hits"] += 1
+                return self._memory[1]
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None  # unreadable: treat as missing, the next write replaces it
+        with self._lock:
+            self._memory = (mtime, data)
+            self.stats["disk_reads"] += 1
+        return data
+
+    def is_fresh(self, data) -> bool:
+        last_updated = datetime.strptime(data["last_updated"], TIMESTAMP_FORMAT)
+        return datetime.now() - last_updated < self.max_age
+
+    def write(self, data):
+        atomic_write_json(self.path, data)
+
+    def _regenerate(self, generate):
+        """ Runs with the lease held. """
+        try:
+            data = dict(generate())
+            data["last_updated"] = datetime.now().strftime(TIMESTAMP_FORMAT)
+            if data.get("failed"):
+                # don't cache a page with holes for max_age; readers keep the stale copy
+                self.stats["incomplete"] += 1
+                self.last_error = RuntimeError(f"Incomplete news set, missing {', '.join(data['failed'])}")
+                return data
+            self.write(data)
+            self.draft.clear()
+            self.stats["refreshes"] += 1
+            return data
+        except Exception as exc:
+            self.stats["refresh_errors"] += 1
+            self.last_error = exc
+            raise
+        finally:
+            self.lease.release()
+
+    def refresh_in_background(self, generate) -> bool:
+        """ Starts a refresh unless this process or another one is already on it. """
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return False
+            if not self.lease.acquire():
+                return False
+
+            def run():
+                try:
+                    self._regenerate(generate)
+                except Exception:
+                    pass  # recorded in stats/last_error; readers keep the stale copy
+
+            self._refreshing = threading.Thread(target=run, daemon=True, name="news-refresh")
+            self._refreshing.start()
+            return True
+
+    def get(self, generate, cold=None, timeout=DEFAULT_LEASE_SECONDS):
+        """
+        Returns (data, state): "fresh", "stale" (a refresh is running somewhere)
+        or "generated" (cold cache, built in this call). `generate()` returns the
+        news dict without `last_updated`; `cold()`, if given, is used instead when
+        the caller has to wait for the build anyway (e.g. to draw it progressively).
+        """
+        data = self.read()
+        if data is not None:
+            if self.is_fresh(data):
+                return data, "fresh"
+            self.refresh_in_background(generate)
+            self.stats["stale_served"] += 1
+            return data, "stale"
+
+        # Cold: nothing to serve. One worker generates, the rest wait for its file.
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.lease.acquire():
+                data = self.read()  # somebody may have finished between our read and the lease
+                if data is not None:
+                    self.lease.release()
+                    return data, "fresh"
+                return self._regenerate(cold or generate), "generated"
+            time.sleep(POLL_SECONDS)
+            data = self.read()
+            if data is not None:
+                return data, "fresh"
+            if time.monotonic() > deadline:
+                raise TimeoutError("Timed out waiting for another worker to generate the news")
+
+    def summary(self) -> dict:
+        return {
+            **self.stats,
+            "refreshing": self._refreshing is not None and self._refreshing.is_alive(),
+            "last_error": repr(self.last_error) if self.last_error else None,
+        }
@@ -0,0 +1,202 @@
+import queue
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from resilience import get_resilience
+
+# 📰 News generation engine for streamlitNews.py
+# A cold page used to be 5 chat completions + 5 DALL-E calls back to back, and
+# the images for "Other News" were thrown away. Now every call for a page is
+# submitted to a small thread pool at once (bounded, so one page view can't fan
+# out without limit), and only the top stories - the ones that show a picture -
+# get an image. Build time goes from the sum of all calls to roughly the
+# slowest one.
+# Every call has a deadline and is retried with jittered backoff on timeouts and
+# 5xx, behind a circuit breaker (resilience.py, the "chat" and "image" policies).
+
+ARTICLE_ERROR = "Error generating article."
+MAX_PARALLEL_CALLS = 7  # a full page: up to 5 articles + 2 images, nothing queues
+TOP_STORIES = 2
+CHAT_MODEL = "gpt-4o-mini"
+IMAGE_MODEL = "dall-e-3"
+
+SYSTEM_PROMPT = "You are a satirical news writer. Roast Fredrik and don't hold back. Keep it in a real news format."
+
+PROMPTS = [
+    "Write a funny fake news article about Fredrik being announced as the second most fast leveler in World of Warcraft.",
+    "Create a hilarious news report about a secret agent finding 10,000 bottles of baby oil in Fredrik's closet.",
+    "Generate a satirical article about riots in Sweden because of Fredrik having too much luck on his rolls in WoW.",
+    "Write a satirical piece about Fredrik being mistaken for a celebrity and getting mobbed in a supermarket.",
+    "Generate a comically absurd story about Fredrik trying to smuggle a pet moose into a gaming convention."
+]
+
+HEADLINES = [
+    "Fredrik Accidentally Invents Time Travel but Only Goes Back 7 Minutes",
+    "Study Shows 98% of Fredriks Have No Idea What's Happening Right Now",
+    "Fredrik Declares Himself 'Supreme Overlord' of His Apartment",
+    "Local Authorities Confused After Every Street in Town Renamed to 'Fredrik Road'",
+    "Breaking: Fredrik Discovers New Species of Fish Inside His Own Fridge",
+]
+
+
+def generate_headline():
+    return random.choice(HEADLINES)
+
+
+def pick_prompts():
+    """ 3-5 random article prompts; the first TOP_STORIES become top stories. """
+    return random.sample(PROMPTS, random.randint(3, 5))
+
+
+def stream_article(client, prompt):
+    """ Yields the article text so far as it streams in. """
+    stream = get_resilience().call("chat", lambda timeout: client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        stream=True,
+        timeout=timeout,
+    ))  # retried until the stream opens, not halfway through an article
+    text = ""
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            text += chunk.choices[0].delta.content
+            yield text
+
+
+def draw_image(client, prompt, image_store=None):
+    """
+    🎨 DALL-E image for a top story; raises if generation failed. With an image
+    store: downloaded right away and returned as a local reference (image_store.py),
+    the temporary URL only as a fallback if the download fails.
+    """
+    response = get_resilience().call("image", lambda timeout: client.images.generate(
+        model=IMAGE_MODEL,
+        prompt=f"A hilarious satirical news image illustrating: {prompt}",
+        size="1024x1024",
+        timeout=timeout,
+    ))
+    url = response.data[0].url if response and response.data else None
+    if not url:
+        raise ValueError("Image generation returned no image")
+    if image_store is not None:
+        try:
+            return image_store.put_url(url)
+        except Exception:
+            return url
+    return url
+
+
+def image_digests(news):
+    """ sha256 of every stored image a news set references (to keep them when pruning). """
+    return [image["sha256"] for _, image in news.get("top_articles", []) if isinstance(image, dict)]
+
+
+# 🌊 Progressive generation
+# Same pool, but instead of one result at the end the caller gets events as
+# pieces land, so the page can draw each story while it's being written:
+#   ("text", i, text_so_far)   article i is streaming (throttled)
+#   ("article", i, text)       article i is finished
+#   ("image", i, image)        top story i's image is ready (reference or URL)
+#   ("failed", i, piece)       "article" or "image" i failed (or the stream broke off)
+# Pieces passed in `done` (e.g. from a draft left by a crashed build) are
+# re-emitted right away instead of generated again; failed pieces never end up
+# there, so the next build retries exactly those.
+
+TEXT_EVENT_INTERVAL = 0.1  # seconds between "text" events per article
+
+
+def stream_news(client, prompts, top_stories=TOP_STORIES, max_workers=MAX_PARALLEL_CALLS, image_store=None,
+                done=None):
+    done = done or {}
+    done_articles, done_images = done.get("articles", {}), done.get("images", {})
+    events = queue.Queue()
+
+    def write(i, prompt):
+        last_emit = 0.0
+        text = ""
+        try:
+            for text in stream_article(client, prompt):
+                now = time.perf_counter()
+                if now - last_emit >= TEXT_EVENT_INTERVAL:
+                    events.put(("text", i, text))
+                    last_emit = now
+        except Exception:
+            text = ""  # cut off halfway: not an article
+        events.put(("article", i, text) if text else ("failed", i, "article"))
+
+    def draw(i, prompt):
+        try:
+            events.put(("image", i, draw_image(client, prompt, image_store)))
+        except Exception:
+            events.put(("failed", i, "image"))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="news") as pool:
+        futures = []
+        for i, prompt in enumerate(prompts[:top_stories]):
+            if i in done_images:
+                events.put(("image", i, done_images[i]))
+            else:
+                futures.append(pool.submit(draw, i, prompt))
+        for i, prompt in enumerate(prompts):
+            if i in done_articles:
+                events.put(("article", i, done_articles[i]))
+            else:
+                futures.append(pool.submit(write, i, prompt))
+
+        expected = min(top_stories, len(prompts)) + len(prompts)
+        finished = 0
+        while finished < expected:
+            event = events.get()
+            if event[0] != "text":
+                finished += 1
+            yield event
+
+
+def build_news(client, draft_store, image_store=None, on_event=None, prompts=None):
+    """
+    Progressive build that commits every finished piece to `draft_store`
+    (news_cache.NewsDraft) and resumes from a recent draft if one exists.
+    `on_event(event, draft)` is called with ("start", None, None) once the
+    headline and prompts are known, then for every event, e.g. to draw it.
+    Returns {"headline", "top_articles": [[article, image], ...], "other_articles": [...],
+    "build_seconds", "build": time-to-first-content numbers, "failed": the pieces
+    that didn't make it, e.g. ["article 3", "image 0"]}, where image is an
+    image-store reference, a URL, or None.
+    Those stay out of the draft, so the next build only retries them.
+    """
+    started = time.perf_counter()
+    draft = draft_store.load() or draft_store.start(generate_headline(), prompts or pick_prompts())
+    prompts = draft["prompts"]
+    timings = {"resumed_pieces": len(draft["articles"]) + len(draft["images"])}
+    failed = []
+    if on_event is not None:
+        on_event(("start", None, None), draft)
+
+    for event in stream_news(client, prompts, image_store=image_store,
+                             done={"articles": draft["articles"], "images": draft["images"]}):
+        kind, i, value = event
+        timings.setdefault(f"first_{kind}_s", round(time.perf_counter() - started, 2))
+        if kind == "article" and draft["articles"].get(i) != value:
+            draft["articles"][i] = value
+            draft_store.save(draft)
+        elif kind == "image" and i not in draft["images"]:
+            draft["images"][i] = value
+            draft_store.save(draft)
+        elif kind == "failed":
+            failed.append(f"{value} {i}")
+        if on_event is not None:
+            on_event(event, draft)
+
+    top = min(TOP_STORIES, len(prompts))
+    return {
+        "headline": draft["headline"],
+        "top_articles": [[draft["articles"].get(i, ARTICLE_ERROR), draft["images"].get(i)] for i in range(top)],
+        "other_articles": [draft["articles"].get(i, ARTICLE_ERROR) for i in range(top, len(prompts))],
+        "build_seconds": round(time.perf_counter() - started, 2),
+        "build": timings,
+        "failed": sorted(failed),
+    }
@@ -3,6 +3,9 @@ import requests
 from openai import OpenAI
 from datetime import datetime
 import json
+import uuid
+from admission import AdmissionRejected, get_admission_controller
+from conversation_memory import ConversationMemory, make_openai_summarizer
 
 # 🚀 Titel och beskrivning
 st.title("🐷 Piglet")
@@ -23,6 +26,8 @@ assistant_type = st.sidebar.text_area(
     height=150
 )
 
+HISTORY_VISIBLE = 20  # meddelanden som ritas vid varje rerun, äldre bakom en kryssruta
+
 # 🔑 Modellval med lösenordsskydd
 basic_models = ["gpt-3.5-turbo", "gpt-4-turbo"]
 advanced_models = ["gpt-4o", "gpt-4o-mini", "o1", "o3-mini"]
@@ -54,15 +59,12 @@ with st.sidebar.expander("ℹ️ Modellinformation"):
         """
     )
 
-# 🚨 Rate Limiting (gäller endast för användare utan avancerad åtkomst)
-if "request_count" not in st.session_state:
-    st.session_state.request_count = 0
-
-st.session_state.request_count += 1
-
-if not st.session_state.advanced_access and st.session_state.request_count > 8:
-    st.error("🚨 För många förfrågningar! Försök igen senare.")
-    st.stop()
+# 🚨 Rate Limiting: en gemensam grindvakt för hela processen (se admission.py).
+# Räknar riktiga anrop per session och modell, begränsar samtidiga strömmar och köar rättvist.
+admission = get_admission_controller()
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+rate_tier = "advanced" if st.session_state.advanced_access else "basic"
 
 # 🚀 Chattbot-logik
 if not openai_api_key:
@@ -79,32 +81,61 @@ else:
     system_message = {"role": "system", "content": assistant_type}
 
     # 🔄 Initiera chatt-session
-    if "messages" not in st.session_state or st.session_state.get("last_assistant_type") != assistant_type:
-        st.session_state.messages = [system_message] # Lägg till systemmeddelande
+    # Minnet skickar systemmeddelande + sammanfattning + senaste turerna inom en token-budget,
+    # äldre turer sammanfattas i bakgrunden (se conversation_memory.py).
+    if "memory" not in st.session_state or st.session_state.get("last_assistant_type") != assistant_type:
+        st.session_state.memory = ConversationMemory(make_openai_summarizer(client, st.session_state.session_id))
         st.session_state.last_assistant_type = assistant_type # Spara senaste assistenttyp
+    memory = st.session_state.memory
 
-    # 📜 Visa tidigare meddelanden (dölj systemmeddelandet)
-    for message in st.session_state.messages: # Loopa genom meddelanden
-        if message["role"] != "system": # Visa inte systemmeddelandet
-            avatar = avatar_user if message["role"] == "user" else avatar_assistant # Välj avatar
-            with st.chat_message(message["role"], avatar=avatar): # Skapa chattmeddelande
-                st.markdown(f"<p style='font-size:22px'>{message['content']}</p>", unsafe_allow_html=True) # Visa meddelandet
+    def show_message(message):
+        avatar = avatar_user if message["role"] == "user" else avatar_assistant # Välj avatar
+        with st.chat_message(message["role"], avatar=avatar): # Skapa chattmeddelande
+            st.markdown(f"<p style='font-size:22px'>{message['content']}</p>", unsafe_allow_html=True) # Visa meddelandet
+
+    # 📜 Visa tidigare meddelanden: bara de senaste ritas om vid varje rerun
+    older = len(memory.messages) - HISTORY_VISIBLE
+    if older > 0 and st.checkbox(f"📜 Visa {older} äldre meddelanden"):
+        for message in memory.messages[:older]:
+            show_message(message)
+    for message in memory.messages[max(older, 0):]:
+        show_message(message)
 
     # ✍️ Användarens inmatning
     if prompt := st.chat_input("Vad vill du?"): # Användaren skriver något
-        st.session_state.messages.append({"role": "user", "content": prompt}) # Spara användarens meddelande
+        memory.add("user", prompt) # Spara användarens meddelande
         with st.chat_message("user", avatar=avatar_user): # Visa användarens meddelande i chatten
             st.markdown(prompt)
-        # 🤖 Generera AI-svar
-        stream = client.chat.completions.create(
-            model=selected_model,
-            messages=st.session_state.messages,
-            stream=True,
-        )
-
-        # 💬 Visa AI-svar
+        # 🤖 Generera AI-svar (när grindvakten släpper in oss)
         with st.chat_message("assistant", avatar=avatar_assistant):
-            response = st.write_stream(stream)
-
-        # 💾 Spara AI-svar
-        st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
+            queue_notice = st.empty()
+
+            def show_queue(position, waited_s):
+                queue_notice.info(f"⏳ Många chattar just nu - du är nummer {position} i kön ({waited_s:.0f} s)")
+
+            def answer():
+                stream = client.chat.completions.create(
+                    model=selected_model,
+                    messages=memory.context(system_message),
+                    stream=True,
+                )
+                queue_notice.empty()
+                return st.write_stream(stream) # 💬 Visa AI-svar
+
+            try:
+                response = admission.call(st.session_state.session_id, selected_model, answer,
+                                          tier=rate_tier, on_wait=show_queue)
+            except AdmissionRejected as exc:
+                memory.remove_last()
+                wait = f" om {exc.retry_after:.0f} s" if exc.retry_after else " senare"
+                queue_notice.error(f"🚨 För många förfrågningar! Försök igen{wait}.")
+                st.stop()
+
+        # 💾 Spara AI-svar, och vik in det som glidit ur fönstret i sammanfattningen
+        memory.add("assistant", response)
+        memory.maybe_summarize()
+
+    with st.sidebar.expander("🧠 Minne"):
+        st.write(memory.stats(system_message))
+    with st.sidebar.expander("🚦 Belastning"):
+        st.write(admission.summary())
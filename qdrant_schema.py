@@ -0,0 +1,206 @@
+import datetime
+
+from qdrant_client.http import models as qdrant_models
+
+from time_filters import parse_timestamp
+
+# 🗂️ Qdrant schema helpers shared by streamlit_app.py, JournalAI/app.py and the tools.
+# One place that knows how `journal_entries` should look: vectors + payload indexes.
+
+JOURNAL_ALIAS = "journal"  # what the apps read and write through
+INITIAL_COLLECTION = "journal_entries"  # the alias' first target (the original collection)
+USER_ID_FIELD = "user_id"
+TIMESTAMP_FIELD = "ts"  # epoch seconds next to the human-readable `timestamp` string, for range filters
+CONTENT_HASH_FIELD = "content_hash"  # sha256 of the entry's normalized text, to find an entry by content (dedup.py)
+
+
+def ensure_collection(qdrant_client, collection_name, storage, metadata=None):
+    """
+    Creates the collection if missing, laid out per `storage` (a StorageConfig:
+    vector size, quantization, on-disk originals). `metadata` records what it was
+    built with (storage_modes.collection_metadata). Returns True if it was created.
+    """
+    if qdrant_client.collection_exists(collection_name):
+        return False
+    qdrant_client.create_collection(
+        collection_name=collection_name,
+        vectors_config=storage.vectors_config(),
+        quantization_config=storage.quantization_config(),
+        metadata=metadata,
+    )
+    return True
+
+
+# 🔀 Aliases
+# The apps address the journal through an alias, never a collection name, so a
+# re-embedded copy can replace the live collection in one atomic alias switch.
+
+def resolve_alias(qdrant_client, alias):
+    """ Collection the alias points to, or None. """
+    for description in qdrant_client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def ensure_alias(qdrant_client, alias, collection_name):
+    """ Points `alias` at `collection_name` unless the alias already exists. Returns the aliased collection. """
+    current = resolve_alias(qdrant_client, alias)
+    if current is not None:
+        return current
+    qdrant_client.update_collection_aliases(change_aliases_operations=[
+        qdrant_models.CreateAliasOperation(
+            create_alias=qdrant_models.CreateAlias(collection_name=collection_name, alias_name=alias)
+        )
+    ])
+    return collection_name
+
+
+def swap_alias(qdrant_client, alias, collection_name):
+    """ Re-points `alias` in a single request: readers see the old collection or the new one, never neither. """
+    operations = []
+    if resolve_alias(qdrant_client, alias) is not None:
+        operations.append(qdrant_models.DeleteAliasOperation(delete_alias=qdrant_models.DeleteAlias(alias_name=alias)))
+    operations.append(qdrant_models.CreateAliasOperation(
+        create_alias=qdrant_models.CreateAlias(collection_name=collection_name, alias_name=alias)
+    ))
+    qdrant_client.update_collection_aliases(change_aliases_operations=operations)
+
+
+def get_collection_metadata(qdrant_client, collection_name) -> dict:
+    """ The collection's Qdrant metadata (works with an alias too). """
+    return qdrant_client.get_collection(collection_name).config.metadata or {}
+
+
+def user_id_index_schema():
+    """
+    Keyword index on `user_id`. With `is_tenant=True` (Qdrant >= 1.11) the storage
+    is co-located per tenant, so filtered HNSW search stays fast with many users.
+    Older clients don't know the flag, so we fall back to a plain keyword index.
+    """
+    try:
+        return qdrant_models.KeywordIndexParams(type="keyword", is_tenant=True)
+    except (AttributeError, TypeError, ValueError):
+        return qdrant_models.PayloadSchemaType.KEYWORD
+
+
+def timestamp_index_schema():
+    """
+    Integer range index on `ts` (no exact-match lookup needed). Older clients
+    without IntegerIndexParams get a plain integer index, which also supports ranges.
+    """
+    try:
+        return qdrant_models.IntegerIndexParams(type="integer", lookup=False, range=True)
+    except (AttributeError, TypeError, ValueError):
+        return qdrant_models.PayloadSchemaType.INTEGER
+
+
+def ensure_payload_indexes(qdrant_client, collection_name, existing_schema=None):
+    """ Creates the payload indexes we filter on, if missing. Returns the names created. """
+    if existing_schema is None:
+        existing_schema = qdrant_client.get_collection(collection_name).payload_schema or {}
+
+    created = []
+    if USER_ID_FIELD not in existing_schema:
+        qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name=USER_ID_FIELD,
+            field_schema=user_id_index_schema(),
+            wait=True,
+        )
+        created.append(USER_ID_FIELD)
+    if TIMESTAMP_FIELD not in existing_schema:
+        qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name=TIMESTAMP_FIELD,
+            field_schema=timestamp_index_schema(),
+            wait=True,
+        )
+        created.append(TIMESTAMP_FIELD)
+    if CONTENT_HASH_FIELD not in existing_schema:
+        qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name=CONTENT_HASH_FIELD,
+            field_schema=qdrant_models.PayloadSchemaType.KEYWORD,
+            wait=True,
+        )
+        created.append(CONTENT_HASH_FIELD)
+    return created
+
+
+def timestamp_payload(timestamp=None):
+    """ `timestamp` (as shown to users and the model) plus its `ts`; defaults to now. """
+    if timestamp is None:
+        timestamp = str(datetime.datetime.now())
+    payload = {"timestamp": timestamp}
+    ts = parse_timestamp(timestamp)
+    if ts is not None:
+        payload[TIMESTAMP_FIELD] = ts
+    return payload
+
+
+def time_range_condition(time_range):
+    """ `ts` within a (start, end) datetime range from time_filters.parse_time_range, end exclusive. """
+    start, end = time_range
+    return qdrant_models.FieldCondition(
+        key=TIMESTAMP_FIELD,
+        range=qdrant_models.Range(gte=int(start.timestamp()), lt=int(end.timestamp())),
+    )
+
+
+def user_filter(user_id, time_range=None):
+    """ Only this user's entries, optionally only those written within `time_range`. """
+    must = [qdrant_models.FieldCondition(key=USER_ID_FIELD, match=qdrant_models.MatchValue(value=user_id))]
+    if time_range is not None:
+        must.append(time_range_condition(time_range))
+    return qdrant_models.Filter(must=must)
+
+
+def assign_unowned_entries(qdrant_client, collection_name, user_id):
+    """
+    One-off migration: entries stored before retrieval was tenant-scoped may have
+    no `user_id` and would otherwise disappear from every user's search.
+    """
+    qdrant_client.set_payload(
+        collection_name=collection_name,
+        payload={USER_ID_FIELD: user_id},
+        points=qdrant_models.Filter(
+            must=[qdrant_models.IsEmptyCondition(is_empty=qdrant_models.PayloadField(key=USER_ID_FIELD))]
+        ),
+        wait=True,
+    )
+
+
+def backfill_timestamps(qdrant_client, collection_name, page_size=256):
+    """
+    One-off migration: gives points stored before `ts` existed a `ts` parsed from
+    their `timestamp` string, so time-filtered searches can see them.
+    Returns (updated, unparseable).
+    """
+    missing = qdrant_models.Filter(
+        must=[qdrant_models.IsEmptyCondition(is_empty=qdrant_models.PayloadField(key=TIMESTAMP_FIELD))]
+    )
+    updated, unparseable, offset = 0, 0, None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            scroll_filter=missing,
+            limit=page_size,
+            offset=offset,
+            with_payload=["timestamp"],
+            with_vectors=False,
+        )
+        by_ts = {}
+        for point in points:
+            ts = parse_timestamp((point.payload or {}).get("timestamp"))
+            if ts is None:
+                unparseable += 1
+            else:
+                by_ts.setdefault(ts, []).append(point.id)
+        for ts, ids in by_ts.items():
+            qdrant_client.set_payload(
+                collection_name=collection_name, payload={TIMESTAMP_FIELD: ts}, points=ids, wait=True
+            )
+            updated += len(ids)
+        if offset is None:
+            return updated, unparseable
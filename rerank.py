@@ -0,0 +1,121 @@
+import datetime
+import os
+
+import numpy as np
+
+from time_filters import parse_timestamp
+
+# 🎛️ Diversity re-ranking (Maximal Marginal Relevance)
+# On a journal full of similar days the top-5 by similarity are often five
+# versions of "jobbade, tränade, åt middag" - the same context five times over.
+# Instead we over-fetch `candidates` passages with their vectors and pick top_k
+# greedily: each pick maximizes
+#     λ · relevance(entry) − (1 − λ) · max similarity to the entries already picked
+# Relevance is cosine similarity to the query, optionally blended with a
+# recency decay on the entry date (half-life in days). All NumPy, one
+# matrix-vector product per pick: ~1 ms for a few hundred candidates.
+# Off by default: every candidate comes back WITH its vector (~20 KB of JSON at
+# 1536 dims), once per retrieval probe, so turning it on against a hosted
+# Qdrant costs transfer - see `response_kb` in benchmarks/rerank.py.
+
+DEFAULT_CANDIDATES = 0  # passages fetched (with vectors) before re-ranking; 0 turns re-ranking off
+DEFAULT_LAMBDA = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
+DEFAULT_RECENCY_WEIGHT = 0.2  # share of relevance that comes from recency, when a half-life is set
+
+
+class RerankConfig:
+    def __init__(self, candidates=DEFAULT_CANDIDATES, lambda_=DEFAULT_LAMBDA, half_life_days=0.0,
+                 recency_weight=DEFAULT_RECENCY_WEIGHT):
+        if not 0.0 <= lambda_ <= 1.0:
+            raise ValueError(f"lambda must be within [0, 1], got {lambda_}")
+        self.candidates = int(candidates)
+        self.lambda_ = float(lambda_)
+        self.half_life_days = float(half_life_days)
+        self.recency_weight = float(recency_weight)
+
+    @property
+    def enabled(self):
+        return self.candidates > 0
+
+    def fetch_limit(self, top_k, fanout=1):
+        """ How many points to ask the search for: `fanout` passages per entry, at least `candidates`. """
+        return max(top_k * fanout, self.candidates) if self.enabled else top_k * fanout
+
+    def describe(self) -> dict:
+        return {"candidates": self.candidates, "lambda": self.lambda_, "half_life_days": self.half_life_days or None}
+
+
+def get_rerank_config() -> RerankConfig:
+    """ From RERANK_CANDIDATES / RERANK_LAMBDA / RERANK_HALF_LIFE_DAYS. """
+    return RerankConfig(
+        candidates=int(os.getenv("RERANK_CANDIDATES", DEFAULT_CANDIDATES)),
+        lambda_=float(os.getenv("RERANK_LAMBDA", DEFAULT_LAMBDA)),
+        half_life_days=float(os.getenv("RERANK_HALF_LIFE_DAYS", 0)),
+    )
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def recency_decay(ages_days, half_life_days):
+    """ 1.0 for today, 0.5 one half-life ago, ...; unknown ages (NaN) count as 0.5. """
+    decay = np.power(0.5, np.clip(ages_days, 0, None) / half_life_days)
+    return np.where(np.isnan(decay), 0.5, decay)
+
+
+def mmr(query_vector, candidate_vectors, top_k, lambda_=DEFAULT_LAMBDA, relevance=None):
+    """
+    Indexes of `top_k` candidates in pick order. `relevance` overrides the cosine
+    similarity to the query (e.g. blended with recency).
+    """
+    candidates = _unit_rows(np.asarray(candidate_vectors, dtype=np.float32))
+    n = len(candidates)
+    if n == 0 or top_k <= 0:
+        return []
+    if relevance is None:
+        relevance = candidates @ _unit_rows(np.asarray(query_vector, dtype=np.float32))
+    relevance = np.asarray(relevance, dtype=np.float32)
+
+    picked = []
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)  # to anything picked so far
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(top_k, n)):
+        redundancy = np.where(np.isinf(max_similarity), 0.0, max_similarity)
+        scores = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(max_similarity, candidates @ candidates[best], out=max_similarity)
+    return picked
+
+
+def _age_days(payload, now):
+    ts = payload.get("ts")
+    if ts is None:
+        ts = parse_timestamp(payload.get("post_date") or payload.get("timestamp"))
+    return (now.timestamp() - ts) / 86400 if ts is not None else np.nan
+
+
+def rerank_points(points, query_vector, top_k, config=None, now=None):
+    """
+    Diverse top_k of scored points that carry their vector (with_vectors=True).
+    Points without a vector can't be compared and keep their similarity order
+    after the re-ranked ones. Scores are left as returned by the search.
+    """
+    config = config or get_rerank_config()
+    with_vectors = [point for point in points if point.vector is not None]
+    without = [point for point in points if point.vector is None]
+    if not config.enabled or len(with_vectors) <= 1:
+        return (with_vectors + without)[:top_k]
+
+    vectors = np.asarray([point.vector for point in with_vectors], dtype=np.float32)
+    relevance = _unit_rows(vectors) @ _unit_rows(np.asarray(query_vector, dtype=np.float32))
+    if config.half_life_days > 0:
+        now = now or datetime.datetime.now()
+        ages = np.array([_age_days(point.payload or {}, now) for point in with_vectors], dtype=np.float64)
+        decay = recency_decay(ages, config.half_life_days).astype(np.float32)
+        relevance = (1 - config.recency_weight) * relevance + config.recency_weight * decay
+    order = mmr(None, vectors, top_k, config.lambda_, relevance=relevance)
+    return ([with_vectors[i] for i in order] + without)[:top_k]
@@ -0,0 +1,378 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+import numpy as np
+import openai
+from qdrant_client.http.exceptions import ResponseHandlingException
+
+from admission import retry_after_seconds
+
+# 🛡️ Tail-latency control for OpenAI and Qdrant calls
+# Nothing used to set a timeout: one slow embeddings or query_points call stalled
+# the whole Streamlit run, and a transient 5xx reached the user as a stack trace.
+# Every outbound call now goes through one process-wide Resilience object, with
+# a named CallPolicy per kind of call ("embeddings", "search", "chat", "image"):
+#   - a deadline for the whole call and a timeout per attempt (passed on to the
+#     client as its request timeout, so the HTTP request really gives up)
+#   - retries on timeouts, connection errors, 429 and 5xx, with exponential
+#     backoff and full jitter (Retry-After wins when the server sends one)
+#   - a circuit breaker per name: after `failure_threshold` failures in a row
+#     calls fail fast for `reset_seconds`, then one probe call decides
+#   - hedging for idempotent calls (embeddings, vector search): if an attempt
+#     is still running after the p95 of recent attempts, a second identical
+#     attempt is fired and the first answer wins. Capped at `hedge_budget` of
+#     calls, so a slow backend doesn't get twice the load.
+# Callers pass `fn(timeout)`; sync attempts run on a small thread pool (a lost
+# hedge finishes in the background), async ones are tasks (the loser is cancelled).
+
+HEDGING = os.getenv("RESILIENCE_HEDGING", "1") != "0"
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+MIN_HEDGE_SAMPLES = 20  # attempts seen before the p95 is trusted as a hedge delay
+DEFAULT_WINDOW = 500
+MAX_WORKERS = 32
+
+
+class ResilienceError(Exception):
+    """ The call gave up; `retry_after` is a hint in seconds for the UI. """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(ResilienceError):
+    pass
+
+
+class DeadlineExceeded(ResilienceError):
+    pass
+
+
+class Unavailable(ResilienceError):
+    """ Every attempt failed with a retryable error; the last one is the __cause__. """
+
+
+class AttemptTimeout(TimeoutError):
+    pass
+
+
+def whole_seconds(timeout):
+    """ Attempt timeout for Qdrant, which takes whole seconds: rounded up; None (client default) if not set. """
+    return math.ceil(timeout) if isinstance(timeout, (int, float)) else None
+
+
+def is_retryable(exc, statuses=RETRY_STATUSES) -> bool:
+    """ Timeouts, dropped connections, 429 and 5xx; not 4xx client errors or our own bugs. """
+    if isinstance(exc, (TimeoutError, ConnectionError, httpx.TransportError, openai.APIConnectionError,
+                        ResponseHandlingException)):
+        return True
+    return getattr(exc, "status_code", None) in statuses
+
+
+class CallPolicy:
+    def __init__(self, deadline=10.0, attempt_timeout=None, retries=2, backoff_base=0.1, backoff_max=2.0,
+                 hedge=False, hedge_budget=0.1, min_hedge_delay=0.005, retry_statuses=RETRY_STATUSES):
+        self.deadline = deadline  # seconds for the whole call, retries and backoff included
+        self.attempt_timeout = attempt_timeout or deadline
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge  # only for idempotent calls
+        self.hedge_budget = hedge_budget  # max share of calls that may send a hedge
+        self.min_hedge_delay = min_hedge_delay
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def backoff(self, attempt, exc=None) -> float:
+        """ Full jitter: uniform in [0, min(max, base * 2^attempt)]; Retry-After if the server sent one. """
+        retry_after = retry_after_seconds(exc) if exc is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+DEFAULT_POLICIES = {
+    "embeddings": CallPolicy(deadline=10.0, attempt_timeout=3.0, retries=3, hedge=HEDGING),
+    "search": CallPolicy(deadline=5.0, attempt_timeout=2.0, retries=2, hedge=HEDGING),
+    # chat 429s go straight back to admission.py, which pauses the model for every session
+    "chat": CallPolicy(deadline=60.0, attempt_timeout=30.0, retries=2, backoff_base=0.5, backoff_max=8.0,
+                       retry_statuses=RETRY_STATUSES - {429}),
+    "image": CallPolicy(deadline=120.0, attempt_timeout=90.0, retries=1, backoff_base=1.0, backoff_max=8.0),
+}
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_seconds=15.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = "closed"  # closed -> open -> half_open -> closed | open
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """ False while open; after reset_seconds lets exactly one probe call through. """
+        with self._lock:
+            if self.state == "open" and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state, self._probing = "half_open", False
+            if self.state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+            return self.state != "open"
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_seconds - self.clock())
+
+    def success(self):
+        with self._lock:
+            self.state, self.failures, self._probing = "closed", 0, False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state, self.opened_at, self._probing = "open", self.clock(), False
+
+
+class _CallStats:
+    def __init__(self, window):
+        self.counts = {"calls": 0, "ok": 0, "failed": 0, "retries": 0, "timeouts": 0,
+                       "hedges": 0, "hedge_wins": 0, "short_circuited": 0}
+        self.attempt_ms = deque(maxlen=window)  # successful attempts: the hedge delay comes from here
+        self.call_ms = deque(maxlen=window)  # whole calls as the caller saw them
+
+
+class Resilience:
+    def __init__(self, policies=None, failure_threshold=5, reset_seconds=15.0, window=DEFAULT_WINDOW,
+                 max_workers=MAX_WORKERS, clock=time.monotonic, sleep=time.sleep):
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.window = window
+        self.clock = clock
+        self.sleep = sleep
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resilient")
+
+    # -- bookkeeping ---------------------------------------------------------
+
+    def breaker(self, name) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(self.failure_threshold, self.reset_seconds, self.clock)
+            return self._breakers[name]
+
+    def _stat(self, name) -> _CallStats:
+        if name not in self._stats:
+            self._stats[name] = _CallStats(self.window)
+        return self._stats[name]
+
+    def _count(self, name, **increments):
+        with self._lock:
+            counts = self._stat(name).counts
+            for key, value in increments.items():
+                counts[key] += value
+
+    def _record(self, name, key, ms):
+        with self._lock:
+            getattr(self._stat(name), key).append(ms)
+
+    def hedge_delay(self, name, policy):
+        """ p95 of recent successful attempts, None until there are MIN_HEDGE_SAMPLES of them. """
+        with self._lock:
+            samples = list(self._stat(name).attempt_ms)
+        if len(samples) < MIN_HEDGE_SAMPLES:
+            return None
+        return max(policy.min_hedge_delay, float(np.percentile(samples, 95)) / 1000)
+
+    def _may_hedge(self, name, policy):
+        with self._lock:
+            counts = self._stat(name).counts
+            return counts["hedges"] < policy.hedge_budget * max(counts["calls"], 1)
+
+    def _start(self, name, policy):
+        policy = policy or self.policies[name]
+        breaker = self.breaker(name)
+        self._count(name, calls=1)
+        if not breaker.allow():
+            self._count(name, short_circuited=1)
+            raise CircuitOpen(f"{name}: circuit open", retry_after=breaker.retry_after())
+        return policy, breaker
+
+    def _failed(self, name, policy, breaker, exc, attempt, deadline):
+        """ After a failed attempt: seconds to back off before the next one, or raises. """
+        if not is_retryable(exc, policy.retry_statuses):
+            breaker.success()  # the service answered, the request itself was bad
+            self._count(name, failed=1)
+            raise exc
+        breaker.failure()
+        self._count(name, timeouts=isinstance(exc, TimeoutError))
+        remaining = deadline - self.clock()
+        if attempt >= policy.retries or remaining <= 0 or breaker.state == "open":
+            self._count(name, failed=1)
+            if breaker.state == "open":
+                raise CircuitOpen(f"{name}: circuit open", retry_after=breaker.retry_after()) from exc
+            if remaining <= 0:
+                raise DeadlineExceeded(f"{name}: no answer within {policy.deadline} s") from exc
+            raise Unavailable(f"{name}: {exc.__class__.__name__} after {attempt + 1} attempts") from exc
+        self._count(name, retries=1)
+        return min(policy.backoff(attempt, exc), remaining)
+
+    def _done(self, name, breaker, started):
+        breaker.success()
+        self._count(name, ok=1)
+        self._record(name, "call_ms", (self.clock() - started) * 1000)
+
+    # -- sync ----------------------------------------------------------------
+
+    def _timed(self, name, fn, timeout):
+        started = self.clock()
+        result = fn(timeout)
+        self._record(name, "attempt_ms", (self.clock() - started) * 1000)
+        return result
+
+    def _attempt(self, name, fn, timeout, policy):
+        """ One attempt, plus a hedge if it's still running after the hedge delay. First success wins. """
+        started = self.clock()
+        end = started + timeout
+        first = self._pool.submit(self._timed, name, fn, timeout)
+        pending, errors = {first}, []
+        delay = self.hedge_delay(name, policy) if policy.hedge else None
+        hedge_at = started + delay if delay is not None and delay < timeout else None
+        while pending:
+            wait_until = min(end, hedge_at) if hedge_at is not None else end
+            done, pending = wait(pending, timeout=max(0.0, wait_until - self.clock()), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        self._count(name, hedge_wins=1)
+                    return future.result()
+                errors.append(future.exception())
+            now = self.clock()
+            if hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                if pending and self._may_hedge(name, policy):
+                    self._count(name, hedges=1)
+                    pending.add(self._pool.submit(self._timed, name, fn, end - now))
+            if pending and now >= end:
+                raise AttemptTimeout(f"{name}: attempt took longer than {timeout:.2f} s")
+        raise errors[0]
+
+    def call(self, name, fn, policy=None):
+        """
+        Runs `fn(timeout)` under the named policy. Raises CircuitOpen,
+        DeadlineExceeded or Unavailable (all ResilienceError) when it gives up;
+        non-retryable errors (4xx, bugs) propagate unchanged.
+        """
+        policy, breaker = self._start(name, policy)
+        started = self.clock()
+        deadline = started + policy.deadline
+        for attempt in range(policy.retries + 1):
+            timeout = min(policy.attempt_timeout, deadline - self.clock())
+            if timeout <= 0:
+                self._count(name, failed=1)
+                raise DeadlineExceeded(f"{name}: no answer within {policy.deadline} s")
+            try:
+                result = self._attempt(name, fn, timeout, policy)
+            except Exception as exc:
+                self.sleep(self._failed(name, policy, breaker, exc, attempt, deadline))
+                continue
+            self._done(name, breaker, started)
+            return result
+
+    # -- async ---------------------------------------------------------------
+
+    async def _atimed(self, name, fn, timeout):
+        started = self.clock()
+        result = await fn(timeout)
+        self._record(name, "attempt_ms", (self.clock() - started) * 1000)
+        return result
+
+    async def _aattempt(self, name, fn, timeout, policy):
+        started = self.clock()
+        end = started + timeout
+        first = asyncio.ensure_future(self._atimed(name, fn, timeout))
+        pending, errors = {first}, []
+        delay = self.hedge_delay(name, policy) if policy.hedge else None
+        hedge_at = started + delay if delay is not None and delay < timeout else None
+        try:
+            while pending:
+                wait_until = min(end, hedge_at) if hedge_at is not None else end
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, wait_until - self.clock()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self._count(name, hedge_wins=1)
+                        return task.result()
+                    errors.append(task.exception())
+                now = self.clock()
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    if pending and self._may_hedge(name, policy):
+                        self._count(name, hedges=1)
+                        pending.add(asyncio.ensure_future(self._atimed(name, fn, end - now)))
+                if pending and now >= end:
+                    raise AttemptTimeout(f"{name}: attempt took longer than {timeout:.2f} s")
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()  # the losing hedge, or an attempt past its timeout
+
+    async def acall(self, name, fn, policy=None):
+        """ call() for coroutines: `fn(timeout)` returns an awaitable. """
+        policy, breaker = self._start(name, policy)
+        started = self.clock()
+        deadline = started + policy.deadline
+        for attempt in range(policy.retries + 1):
+            timeout = min(policy.attempt_timeout, deadline - self.clock())
+            if timeout <= 0:
+                self._count(name, failed=1)
+                raise DeadlineExceeded(f"{name}: no answer within {policy.deadline} s")
+            try:
+                result = await self._aattempt(name, fn, timeout, policy)
+            except Exception as exc:
+                await asyncio.sleep(self._failed(name, policy, breaker, exc, attempt, deadline))
+                continue
+            self._done(name, breaker, started)
+            return result
+
+    # -- metrics -------------------------------------------------------------
+
+    def summary(self) -> dict:
+        """ Per call name: counters, breaker state and call latency p50/p95/p99 (ms). """
+        with self._lock:
+            stats = {name: (dict(stat.counts), list(stat.call_ms)) for name, stat in self._stats.items()}
+            breakers = {name: breaker.state for name, breaker in self._breakers.items()}
+        return {
+            name: {
+                **counts,
+                "breaker": breakers.get(name, "closed"),
+                **{f"p{q}_ms": round(float(np.percentile(calls, q)), 1) if calls else 0.0 for q in (50, 95, 99)},
+            }
+            for name, (counts, calls) in sorted(stats.items())
+        }
+
+
+_default_resilience = None
+_default_lock = threading.Lock()
+
+
+def get_resilience() -> Resilience:
+    """ Process-wide instance: every session shares the breakers and the latency windows. """
+    global _default_resilience
+    with _default_lock:
+        if _default_resilience is None:
+            _default_resilience = Resilience()
+        return _default_resilience
@@ -0,0 +1,223 @@
+import asyncio
+import os
+import threading
+import time
+
+import streamlit as st
+from openai import AsyncOpenAI, OpenAI
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from async_pipeline import EventLoopThread
+from embedding_batcher import EmbeddingBatcher, openai_embed_many
+from local_index import ReplicaRegistry
+from migration import DualWriter, make_embedder
+from qdrant_schema import (
+    INITIAL_COLLECTION, JOURNAL_ALIAS, ensure_alias, ensure_collection, ensure_payload_indexes,
+    get_collection_metadata, resolve_alias,
+)
+from resilience import get_resilience
+from storage_modes import DEFAULT_EMBEDDING_MODEL, collection_metadata, from_collection_metadata, get_storage_config
+
+# 🏭 Process-wide resources
+# Streamlit reruns the script on every click. Everything in here is created once
+# per process (st.cache_resource) and shared by all sessions: the HTTP clients
+# keep their connection pools warm, and the collection schema is checked once
+# at startup instead of on every rerun.
+# The journal is addressed through the `journal` alias. Each process pins the
+# collection behind it (and the embedding model recorded in its metadata) and
+# re-checks every ALIAS_CHECK_SECONDS in a background thread (never on the rerun
+# itself), so a migration's alias swap (migration.py)
+# is picked up without a restart and queries always match the collection's model.
+# Embeddings go through one EmbeddingBatcher, so concurrent sessions share requests.
+# Retries and timeouts belong to resilience.py, so the clients' own retries are off.
+
+# QDRANT_URL=":memory:" runs against Qdrant's local in-memory mode (benchmarks, offline work).
+QDRANT_URL = os.getenv("QDRANT_URL", "https://67bd4e7c-9e18-4183-8655-cb368b598d90.europe-west3-0.gcp.cloud.qdrant.io")
+COLLECTION_ALIAS = JOURNAL_ALIAS
+WARM_UP_RETRY_SECONDS = 30
+QDRANT_TIMEOUT = 10  # seconds; hard ceiling for an abandoned attempt, the policies in resilience.py are tighter
+ALIAS_CHECK_SECONDS = 30
+# Optional local read replica for search: "" (off), "float32" or "float16".
+LOCAL_REPLICA = os.getenv("LOCAL_REPLICA", "")
+
+
+class AppResources:
+    """
+    Pooled clients plus a one-time schema warm-up with a health state.
+    The async clients only ever run on `loop` (their connection pools belong to it).
+    """
+
+    def __init__(self, openai_client, qdrant_client, collection_alias=COLLECTION_ALIAS, storage=None,
+                 local_replica=LOCAL_REPLICA, async_openai_client=None, async_qdrant_client=None, resilience=None):
+        self.openai = openai_client
+        self.qdrant = qdrant_client
+        self.async_openai = async_openai_client
+        self.async_qdrant = async_qdrant_client
+        self.loop = EventLoopThread() if async_openai_client is not None else None
+        self.collection_alias = collection_alias
+        self.collection_name = collection_alias  # the pinned collection once warm
+        self.embedding_model = DEFAULT_EMBEDDING_MODEL
+        self.default_storage = storage or get_storage_config()  # layout for a brand-new collection
+        self.storage = self.default_storage  # vector size + quantization of the live collection, see storage_modes.py
+        self.local_replica = local_replica
+        self.replicas = None
+        self.resilience = resilience or get_resilience()  # timeouts, retries, breakers, hedging
+        self.embed_batcher = EmbeddingBatcher(openai_embed_many(openai_client, self.resilience))
+        self.dual_writer = DualWriter(qdrant_client, lambda model, storage: make_embedder(openai_client, model, storage))
+        self.alias_checked_at = 0.0
+        self._refreshing = False
+        self.state = "cold"  # cold -> warm | error
+        self.error = None
+        self.created_collection = False
+        self.warmed_at = None
+        self._last_attempt = 0.0
+        self._lock = threading.Lock()
+
+    def warm_up(self, force=False):
+        """
+        Ensures collection + payload indexes exist. No-op (no network) once warm.
+        After a failure it retries at most every WARM_UP_RETRY_SECONDS.
+        """
+        if self.state == "warm" and not force:
+            return True
+        with self._lock:
+            if self.state == "warm" and not force:
+                return True
+            if self.state == "error" and not force and time.time() - self._last_attempt < WARM_UP_RETRY_SECONDS:
+                return False
+            self._last_attempt = time.time()
+            try:
+                if resolve_alias(self.qdrant, self.collection_alias) is None:
+                    # first start: the original collection becomes the alias' first target
+                    self.created_collection = ensure_collection(
+                        self.qdrant, INITIAL_COLLECTION, self.default_storage,
+                        metadata=collection_metadata(DEFAULT_EMBEDDING_MODEL, self.default_storage),
+                    )
+                    ensure_alias(self.qdrant, self.collection_alias, INITIAL_COLLECTION)
+                self._follow_alias()
+                ensure_payload_indexes(self.qdrant, self.collection_name)
+            except Exception as e:
+                self.state, self.error = "error", str(e)
+                return False
+            self.state, self.error, self.warmed_at = "warm", None, time.time()
+            return True
+
+    def _follow_alias(self):
+        """ Pins the collection behind the alias and its embedding model; new replicas if it changed. """
+        collection = resolve_alias(self.qdrant, self.collection_alias) or self.collection_alias
+        model, storage = from_collection_metadata(
+            get_collection_metadata(self.qdrant, collection), DEFAULT_EMBEDDING_MODEL, self.default_storage
+        )
+        if collection != self.collection_name or self.replicas is None:
+            self.replicas = (
+                ReplicaRegistry(self.qdrant, collection, dtype=self.local_replica) if self.local_replica else None
+            )
+        self.collection_name, self.embedding_model, self.storage = collection, model, storage
+        self.alias_checked_at = time.time()
+
+    def refresh(self):
+        """
+        Re-checks the alias at most every ALIAS_CHECK_SECONDS, in the background:
+        the caller keeps the current pin until the check lands. Keeps the pin on errors.
+        """
+        if self.state != "warm" or self._refreshing or time.time() - self.alias_checked_at < ALIAS_CHECK_SECONDS:
+            return
+        self._refreshing = True
+
+        def run():
+            try:
+                with self._lock:
+                    self._follow_alias()
+            except Exception:
+                self.alias_checked_at = time.time()  # try again next interval
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True, name="alias-check").start()
+
+    def health(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "alias": self.collection_alias,
+            "collection": self.collection_name,
+            "embedding_model": self.embedding_model,
+            "created_collection": self.created_collection,
+            "storage": self.storage.describe(),
+            "warm_for_s": round(time.time() - self.warmed_at, 1) if self.warmed_at else None,
+            "dual_writes": self.dual_writer.summary(),
+            "embed_batching": self.embed_batcher.summary(),
+            "resilience": self.resilience.summary(),
+        }
+
+
+def _secret(name):
+    """ Environment first (tools, benchmarks), then .streamlit/secrets.toml. """
+    if os.getenv(name):
+        return os.getenv(name)
+    try:
+        return st.secrets[name]
+    except Exception:
+        return None
+
+
+class _SerializedQdrant:
+    """ The local in-memory client isn't thread-safe: one call at a time, whichever thread makes it. """
+
+    def __init__(self, qdrant_client):
+        self._client = qdrant_client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+
+        return call
+
+
+class _ThreadedAsyncQdrant:
+    """ Async facade over a sync client (every call runs in a worker thread, one at a time). """
+
+    def __init__(self, qdrant_client):
+        self._client = _SerializedQdrant(qdrant_client) if isinstance(qdrant_client, QdrantClient) else qdrant_client
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return call
+
+
+def _qdrant_clients():
+    if QDRANT_URL == ":memory:":
+        # Two in-memory clients would be two separate stores; the async side wraps the sync one instead,
+        # and both share one lock so sessions, the event loop and the replicas never call it concurrently.
+        qdrant_client = _SerializedQdrant(QdrantClient(":memory:"))
+        return qdrant_client, _ThreadedAsyncQdrant(qdrant_client)
+    api_key = _secret("QDRANT_API_KEY")
+    return (
+        # Because sometimes, gRPC is just overkill.
+        QdrantClient(url=QDRANT_URL, api_key=api_key, prefer_grpc=False, timeout=QDRANT_TIMEOUT),
+        AsyncQdrantClient(url=QDRANT_URL, api_key=api_key, prefer_grpc=False, timeout=QDRANT_TIMEOUT),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_resources() -> AppResources:
+    """ Built on the first run of the process, then returned from cache on every rerun. """
+    qdrant_client, async_qdrant_client = _qdrant_clients()
+    resources = AppResources(
+        openai_client=OpenAI(max_retries=0),  # holds one pooled httpx client for the whole process
+        qdrant_client=qdrant_client,
+        async_openai_client=AsyncOpenAI(max_retries=0),
+        async_qdrant_client=async_qdrant_client,
+    )
+    resources.warm_up()
+    return resources
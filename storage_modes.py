@@ -0,0 +1,123 @@
+import os
+
+from qdrant_client.http import models as qdrant_models
+
+# 💾 Vector storage modes for journal_entries
+#   full   - 1536 float32 in RAM (the original setup)
+#   scalar - int8 scalar quantization in RAM, float32 originals on disk, rescored
+#   binary - 1 bit per dim in RAM, originals on disk, oversampled + rescored
+# EMBEDDING_DIMENSIONS shrinks the vectors themselves: text-embedding-3-small
+# supports `dimensions=` (Matryoshka-style), e.g. 512 is 3x less of everything.
+#
+# Changing either setting changes the collection schema, so it only applies to
+# new collections (migrate existing data with a re-embed, see migration.py).
+# Collections record the model + layout they were built with in their Qdrant
+# metadata, so the apps embed queries to match whatever collection is live.
+
+FULL_DIMENSIONS = 1536  # text-embedding-3-small
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+NATIVE_DIMENSIONS = {  # what each model returns without `dimensions=`
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+STORAGE_MODES = ("full", "scalar", "binary")
+BINARY_OVERSAMPLING = 3.0
+SCALAR_OVERSAMPLING = 1.5
+
+
+class StorageConfig:
+    def __init__(self, mode="full", dimensions=FULL_DIMENSIONS):
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode {mode!r}, expected one of {STORAGE_MODES}")
+        self.mode = mode
+        self.dimensions = int(dimensions)
+
+    @property
+    def quantized(self):
+        return self.mode != "full"
+
+    def vectors_config(self):
+        return qdrant_models.VectorParams(
+            size=self.dimensions,
+            distance="Cosine",
+            on_disk=self.quantized,  # originals only read for rescoring
+        )
+
+    def quantization_config(self):
+        if self.mode == "scalar":
+            return qdrant_models.ScalarQuantization(
+                scalar=qdrant_models.ScalarQuantizationConfig(
+                    type=qdrant_models.ScalarType.INT8, quantile=0.99, always_ram=True
+                )
+            )
+        if self.mode == "binary":
+            return qdrant_models.BinaryQuantization(
+                binary=qdrant_models.BinaryQuantizationConfig(always_ram=True)
+            )
+        return None
+
+    def search_params(self):
+        """ Rescore quantized candidates with the original vectors. None for full precision. """
+        if not self.quantized:
+            return None
+        return qdrant_models.SearchParams(
+            quantization=qdrant_models.QuantizationSearchParams(
+                rescore=True,
+                oversampling=BINARY_OVERSAMPLING if self.mode == "binary" else SCALAR_OVERSAMPLING,
+            )
+        )
+
+    def embedding_kwargs(self, model=DEFAULT_EMBEDDING_MODEL):
+        """
+        Extra kwargs for embeddings.create: `dimensions` whenever it isn't `model`'s
+        native size (text-embedding-3-large at 1536 needs it too), and for models
+        whose native size we don't know.
+        """
+        return {} if self.dimensions == NATIVE_DIMENSIONS.get(model) else {"dimensions": self.dimensions}
+
+    def cache_model(self, model):
+        """ Embedding-cache model key: vectors of different sizes must never mix. """
+        return model if self.dimensions == NATIVE_DIMENSIONS.get(model) else f"{model}@{self.dimensions}"
+
+    def ram_bytes_per_point(self):
+        """ Vector bytes kept in RAM per point (payload and HNSW links not included). """
+        if self.mode == "scalar":
+            return self.dimensions
+        if self.mode == "binary":
+            return (self.dimensions + 7) // 8
+        return self.dimensions * 4
+
+    def describe(self) -> dict:
+        return {"mode": self.mode, "dimensions": self.dimensions, "ram_bytes_per_point": self.ram_bytes_per_point()}
+
+
+def get_storage_config() -> StorageConfig:
+    """ From STORAGE_MODE / EMBEDDING_DIMENSIONS, defaulting to the original full-precision setup. """
+    return StorageConfig(
+        mode=os.getenv("STORAGE_MODE", "full"),
+        dimensions=int(os.getenv("EMBEDDING_DIMENSIONS", FULL_DIMENSIONS)),
+    )
+
+
+def collection_metadata(embedding_model, storage) -> dict:
+    """ What a collection was built with, stored in its Qdrant metadata. """
+    return {"embedding_model": embedding_model, "dimensions": storage.dimensions, "storage_mode": storage.mode}
+
+
+def from_collection_metadata(metadata, default_model=DEFAULT_EMBEDDING_MODEL, default_storage=None):
+    """ (embedding model, StorageConfig) of a collection; the env defaults for collections without metadata. """
+    metadata = metadata or {}
+    if "embedding_model" not in metadata:
+        return default_model, default_storage or get_storage_config()
+    return metadata["embedding_model"], StorageConfig(metadata.get("storage_mode", "full"), metadata["dimensions"])
+
+
+def make_openai_embedder(client, model=DEFAULT_EMBEDDING_MODEL, storage=None):
+    """ Returns `embed_many(texts) -> vectors` using one request per call. """
+    storage = storage or get_storage_config()
+
+    def embed_many(texts):
+        response = client.embeddings.create(input=list(texts), model=model, **storage.embedding_kwargs(model))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    return embed_many
@@ -0,0 +1,95 @@
+import time
+
+# 🎞️ Streaming helpers for the chat UI
+# - SectionParser splits the answer into "Inlägg" / "Reflektion" incrementally:
+#   it only looks at the new token (plus a short tail) until the marker shows up,
+#   instead of re-scanning and re-splitting the whole buffer on every token.
+# - ThrottledRenderer coalesces tokens and redraws at most `fps` times per second
+#   (or earlier once `max_pending_chars` have piled up). The first token is always
+#   drawn right away, so time-to-first-token doesn't change.
+
+REFLECTION_MARKER = "Reflektion:"
+DEFAULT_FPS = 12
+DEFAULT_MAX_PENDING_CHARS = 512
+
+
+class SectionParser:
+    """ Incremental "before marker" / "after marker" splitter. """
+
+    def __init__(self, marker=REFLECTION_MARKER):
+        self.marker = marker
+        self.found = False
+        self._before = []
+        self._after = []
+        self._tail = ""  # last len(marker)-1 chars, so a marker split over tokens is still seen
+
+    def feed(self, token: str) -> None:
+        if self.found:
+            self._after.append(token)
+            return
+
+        window = self._tail + token
+        index = window.find(self.marker)
+        if index == -1:
+            self._before.append(token)
+            self._tail = window[-(len(self.marker) - 1):] if len(self.marker) > 1 else ""
+            return
+
+        # The marker may start inside the tail we already put in `_before`.
+        self.found = True
+        overlap = len(self._tail)
+        before_part = window[:index]
+        if index < overlap:
+            text = "".join(self._before)
+            self._before = [text[:len(text) - (overlap - index)]]
+        else:
+            self._before.append(before_part[overlap:])
+        self._after.append(window[index + len(self.marker):])
+        self._tail = ""
+
+    @property
+    def journal_text(self) -> str:
+        text = "".join(self._before)
+        return text.strip() if self.found else text
+
+    @property
+    def reflection_text(self) -> str:
+        return self.marker + "".join(self._after).strip() if self.found else ""
+
+
+class ThrottledRenderer:
+    """
+    Calls `render()` at most `fps` times per second while tokens arrive.
+    `push(n)` reports n new chars; `close()` draws whatever is left.
+    """
+
+    def __init__(self, render, fps=DEFAULT_FPS, max_pending_chars=DEFAULT_MAX_PENDING_CHARS, clock=time.perf_counter):
+        self.render = render
+        self.interval = 1.0 / fps if fps else 0.0
+        self.max_pending_chars = max_pending_chars
+        self.clock = clock
+        self.flushes = 0
+        self.tokens = 0
+        self._pending_chars = 0
+        self._last_flush = None
+
+    def push(self, chars: int = 1) -> None:
+        self.tokens += 1
+        self._pending_chars += chars
+        now = self.clock()
+        if (
+            self._last_flush is None  # first token: draw immediately
+            or now - self._last_flush >= self.interval
+            or self._pending_chars >= self.max_pending_chars
+        ):
+            self._flush(now)
+
+    def close(self) -> None:
+        if self._pending_chars:
+            self._flush(self.clock())
+
+    def _flush(self, now):
+        self.render()
+        self.flushes += 1
+        self._pending_chars = 0
+        self._last_flush = now
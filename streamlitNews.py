@@ -1,10 +1,13 @@
 import streamlit as st
 import random
-import json
 import time
 from openai import OpenAI
 from datetime import datetime, timedelta
-import os
+from news_cache import NewsCache
+from image_store import ImageStore
+from news_engine import TOP_STORIES, build_news, image_digests
+
+PAGE_STARTED = time.perf_counter()  # for time-to-first-content
 
 # 🚀 Title and Description
 st.set_page_config(page_title="Fredrik News Network", layout="wide")
@@ -13,48 +16,13 @@ st.write("Bringing you swell news about Fredrik, all day err' day.")
 
 # OpenAI API Key
 openai_api_key = st.secrets.get("OPENAI_API_KEY")
-client = OpenAI(api_key=openai_api_key)
+client = OpenAI(api_key=openai_api_key, max_retries=0)  # retries + timeouts come from resilience.py
 
 # 🕒 Cache File for News
 CACHE_FILE = "news_cache.json"
 CACHE_EXPIRY_HOURS = 5  # Refresh news every 5 hours
 
 
-# 📰 Fake Breaking News Headlines
-def generate_headline():
-    headlines = [
-        "Fredrik Accidentally Invents Time Travel but Only Goes Back 7 Minutes",
-        "Study Shows 98% of Fredriks Have No Idea What's Happening Right Now",
-        "Fredrik Declares Himself 'Supreme Overlord' of His Apartment",
-        "Local Authorities Confused After Every Street in Town Renamed to 'Fredrik Road'",
-        "Breaking: Fredrik Discovers New Species of Fish Inside His Own Fridge",
-    ]
-    return random.choice(headlines)
-
-
-# 🏆 Fake News Articles & DALL-E Image Generation
-def generate_article_and_image(prompt):
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system",
-             "content": "You are a satirical news writer. Roast Fredrik and don't hold back. Keep it in a real news format."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    article = response.choices[0].message.content if response.choices else "Error generating article."
-
-    # 🎨 Generate an image for the article
-    dalle_response = client.images.generate(
-        model="dall-e-3",
-        prompt=f"A hilarious satirical news image illustrating: {prompt}",
-        size="1024x1024"
-    )
-
-    image_url = dalle_response.data[0].url if dalle_response else None
-    return article, image_url
-
-
 # 🎭 Fake Sponsored Ads
 def get_fake_ad():
     ads = [
@@ -65,49 +33,84 @@ def get_fake_ad():
     return random.choice(ads)
 
 
-# 🕒 Load Cached News if Fresh, Else Generate New
-def load_or_generate_news():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as file:
-            data = json.load(file)
-            last_updated = datetime.strptime(data["last_updated"], "%Y-%m-%d %H:%M:%S")
-
-            # If cache is still fresh, return it
-            if datetime.now() - last_updated < timedelta(hours=CACHE_EXPIRY_HOURS):
-                return data["headline"], data["top_articles"], data["other_articles"]
-
-    # Otherwise, generate fresh news
-    prompts = [
-        "Write a funny fake news article about Fredrik being announced as the second most fast leveler in World of Warcraft.",
-        "Create a hilarious news report about a secret agent finding 10,000 bottles of baby oil in Fredrik's closet.",
-        "Generate a satirical article about riots in Sweden because of Fredrik having too much luck on his rolls in WoW.",
-        "Write a satirical piece about Fredrik being mistaken for a celebrity and getting mobbed in a supermarket.",
-        "Generate a comically absurd story about Fredrik trying to smuggle a pet moose into a gaming convention."
-    ]
+IMAGE_STORE = ImageStore()  # downloaded once, shown from local WebP (see image_store.py)
+IMAGE_WIDTH = 640
 
-    # Select 3-5 random articles
-    num_articles = random.randint(3, 5)
-    selected_prompts = random.sample(prompts, num_articles)
 
-    # Generate new articles & images
-    top_articles = [generate_article_and_image(selected_prompts[i]) for i in range(2)]
-    other_articles = [generate_article_and_image(selected_prompts[i])[0] for i in range(2, num_articles)]
+@st.cache_resource(show_spinner=False)
+def get_news_cache():
+    """ One cache object per process: keeps the parsed JSON in memory between reruns (see news_cache.py). """
+    return NewsCache(CACHE_FILE, max_age=timedelta(hours=CACHE_EXPIRY_HOURS))
 
-    # New headline
-    new_headline = generate_headline()
 
-    # Cache the new data
-    data = {
-        "last_updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "headline": new_headline,
-        "top_articles": top_articles,
-        "other_articles": other_articles
-    }
+def generate_fresh_news():
+    """ Background refresh: same piece-by-piece build, nobody watching. """
+    news = build_news(client, get_news_cache().draft, image_store=IMAGE_STORE)
+    IMAGE_STORE.prune(image_digests(news))  # old pages' images, once nobody can be showing them
+    return news
+
+
+# 🧱 Page skeleton: headline + ad right away, one empty slot per story
+def draw_page(headline, top_count, other_count):
+    st.markdown(f"<h2 style='color: white;'>BREAKING: {headline}</h2>", unsafe_allow_html=True)
+
+    # 📌 Layout Setup
+    col1, col2 = st.columns([3, 1])
+
+    with col2:
+        st.header("🎯 Sponsored Content")
+        st.markdown(
+            f"<div style='border: 1px solid black; padding: 10px; background-color: #f9f9f9;'>{get_fake_ad()}</div>",
+            unsafe_allow_html=True
+        )
 
-    with open(CACHE_FILE, "w") as file:
-        json.dump(data, file)
+    slots = []
+    with col1:
+        st.header("📰 Top Stories")
+        for i in range(top_count):
+            with st.container():
+                st.subheader(f"🔹 Story {i + 1}")
+                slots.append({"image": st.empty(), "text": st.empty()})
 
-    return new_headline, top_articles, other_articles
+        st.header("📢 Other News")
+        for _ in range(other_count):
+            with st.container():
+                slots.append({"image": None, "text": st.empty()})
+    return slots
+
+
+def show_image(slot, image):
+    # local reference from the image store; plain URLs in caches written before it
+    image_path = IMAGE_STORE.display_path(image, IMAGE_WIDTH) if isinstance(image, dict) else image
+    if image_path and slot["image"] is not None:
+        slot["image"].image(image_path, use_container_width=True)
+
+
+# 🌊 Cold cache: draw the page while it's being written (stream=True, pieces land one by one)
+def build_progressively():
+    page = {}
+
+    def on_event(event, draft):
+        kind, i, value = event
+        if kind == "start":
+            top_count = min(TOP_STORIES, len(draft["prompts"]))
+            page["slots"] = draw_page(draft["headline"], top_count, len(draft["prompts"]) - top_count)
+            for slot in page["slots"]:
+                slot["text"].caption("✍️ Our reporters are on it...")
+            return
+        slot = page["slots"][i]
+        if kind in ("text", "article"):
+            page.setdefault("first_content_s", round(time.perf_counter() - PAGE_STARTED, 2))
+            slot["text"].write(value)
+        elif kind == "image":
+            show_image(slot, value)
+        elif kind == "failed" and value == "article":
+            slot["text"].caption("🙈 This story didn't make it to print - we'll try again on the next refresh.")
+
+    news = build_news(client, get_news_cache().draft, image_store=IMAGE_STORE, on_event=on_event)
+    news["build"]["first_content_s"] = page.get("first_content_s")
+    IMAGE_STORE.prune(image_digests(news))
+    return news
 
 
 # 🕒 Session State for Auto Refresh
@@ -120,36 +123,26 @@ if datetime.now() - st.session_state["last_refresh_time"] > timedelta(hours=CACH
     st.rerun()
 
 # 📌 Load News Content
-headline, top_articles, other_articles = load_or_generate_news()
-
-# 🎭 News Ticker at the Top
-st.markdown(f"<h2 style='color: white;'>BREAKING: {headline}</h2>", unsafe_allow_html=True)
-
-# 📌 Layout Setup
-col1, col2 = st.columns([3, 1])
-
-with col1:
-    st.header("📰 Top Stories")
-
-    for i, (article, image_url) in enumerate(top_articles):
-        with st.container():
-            st.subheader(f"🔹 Story {i + 1}")
-            if image_url:
-                st.image(image_url, use_container_width=True)
-            st.write(article)
-
-    st.header("📢 Other News")
-
-    for article in other_articles:
-        with st.container():
-            st.write(article)
-
-with col2:
-    st.header("🎯 Sponsored Content")
-    st.markdown(
-        f"<div style='border: 1px solid black; padding: 10px; background-color: #f9f9f9;'>{get_fake_ad()}</div>",
-        unsafe_allow_html=True
-    )
+# Stale news is served as-is while one worker regenerates in the background (news_cache.py);
+# a cold cache is drawn progressively while it's generated.
+data, state = get_news_cache().get(generate_fresh_news, cold=build_progressively)
+
+if state == "generated":
+    build = data.get("build", {})
+    st.caption(f"⚡ First story after {build.get('first_content_s')} s, "
+               f"whole page after {data.get('build_seconds')} s")
+    if data.get("failed"):
+        st.caption(f"🔁 Not cached: {', '.join(data['failed'])} failed, the next visit retries just those.")
+else:
+    if state == "stale":
+        st.caption("🔄 Fresh news is being written as we speak...")
+    top_articles, other_articles = data["top_articles"], data["other_articles"]
+    slots = draw_page(data["headline"], len(top_articles), len(other_articles))
+    for slot, (article, image) in zip(slots, top_articles):
+        show_image(slot, image)
+        slot["text"].write(article)
+    for slot, article in zip(slots[len(top_articles):], other_articles):
+        slot["text"].write(article)
 
 # 🔄 Auto-refreshing Fake Breaking News
 if st.button("🔄 Refresh News"):
@@ -1,105 +1,98 @@
 import streamlit as st
-from openai import OpenAI
 import os
-from qdrant_client import QdrantClient
-from qdrant_client.http import models as qdrant_models
+import re
+import time
 import uuid
 import datetime
+from admission import AdmissionRejected, get_admission_controller
+from answer_cache import entry_versions, get_answer_cache
+from async_pipeline import AsyncJournalPipeline
+from context_packer import ENTRY_SEPARATOR, pack_context
+from embedding_cache import get_embedding_cache
+from rerank import get_rerank_config
+from resilience import ResilienceError
+from resources import get_resources
+from stream_render import SectionParser, ThrottledRenderer
+from telemetry import StageTimer, get_search_metrics
+from time_filters import describe_range, parse_time_range
 
 # 🔥 Welcome to the Underground 🔥
 # This is a slick journaling app that stores and retrieves entries from Qdrant,
 # and summons the power of OpenAI's GPT-4o-mini to reflect on your thoughts.
 # It’s got embeddings, a bit of authentication, and a smooth streaming chat.
 
-client = OpenAI()
-
-# --- 🏴‍☠️ QDRANT SETUP (VECTOR DATABASE) ---
+# --- 🏴‍☠️ CLIENTS + QDRANT SETUP (VECTOR DATABASE) ---
 # Qdrant: The unsung hero storing high-dimensional vectors.
-QDRANT_URL = "https://67bd4e7c-9e18-4183-8655-cb368b598d90.europe-west3-0.gcp.cloud.qdrant.io"
-QDRANT_API_KEY = st.secrets["QDRANT_API_KEY"]
-
-qdrant_client = QdrantClient(
-    url=QDRANT_URL,
-    api_key=QDRANT_API_KEY,
-    prefer_grpc=False  # Because sometimes, gRPC is just overkill.
-)
+# Clients live in resources.py and are built once per process, not once per rerun.
+resources = get_resources()
+resources.refresh()  # follows the collection alias after a migration (background check, at most every 30 s)
+client = resources.openai
+qdrant_client = resources.qdrant
 
-COLLECTION_NAME = "journal_entries"
+COLLECTION_NAME = resources.collection_name
 
 
 def init_qdrant_collection():
-    """ Ensures the Qdrant collection exists, otherwise creates it. """
-    vector_size = 1536  # Matches OpenAI's "text-embedding-3-small"
-    try:
-        collections_info = qdrant_client.get_collections()
-        collection_names = [col.name for col in collections_info.collections]
-    except Exception as e:
-        st.error(f"Error fetching collections: {e}")
-        collection_names = []
-
-    if COLLECTION_NAME in collection_names:
-        st.write(" ")  # Don't want any confirmation message atm, just works.
-    else:
-        qdrant_client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=qdrant_models.VectorParams(size=vector_size, distance="Cosine")
-        )
-        st.write("🚀 Created a new collection in Qdrant.")
+    """ Ensures the Qdrant collection (and its indexes) exists. Free once the process is warm. """
+    if not resources.warm_up():
+        st.error(f"Error preparing Qdrant collection: {resources.error}")
 
 
 # --- 🤖 TEXT EMBEDDING ---
+EMBEDDING_MODEL = resources.embedding_model  # the live collection's model, see migration.py
+STORAGE = resources.storage  # embedding size + quantized search, see storage_modes.py
+RERANK = get_rerank_config()  # over-fetch + MMR for diverse top-k, see rerank.py
+embedding_cache = get_embedding_cache()  # Shared across sessions and reruns.
+answer_cache = get_answer_cache()  # Near-duplicate questions replay a stored answer.
+search_metrics = get_search_metrics()  # Per-stage latencies across sessions, see telemetry.py.
+admission = get_admission_controller()  # Process-wide limits + fair queue for chat streams, see admission.py.
+resilience = resources.resilience  # Timeouts, retries with jitter, breakers, hedged search, see resilience.py.
+
+
 def embed_text(text: str) -> list[float]:
-    """ Converts input text into a vector embedding using OpenAI. """
-    response = client.embeddings.create(
-        input=text,
-        model="text-embedding-3-small"
-    )
-    return response.data[0].embedding  # Returning pure vector goodness.
+    """ Converts input text into a vector embedding: cached and batched, same path as search (async_pipeline.py). """
+    vectors, _ = resources.loop.run(pipeline.embed([text], StageTimer()))
+    return vectors[0]
 
 
 # --- 🔍 RETRIEVING RELEVANT ENTRIES ---
+def entry_parts(point) -> dict:
+    """ Header (title + date) and body of a point, plus its score, for the context packer. """
+    payload = point.payload
+    title = payload.get("title") or payload.get("text", "N/A")
+    creator = payload.get("creator", "N/A")
+    date = payload.get("post_date") or payload.get("timestamp", "N/A")
+    content = payload.get("content", "N/A")
+
+    return {"score": point.score, "header": f"📖 **{title}**\n🗓️ {date}", "body": content}
+
+
+def format_entry(point) -> str:
+    parts = entry_parts(point)
+    return f"{parts['header']}\n\n{parts['body']}"
+
+
 def retrieve_relevant_entries(user_id, query_text, top_k=3):
     """
     Fetches the top K most relevant journal entries based on vector similarity.
     Uses cosine distance because, well, that’s what the cool kids use.
+    Only the given user's entries are searched, and only the period the question
+    names ("förra veckan", "in May"...) if it names one. Same search as main().
     """
-    query_embedding = embed_text(query_text)
-    response = qdrant_client.query_points(
-        collection_name=COLLECTION_NAME,
-        query=query_embedding,
-        limit=top_k,
-        with_payload=True,
-        with_vectors=False
+    points, _, _ = resources.loop.run(
+        pipeline.retrieve(user_id, query_text, top_k=top_k, time_range=parse_time_range(query_text))
     )
-
-    top_entries = []
-    for point in response.points:
-        payload = point.payload
-        title = payload.get("title") or payload.get("text", "N/A")
-        creator = payload.get("creator", "N/A")
-        date = payload.get("post_date") or payload.get("timestamp", "N/A")
-        content = payload.get("content", "N/A")
-
-        entry_str = f"📖 **{title}**\n🗓️ {date}\n\n{content}"
-        top_entries.append(entry_str)
-
-    return top_entries
+    return [format_entry(point) for point in points]
 
 
 # --- 🧠 STREAMING GPT RESPONSE ---
-def stream_gpt_response(question, relevant_texts, chat_container):
-    """
-    Streams GPT response dynamically.
-    - Retrieves journal entries as context.
-    - Generates a reflection (always in Swedish 🇸🇪).
-    - Uses smart placeholders to avoid flickering UI updates.
-    """
-    if relevant_texts:
-        context_str = "\n\n".join(relevant_texts)
-    else:
-        context_str = "Jag hittar inget om det i din dagbok 😐."
+STREAM_RENDER_FPS = 12  # UI redraws per second while streaming
+STREAM_FLUSH_CHARS = 512  # ...or earlier, once this many new chars are waiting
+CHAT_MODEL = "gpt-4o-mini"
+CONTEXT_TOKEN_BUDGET = 1500  # max prompt tokens spent on journal entries
+
 
-    system_prompt = """
+SYSTEM_PROMPT = """
     Du är en empatisk och insiktsfull dagbokskompanjon. 
     Din uppgift är att hämta relevanta dagboksinlägg och ge en reflektion.
     Alla svar måste vara på svenska.
@@ -111,6 +104,22 @@ def stream_gpt_response(question, relevant_texts, chat_container):
       [Din insikt här]
     """
 
+# --- 📸 LOCAL AVATAR IMAGE ---
+# Resolved once per process instead of on every answer.
+AVATAR_FILENAME = "static/noras.PNG"
+AVATAR_PATH = os.path.join(os.path.dirname(__file__), AVATAR_FILENAME)
+AVATAR_FOUND = os.path.exists(AVATAR_PATH)
+# Streamlit needs a public URL or in-memory image, so fall back to the hosted copy.
+AVATAR_IMAGE = AVATAR_PATH if AVATAR_FOUND else "https://github.com/Jauzing/chatbot/blob/main/static/noras.PNG"
+
+
+def build_messages(question, relevant_texts):
+    """ System + user messages for the reflection prompt. """
+    if relevant_texts:
+        context_str = ENTRY_SEPARATOR.join(relevant_texts)  # what pack_context budgets for
+    else:
+        context_str = "Jag hittar inget om det i din dagbok 😐."
+
     user_prompt = f"""
     **Relevanta dagboksinlägg:**  
 
@@ -119,60 +128,89 @@ def stream_gpt_response(question, relevant_texts, chat_container):
     **Användarens fråga:**  
     {question}
     """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    response_stream = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        stream=True
-    )
 
+def stream_gpt_response(question, relevant_texts, chat_container):
+    """
+    Streams GPT response dynamically.
+    - Retrieves journal entries as context.
+    - Generates a reflection (always in Swedish 🇸🇪).
+    - Uses smart placeholders to avoid flickering UI updates.
+    Same stream as main(), without the admission queue.
+    """
+    timer = StageTimer()
+    tokens = resources.loop.iterate(pipeline.stream_answer(build_messages(question, relevant_texts), timer))
+    return render_stream(tokens, chat_container, timer)
+
+
+def replay_response(answer, chat_container, timer=None):
+    """ Plays a cached answer through the same streaming UI, word by word. """
+    return render_stream(re.findall(r"\S+\s*|\s+", answer), chat_container, timer)
+
+
+def render_stream(tokens, chat_container, timer=None):
+    """
+    Draws "Inlägg" / "Reflektion" as tokens arrive. Returns the full text.
+    With a timer: marks the first draw and counts flushes and time spent drawing.
+    """
     full_response = ""
-    message_buffer = ""
     journal_placeholder = chat_container.empty()
     reflection_placeholder = chat_container.empty()
 
-    journal_text = ""
-    reflection_text = ""
+    if not AVATAR_FOUND:
+        st.warning(f"⚠️ Avatar image '{AVATAR_FILENAME}' not found! Using fallback URL.")
 
-    # --- 📸 SET LOCAL AVATAR IMAGE ---
-    # Define the local image path (inside "static/" folder)
-    avatar_filename = "static/noras.PNG"
-    avatar_path = os.path.join(os.path.dirname(__file__), avatar_filename)
+    parser = SectionParser()
 
-    # Check if the file exists and serve it correctly
-    if os.path.exists(avatar_path):
-        # Streamlit needs a public URL or in-memory image, so we use `st.image()` workaround
-        avatar_image = avatar_path
-    else:
-        st.warning(f"⚠️ Avatar image '{avatar_filename}' not found! Using fallback URL.")
-        avatar_image = "https://github.com/Jauzing/chatbot/blob/main/static/noras.PNG"  # Replace with actual hosted URL
+    def render():
+        started = time.perf_counter()
+        with journal_placeholder:
+            st.chat_message("system").markdown(f"**Inlägg:**\n\n{parser.journal_text}")
+
+        with reflection_placeholder:
+            # ✅ FIX: Use `AVATAR_IMAGE`, whether it's a valid local file or fallback URL
+            st.chat_message("assistant", avatar=AVATAR_IMAGE).markdown(parser.reflection_text)
 
-    for chunk in response_stream:
-        token = getattr(chunk.choices[0].delta, "content", "") or ""
+        if timer is not None:
+            timer.mark("first_render")
+            timer.count("render_flushes")
+            timer.count("render_ms", (time.perf_counter() - started) * 1000)
+
+    # Coalesce tokens: redraw a few times per second instead of once per token.
+    renderer = ThrottledRenderer(render, fps=STREAM_RENDER_FPS, max_pending_chars=STREAM_FLUSH_CHARS)
+
+    for token in tokens:
         if not token:
             continue
         full_response += token
-        message_buffer += token
-
-        if "Reflektion:" in message_buffer:
-            parts = message_buffer.split("Reflektion:", 1)
-            journal_text = parts[0].strip()
-            reflection_text = "Reflektion:" + parts[1].strip()
-        else:
-            journal_text = message_buffer
-            reflection_text = ""
+        parser.feed(token)
+        renderer.push(len(token))
 
-        with journal_placeholder:
-            st.chat_message("system").markdown(f"**Inlägg:**\n\n{journal_text}")
+    renderer.close()
+    if timer is not None:
+        timer.count("streamed_tokens", renderer.tokens)
+    return full_response
 
-        with reflection_placeholder:
-            # ✅ FIX: Use `avatar_image`, whether it's a valid local file or fallback URL
-            st.chat_message("assistant", avatar=avatar_image).markdown(reflection_text)
 
-    return full_response
+# --- ⚡ ASYNC SEARCH PIPELINE ---
+# Cheap wrapper object; the async clients and their event loop live in resources.
+pipeline = AsyncJournalPipeline(
+    openai_client=resources.async_openai,
+    qdrant_client=resources.async_qdrant,
+    collection_name=COLLECTION_NAME,
+    embedding_model=EMBEDDING_MODEL,
+    storage=STORAGE,
+    chat_model=CHAT_MODEL,
+    embedding_cache=embedding_cache,
+    replicas=resources.replicas,
+    rerank=RERANK,
+    batcher=resources.embed_batcher,
+    resilience=resilience,
+)
 
 
 # --- 🚀 MAIN APP ---
@@ -216,13 +254,76 @@ def main():
                 st.error("⚠️ User ID saknas. Logga in först.")
                 return
 
-            relevant_entries = retrieve_relevant_entries(st.session_state.user_id, user_question, top_k=5)
+            # Embed + (concurrent) search on the async pipeline, see async_pipeline.py.
+            # A time phrase in the question narrows the search to that period (time_filters.py).
+            time_range = parse_time_range(user_question)
+            try:
+                points, query_embedding, timer = resources.loop.run(
+                    pipeline.retrieve(st.session_state.user_id, user_question, top_k=5, time_range=time_range)
+                )
+            except ResilienceError as exc:
+                # Retries, deadline or circuit breaker gave up (resilience.py): a message, not a stack trace.
+                wait = f" om {exc.retry_after:.0f} s" if exc.retry_after else " om en stund"
+                st.error(f"🚨 Sökningen svarar inte just nu. Försök igen{wait}.")
+                return
+            with timer.span("pack_context"):
+                # Dedup + trim + pack under CONTEXT_TOKEN_BUDGET, see context_packer.py.
+                packed = pack_context(user_question, [entry_parts(point) for point in points],
+                                      budget=CONTEXT_TOKEN_BUDGET)
+                relevant_entries = packed.texts
+            entries = entry_versions(points)
+            cached = answer_cache.lookup(st.session_state.user_id, query_embedding, entries)
 
             with st.expander("🔍 Felsökning", expanded=True):
                 st.write("📚 **Top K hämtade inlägg:**")
                 st.write(relevant_entries)
-
-            stream_gpt_response(user_question, relevant_entries, chat_container)
+                fallback = timer.counters.get("time_filter_fallbacks") and " (inga träffar, sökte i hela dagboken)"
+                st.write("🗓️ **Tidsfilter:**", (describe_range(time_range) or "inget") + (fallback or ""))
+                st.write("🎛️ **Omrankning (MMR):**", RERANK.describe() if RERANK.enabled else "av")
+                st.write("📦 **Kontext-tokens:**", packed.summary())
+                st.write("🧊 **Embedding-cache:**", embedding_cache.summary())
+                st.write("🩺 **Resurser:**", resources.health())
+                if resources.replicas is not None:
+                    st.write("🪞 **Lokal replika:**", resources.replicas.get(st.session_state.user_id).summary())
+                st.write("💬 **Svars-cache:**", {"träff": cached is not None, **answer_cache.summary()})
+                st.write("🚦 **Belastning:**", admission.summary())
+                timings_placeholder = st.empty()  # filled in once the answer has streamed
+
+            if cached is not None:
+                replay_response(cached.answer, chat_container, timer)
+            else:
+                with timer.span("prompt_build"):
+                    messages = build_messages(user_question, relevant_entries)
+                queue_notice = chat_container.empty()
+
+                def show_queue(position, waited_s):
+                    queue_notice.info(f"⏳ Många frågor just nu - du är nummer {position} i kön ({waited_s:.0f} s)")
+
+                def answer_question():
+                    timer.mark("admitted")
+                    queue_notice.empty()
+                    tokens = resources.loop.iterate(pipeline.stream_answer(messages, timer))
+                    return render_stream(tokens, chat_container, timer)
+
+                try:
+                    answer = admission.call(st.session_state.user_id, CHAT_MODEL, answer_question,
+                                            tier="advanced", on_wait=show_queue)
+                except AdmissionRejected as exc:
+                    wait = f" om {exc.retry_after:.0f} s" if exc.retry_after else " senare"
+                    queue_notice.error(f"🚨 För många förfrågningar! Försök igen{wait}.")
+                    return
+                except ResilienceError as exc:
+                    wait = f" om {exc.retry_after:.0f} s" if exc.retry_after else " om en stund"
+                    queue_notice.error(f"🚨 Saga kan inte svara just nu. Försök igen{wait}.")
+                    return
+                answer_cache.store(st.session_state.user_id, user_question, query_embedding, entries, answer)
+
+            search_metrics.record(timer, answer_cache_hit=cached is not None)
+            with timings_placeholder.container():
+                st.write("⏱️ **Steg (ms):**", timer.stage_totals())
+                st.write("🔢 **Tokens & renderingar:**", {**timer.marks, **timer.counters})
+                st.write("📈 **Alla sökningar (p50/p95/p99):**", search_metrics.summary())
+                st.write("🧵 **Tidslinje:**", timer.summary())
         else:
             st.warning("⚠️ Skriv en fråga först.")
 
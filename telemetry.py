@@ -0,0 +1,213 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+# ⏱️ Stage timings
+# Every stage gets a start/end offset (ms) relative to the start of the request,
+# so overlapping stages are visible: "critical_path_ms" is the wall time,
+# "serial_ms" is what the same stages would cost one after another.
+
+
+class StageTimer:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.stages = []  # dicts: stage, start_ms, end_ms, ms
+        self.marks = {}  # point-in-time events, e.g. first_token
+        self.counters = {}  # totals, e.g. prompt_tokens, render_flushes
+
+    def _offset(self, now=None):
+        return round(((now if now is not None else self.clock()) - self.started) * 1000, 2)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        start = self._offset()
+        try:
+            yield
+        finally:
+            end = self._offset()
+            self.stages.append({"stage": name, "start_ms": start, "end_ms": end, "ms": round(end - start, 2), **attrs})
+
+    def mark(self, name):
+        """ Records the first time `name` happens. """
+        self.marks.setdefault(name, self._offset())
+
+    def count(self, name, value=1):
+        """ Adds `value` to counter `name`. """
+        self.counters[name] = round(self.counters.get(name, 0) + value, 2)
+
+    def stage_totals(self) -> dict:
+        """ Wall time per stage name: repeated/parallel spans (e.g. one query per probe) count once. """
+        spans = {}
+        for stage in self.stages:
+            start, end = spans.get(stage["stage"], (stage["start_ms"], stage["end_ms"]))
+            spans[stage["stage"]] = (min(start, stage["start_ms"]), max(end, stage["end_ms"]))
+        return {name: round(end - start, 2) for name, (start, end) in spans.items()}
+
+    def summary(self) -> dict:
+        return {
+            "stages": sorted(self.stages, key=lambda stage: stage["start_ms"]),
+            "marks": dict(self.marks),
+            "counters": dict(self.counters),
+            "critical_path_ms": max([stage["end_ms"] for stage in self.stages] + list(self.marks.values()) + [0]),
+            "serial_ms": round(sum(stage["ms"] for stage in self.stages), 2),
+        }
+
+
+# 📈 Search metrics across sessions
+# Every finished search is appended as one JSON line to a size-rotated file
+# (.cache/metrics/search.jsonl, 3 backups) and folded into in-process rolling
+# windows. With METRICS_PORT set, they are served in Prometheus text format on
+# http://0.0.0.0:<port>/metrics: quantiles from the windows, `_sum` / `_count`
+# from cumulative totals (so they only ever grow, as Prometheus expects).
+
+DEFAULT_METRICS_PATH = os.getenv(
+    "METRICS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "metrics", "search.jsonl"),
+)
+DEFAULT_METRICS_BYTES = 10 * 1024 * 1024
+DEFAULT_WINDOW = 1000  # last N searches per stage for the quantiles
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))]
+
+
+class SearchMetrics:
+    def __init__(self, path=DEFAULT_METRICS_PATH, max_bytes=DEFAULT_METRICS_BYTES, backups=3, window=DEFAULT_WINDOW):
+        self.path = path
+        self.window = window
+        self.searches = 0
+        self._latencies = {}  # "stage:<name>" / "mark:<name>" -> deque of ms
+        self._cumulative = {}  # same keys -> [sum of ms, count] since start
+        self._totals = {}  # counter name -> running total
+        self._lock = threading.Lock()
+        self._server = None
+        self._log = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._log = logging.getLogger(f"{__name__}.search.{id(self)}")
+            self._log.propagate = False
+            self._log.setLevel(logging.INFO)
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._log.addHandler(handler)
+
+    def record(self, timer: StageTimer, **labels) -> dict:
+        """ Folds one finished search into the windows and appends it to the metrics file. """
+        record = {
+            "ts": round(time.time(), 3),
+            **labels,
+            "stages": timer.stage_totals(),
+            "marks": dict(timer.marks),
+            "counters": dict(timer.counters),
+        }
+        with self._lock:
+            self.searches += 1
+            for kind in ("stages", "marks"):
+                for name, ms in record[kind].items():
+                    key = f"{kind[:-1]}:{name}"
+                    self._latencies.setdefault(key, deque(maxlen=self.window)).append(ms)
+                    cumulative = self._cumulative.setdefault(key, [0.0, 0])
+                    cumulative[0] += ms
+                    cumulative[1] += 1
+            for name, value in record["counters"].items():
+                self._totals[name] = self._totals.get(name, 0) + value
+        if self._log is not None:
+            self._log.info(json.dumps(record, ensure_ascii=False))
+        return record
+
+    def summary(self) -> dict:
+        """ p50/p95/p99 per stage and mark over the window, plus counter totals. """
+        with self._lock:
+            latencies = {key: list(values) for key, values in self._latencies.items()}
+            totals = dict(self._totals)
+        return {
+            "searches": self.searches,
+            "latency_ms": {
+                key: {f"p{int(q * 100)}": _quantile(values, q) for q in QUANTILES}
+                for key, values in sorted(latencies.items())
+            },
+            "totals": totals,
+        }
+
+    def prometheus(self) -> str:
+        """ Prometheus text exposition: window quantiles, cumulative sums and counts. """
+        with self._lock:
+            latencies = {key: list(values) for key, values in self._latencies.items()}
+            cumulative = {key: tuple(values) for key, values in self._cumulative.items()}
+            totals = dict(self._totals)
+            searches = self.searches
+        lines = [
+            "# TYPE logai_searches_total counter",
+            f"logai_searches_total {searches}",
+        ]
+        for metric, kind in (("logai_stage_ms", "stage"), ("logai_mark_ms", "mark")):
+            lines.append(f"# TYPE {metric} summary")
+            for key, values in sorted(latencies.items()):
+                prefix, name = key.split(":", 1)
+                if prefix != kind:
+                    continue
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{{kind}="{name}",quantile="{q}"}} {_quantile(values, q)}')
+                total_ms, count = cumulative[key]
+                lines.append(f'{metric}_sum{{{kind}="{name}"}} {round(total_ms, 2)}')
+                lines.append(f'{metric}_count{{{kind}="{name}"}} {count}')
+        lines.append("# TYPE logai_counter_total counter")
+        for name, value in sorted(totals.items()):
+            lines.append(f'logai_counter_total{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """ Starts the /metrics endpoint on a daemon thread (once). """
+        if self._server is not None:
+            return self._server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics-endpoint").start()
+        return self._server
+
+
+_default_metrics = None
+_default_lock = threading.Lock()
+
+
+def get_search_metrics() -> SearchMetrics:
+    """ Process-wide metrics, shared by every session; starts /metrics if METRICS_PORT is set. """
+    global _default_metrics
+    with _default_lock:
+        if _default_metrics is None:
+            _default_metrics = SearchMetrics()
+            port = os.getenv("METRICS_PORT")
+            if port:
+                try:
+                    _default_metrics.serve(int(port))
+                except OSError:
+                    pass  # another process (or a Streamlit reload) already owns the port
+        return _default_metrics
@@ -0,0 +1,55 @@
+import hashlib
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from answer_cache import AnswerCache, entry_versions
+from chunking import merge_passage_hits
+from dedup import store_entry
+
+COLLECTION = "journal_test"
+DIM = 8
+
+
+def embed(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+    return np.random.default_rng(seed).normal(size=DIM).tolist()
+
+
+def embed_passages(passages):
+    return [embed(passage) for passage in passages]
+
+
+def retrieve(qdrant_client, user_id, query_vector):
+    points = qdrant_client.query_points(
+        collection_name=COLLECTION,
+        query=query_vector,
+        query_filter=qdrant_models.Filter(must=[
+            qdrant_models.FieldCondition(key="user_id", match=qdrant_models.MatchValue(value=user_id)),
+        ]),
+        limit=10,
+    ).points
+    return merge_passage_hits(points, 5)
+
+
+def test_editing_an_entry_misses_the_cache():
+    qdrant_client = QdrantClient(":memory:")
+    qdrant_client.create_collection(
+        COLLECTION, vectors_config=qdrant_models.VectorParams(size=DIM, distance=qdrant_models.Distance.COSINE)
+    )
+    entry_id, _ = store_entry(qdrant_client, COLLECTION, "anna", "Idag sprang jag fem kilometer.", embed_passages,
+                              payload={"user_id": "anna"})
+    cache = AnswerCache()
+    query_vector = embed("hur långt sprang jag?")
+    before = entry_versions(retrieve(qdrant_client, "anna", query_vector))
+    cache.store("anna", "hur långt sprang jag?", query_vector, before, "Fem kilometer.")
+    assert cache.lookup("anna", query_vector, before) is not None
+
+    # edited in place (same entry ID), e.g. from the other app, without invalidate_user
+    _, outcome = store_entry(qdrant_client, COLLECTION, "anna", "Idag sprang jag tio kilometer.", embed_passages,
+                             payload={"user_id": "anna"}, entry_id=entry_id)
+    assert outcome == "updated"
+    after_points = retrieve(qdrant_client, "anna", query_vector)
+    assert [str(point.id) for point in after_points] == [entry_id]
+    assert cache.lookup("anna", query_vector, entry_versions(after_points)) is None
@@ -0,0 +1,67 @@
+import hashlib
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from dedup import content_hash, find_entries, store_entry
+
+COLLECTION = "journal_test"
+DIM = 8
+
+
+def embed_passages(passages):
+    vectors = []
+    for passage in passages:
+        seed = int.from_bytes(hashlib.sha256(passage.encode("utf-8")).digest()[:4], "little")
+        vectors.append(np.random.default_rng(seed).normal(size=DIM).tolist())
+    return vectors
+
+
+def new_client():
+    qdrant_client = QdrantClient(":memory:")
+    qdrant_client.create_collection(
+        COLLECTION, vectors_config=qdrant_models.VectorParams(size=DIM, distance=qdrant_models.Distance.COSINE)
+    )
+    return qdrant_client
+
+
+def all_points(qdrant_client):
+    points, _ = qdrant_client.scroll(COLLECTION, limit=100, with_payload=True)
+    return points
+
+
+def test_editing_a_legacy_point_replaces_it():
+    qdrant_client = new_client()
+    legacy_id = str(uuid.uuid4())
+    old_text = "Idag sprang jag fem kilometer."
+    # stored before chunking: the point is the entry, no entry_id / passage payload
+    qdrant_client.upsert(COLLECTION, [qdrant_models.PointStruct(
+        id=legacy_id, vector=embed_passages([old_text])[0],
+        payload={"user_id": "anna", "text": old_text, "content_hash": content_hash(old_text)},
+    )])
+    # saving the same text again finds the legacy entry, and that ID is what the app then edits
+    entry_id, outcome = store_entry(qdrant_client, COLLECTION, "anna", old_text, embed_passages,
+                                    payload={"user_id": "anna"})
+    assert (entry_id, outcome) == (legacy_id, "duplicate")
+
+    entry_id, outcome = store_entry(qdrant_client, COLLECTION, "anna", "Idag sprang jag tio kilometer.",
+                                    embed_passages, payload={"user_id": "anna"}, entry_id=legacy_id)
+    assert (entry_id, outcome) == (legacy_id, "updated")
+    points = all_points(qdrant_client)
+    assert [point.payload["text"] for point in points] == ["Idag sprang jag tio kilometer."]
+    assert str(points[0].id) != legacy_id
+    assert not find_entries(qdrant_client, COLLECTION, "anna", {content_hash(old_text)})
+
+
+def test_editing_a_legacy_point_with_an_integer_id():
+    qdrant_client = new_client()
+    old_text = "Regn hela dagen."
+    qdrant_client.upsert(COLLECTION, [qdrant_models.PointStruct(
+        id=42, vector=embed_passages([old_text])[0], payload={"user_id": "anna", "text": old_text},
+    )])
+    entry_id, outcome = store_entry(qdrant_client, COLLECTION, "anna", "Sol hela dagen.", embed_passages,
+                                    payload={"user_id": "anna"}, entry_id="42")
+    assert (entry_id, outcome) == ("42", "updated")
+    assert [point.payload["text"] for point in all_points(qdrant_client)] == ["Sol hela dagen."]
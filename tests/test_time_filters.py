@@ -0,0 +1,36 @@
+import datetime
+
+import pytest
+
+from time_filters import parse_time_range
+
+NOW = datetime.datetime(2026, 10, 17, 12, 0)
+
+
+def month(year, number):
+    end = datetime.datetime(year + number // 12, number % 12 + 1, 1)
+    return datetime.datetime(year, number, 1), end
+
+
+@pytest.mark.parametrize("text", [
+    "I feb 2023 was cold",
+    "I feb",
+    "I mar the table every time",
+    "I mars",
+    "I may be sad",
+    "I march to work",
+])
+def test_english_i_is_not_a_month(text):
+    assert parse_time_range(text, now=NOW) is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Hur mådde jag i feb?", month(2026, 2)),
+    ("Vad hände i mars 2024?", month(2024, 3)),
+    ("Under mars tränade jag mycket", month(2026, 3)),
+    ("Vad gjorde jag i november?", month(2025, 11)),
+    ("What did I do in May?", month(2026, 5)),
+    ("During March I ran a lot", month(2026, 3)),
+])
+def test_month_phrases(text, expected):
+    assert parse_time_range(text, now=NOW) == expected
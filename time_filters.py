@@ -0,0 +1,257 @@
+import calendar
+import datetime
+import re
+
+# 🗓️ Relative dates in questions -> time range
+# "Hur mådde jag förra månaden?" used to search the whole journal and leave
+# the dates to the model. This turns the time phrase into a [start, end) range
+# that becomes a Qdrant range filter on the numeric `ts` payload field, so only
+# entries from that period are searched (and end up in the prompt).
+# Swedish and English, no network, no dependencies. Unknown phrasing -> None,
+# i.e. search everything like before.
+
+_NUMBERS = {
+    "en": 1, "ett": 1, "one": 1, "a": 1, "två": 2, "two": 2, "tre": 3, "three": 3, "fyra": 4, "four": 4,
+    "fem": 5, "five": 5, "sex": 6, "six": 6, "sju": 7, "seven": 7, "åtta": 8, "eight": 8,
+    "nio": 9, "nine": 9, "tio": 10, "ten": 10, "tolv": 12, "twelve": 12,
+}
+_SV_MONTHS = {
+    "januari": 1, "jan": 1, "februari": 2, "feb": 2, "mars": 3, "april": 4, "apr": 4, "maj": 5, "juni": 6,
+    "juli": 7, "augusti": 8, "aug": 8, "september": 9, "sept": 9, "sep": 9, "oktober": 10, "okt": 10,
+    "november": 11, "nov": 11, "december": 12, "dec": 12,
+}
+_EN_MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "april": 4, "apr": 4, "may": 5, "june": 6,
+    "july": 7, "august": 8, "aug": 8, "september": 9, "sept": 9, "sep": 9, "october": 10, "oct": 10,
+    "november": 11, "nov": 11, "december": 12, "dec": 12,
+}
+_MONTHS = {**_SV_MONTHS, **_EN_MONTHS}
+_EVERYDAY_WORDS = ("may", "march")  # also plain words ("I may be sad"): only count as "May" / "March"
+_WEEKDAYS = {
+    "måndags": 0, "monday": 0, "tisdags": 1, "tuesday": 1, "onsdags": 2, "wednesday": 2,
+    "torsdags": 3, "thursday": 3, "fredags": 4, "friday": 4, "lördags": 5, "saturday": 5,
+    "söndags": 6, "sunday": 6,
+}
+_UNITS = {
+    "dag": "day", "dagar": "day", "dagarna": "day", "day": "day", "days": "day",
+    "vecka": "week", "veckor": "week", "veckorna": "week", "week": "week", "weeks": "week",
+    "månad": "month", "månader": "month", "månaderna": "month", "month": "month", "months": "month",
+    "år": "year", "åren": "year", "year": "year", "years": "year",
+}
+
+_NUMBER = r"(\d+|" + "|".join(sorted(_NUMBERS, key=len, reverse=True)) + ")"
+_UNIT = "(" + "|".join(sorted(_UNITS, key=len, reverse=True)) + ")"
+_SV_MONTH = "(" + "|".join(sorted(_SV_MONTHS, key=len, reverse=True)) + ")"
+_EN_MONTH = "(" + "|".join(
+    f"(?-i:{name.title()})" if name in _EVERYDAY_WORDS else name for name in sorted(_EN_MONTHS, key=len, reverse=True)
+) + ")"
+_WEEKDAY = "(" + "|".join(sorted(_WEEKDAYS, key=len, reverse=True)) + ")"
+
+# (pattern, handler(match, today) -> (start_date, end_date_exclusive)); first match wins.
+_RULES = []
+
+
+def _rule(pattern):
+    def register(handler):
+        _RULES.append((re.compile(pattern, re.IGNORECASE), handler))
+        return handler
+    return register
+
+
+def _day(today, days_back):
+    start = today - datetime.timedelta(days=days_back)
+    return start, start + datetime.timedelta(days=1)
+
+
+def _week_start(day):
+    return day - datetime.timedelta(days=day.weekday())  # Monday, as in Sweden
+
+
+def _month_start(year, month):
+    return datetime.date(year, month, 1)
+
+
+def _add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _years_back(day, years):
+    """ Same day `years` earlier; Feb 29 becomes Feb 28 in a non-leap year. """
+    year = day.year - years
+    return day.replace(year=year, day=min(day.day, calendar.monthrange(year, day.month)[1]))
+
+
+def _number(word):
+    return int(word) if word.isdigit() else _NUMBERS[word.lower()]
+
+
+@_rule(r"\b(i\s+förrgår|day before yesterday)\b")
+def _day_before_yesterday(match, today):
+    return _day(today, 2)
+
+
+@_rule(r"\b(igår|i\s+går|yesterday)\b")
+def _yesterday(match, today):
+    return _day(today, 1)
+
+
+@_rule(r"\b(idag|i\s+dag|today|tonight|ikväll|i\s+kväll|i\s+morse|this morning)\b")
+def _today(match, today):
+    return _day(today, 0)
+
+
+@_rule(r"\b(?:senaste|de\s+senaste|sista|last|past|the\s+last|the\s+past)\s+" + _NUMBER + r"\s+" + _UNIT + r"\b")
+def _last_n(match, today):
+    count, unit = _number(match.group(1)), _UNITS[match.group(2).lower()]
+    end = today + datetime.timedelta(days=1)
+    if unit == "day":
+        return end - datetime.timedelta(days=count), end
+    if unit == "week":
+        return end - datetime.timedelta(weeks=count), end
+    if unit == "month":
+        start = _add_months(today, -count)
+        return start.replace(day=min(today.day, calendar.monthrange(start.year, start.month)[1])), end
+    return _years_back(today, count), end
+
+
+@_rule(r"\b(?:för\s+)?" + _NUMBER + r"\s+" + _UNIT + r"\s+(?:sedan|sen|ago)\b")
+def _n_ago(match, today):
+    count, unit = _number(match.group(1)), _UNITS[match.group(2).lower()]
+    if unit == "day":
+        return _day(today, count)
+    if unit == "week":
+        start = _week_start(today) - datetime.timedelta(weeks=count)
+        return start, start + datetime.timedelta(weeks=1)
+    if unit == "month":
+        start = _add_months(today, -count)
+        return start, _add_months(start, 1)
+    return datetime.date(today.year - count, 1, 1), datetime.date(today.year - count + 1, 1, 1)
+
+
+@_rule(r"\b(förra\s+veckan|förra\s+vecka|last\s+week)\b")
+def _last_week(match, today):
+    start = _week_start(today) - datetime.timedelta(weeks=1)
+    return start, start + datetime.timedelta(weeks=1)
+
+
+@_rule(r"\b(den\s+här\s+veckan|denna\s+vecka|i\s+veckan|this\s+week)\b")
+def _this_week(match, today):
+    return _week_start(today), today + datetime.timedelta(days=1)
+
+
+@_rule(r"\b(förra\s+helgen|last\s+weekend|i\s+helgen|this\s+weekend)\b")
+def _weekend(match, today):
+    # the most recent Saturday-Sunday (today's, if it's the weekend)
+    saturday = _week_start(today) + datetime.timedelta(days=5)
+    if saturday > today or match.group(1).lower().startswith(("förra", "last")) and today.weekday() >= 5:
+        saturday -= datetime.timedelta(weeks=1)
+    return saturday, saturday + datetime.timedelta(days=2)
+
+
+@_rule(r"\b(förra\s+månaden|förra\s+månad|last\s+month)\b")
+def _last_month(match, today):
+    start = _add_months(today, -1)
+    return start, _add_months(start, 1)
+
+
+@_rule(r"\b(den\s+här\s+månaden|denna\s+månad|i\s+månaden|this\s+month)\b")
+def _this_month(match, today):
+    return _month_start(today.year, today.month), today + datetime.timedelta(days=1)
+
+
+@_rule(r"\b(förra\s+året|i\s+fjol|last\s+year)\b")
+def _last_year(match, today):
+    return datetime.date(today.year - 1, 1, 1), datetime.date(today.year, 1, 1)
+
+
+@_rule(r"\b(i\s+år|det\s+här\s+året|detta\s+år|this\s+year)\b")
+def _this_year(match, today):
+    return datetime.date(today.year, 1, 1), today + datetime.timedelta(days=1)
+
+
+@_rule(r"\b(?:i\s+|last\s+|on\s+)" + _WEEKDAY + r"\b")
+def _weekday(match, today):
+    # "i måndags" / "last monday": the most recent one before today
+    days_back = (today.weekday() - _WEEKDAYS[match.group(1).lower()]) % 7 or 7
+    return _day(today, days_back)
+
+
+# "i maj" / "under mars" in Swedish, "in May" / "during March" in English. Kept apart so
+# "I may be sad" isn't May: "may" and "march" only count capitalised and after "in"/"during".
+# The Swedish "i" only counts in lower case, so the English "I feb..." / "I mar..." aren't months.
+@_rule(r"\b(?:(?-i:i)|under)\s+" + _SV_MONTH + r"(?:\s+(\d{4}))?\b")
+@_rule(r"\b(?:in|during)\s+" + _EN_MONTH + r"(?:\s+(\d{4}))?\b")
+def _month(match, today):
+    month = _MONTHS[match.group(1).lower()]
+    year = int(match.group(2)) if match.group(2) else today.year - (1 if month > today.month else 0)
+    start = _month_start(year, month)
+    return start, _add_months(start, 1)
+
+
+@_rule(r"\b(?:i|in|under|during|år|year)\s+((?:19|20)\d{2})\b")
+def _year(match, today):
+    year = int(match.group(1))
+    return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+
+
+def parse_time_range(text, now=None):
+    """
+    (start, end) datetimes, end exclusive, for the first time phrase in `text`;
+    None if there isn't one. `now` is for tests and defaults to the local clock.
+    """
+    today = (now or datetime.datetime.now()).date()
+    best = None
+    for pattern, handler in _RULES:
+        match = pattern.search(text)
+        # rules are ordered by specificity; among matches the earliest phrase in the text wins
+        if match and (best is None or match.start() < best[0].start()):
+            best = (match, handler)
+    if best is None:
+        return None
+    start, end = best[1](best[0], today)
+    return (datetime.datetime.combine(start, datetime.time.min),
+            datetime.datetime.combine(end, datetime.time.min))
+
+
+def describe_range(time_range):
+    """ "2024-05-01 – 2024-05-31" for the debug panel. """
+    if time_range is None:
+        return None
+    start, end = time_range
+    return f"{start:%Y-%m-%d} – {end - datetime.timedelta(seconds=1):%Y-%m-%d}"
+
+
+# Import/backfill: the free-form `timestamp` strings stored so far -> epoch seconds.
+_DATE_FORMATS = ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S",
+                 "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%d/%m/%Y", "%d.%m.%Y", "%Y/%m/%d")
+_ISO_DATE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+
+def parse_timestamp(value):
+    """ Epoch seconds (int) for a stored timestamp string or datetime; None if unparseable. """
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    try:
+        parsed = datetime.datetime.fromisoformat(text)
+        return int(parsed.timestamp())
+    except ValueError:
+        pass
+    for date_format in _DATE_FORMATS:
+        try:
+            return int(datetime.datetime.strptime(text, date_format).timestamp())
+        except ValueError:
+            continue
+    match = _ISO_DATE.search(text)  # e.g. a markdown heading "2024-05-03 - Regn"
+    if match:
+        try:
+            return int(datetime.datetime(*map(int, match.groups())).timestamp())
+        except ValueError:
+            return None
+    return None
+